@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.2/ref/settings/
 """
 
+import importlib.util
 import os
 from pathlib import Path
 
@@ -38,6 +39,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     "core",
     "rest_framework",
     "rest_framework.authtoken",
@@ -47,7 +49,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Outermost, so that it times the whole request
+    "core.middleware.InstrumentationMiddleware",
+    "core.middleware.MetricsMiddleware",
+    "core.middleware.ProfilingMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    # First to see the responses, after the other middleware wrote them
+    "core.middleware.CompressionMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -76,20 +84,131 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "app.wsgi.application"
 
+# Serve the GET routes of the recipe APIs with async views (recipe.async_views).
+# Set it when serving app.asgi: under WSGI, every async view costs an event loop.
+ASYNC_READ_VIEWS = bool(int(os.environ.get("ASYNC_READ_VIEWS", 0)))
+
 
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.postgresql",
+        # DB_POOL=1 keeps the connections in a per-process pool
+        "ENGINE": "core.backends.postgresql_pool"
+        if int(os.environ.get("DB_POOL", 0))
+        else "django.db.backends.postgresql",
         "HOST": os.environ.get("DB_HOST"),
         "NAME": os.environ.get("DB_NAME"),
         "USER": os.environ.get("DB_USER"),
         "PASSWORD": os.environ.get("DB_PASS"),
+        # Used by core.backends.postgresql_pool
+        "POOL": {
+            "MAX_SIZE": int(os.environ.get("DB_POOL_MAX_SIZE", 10)),
+            "MAX_AGE": int(os.environ.get("DB_POOL_MAX_AGE", 600)),  # seconds
+            # Seconds to wait for a connection when all are in use
+            "TIMEOUT": float(os.environ.get("DB_POOL_TIMEOUT", 5)),
+            # Idle connections are pinged after this many seconds
+            "CHECK_INTERVAL": int(os.environ.get("DB_POOL_CHECK_INTERVAL", 30)),
+        },
     }
 }
 
+# Read replicas, e.g., DB_REPLICA_HOST=replica1,replica2 (same name and user).
+# The safe requests of the recipe APIs read from them, see core.replicas
+REPLICA_DATABASES = []
+for number, host in enumerate(os.environ.get("DB_REPLICA_HOST", "").split(","), 1):
+    if host:
+        DATABASES[f"replica_{number}"] = {
+            **DATABASES["default"],
+            "HOST": host,
+            "PORT": os.environ.get("DB_REPLICA_PORT", ""),
+            "TEST": {"MIRROR": "default"},
+        }
+        REPLICA_DATABASES.append(f"replica_{number}")
+DATABASE_ROUTERS = ["core.replicas.ReplicaRouter"]
+# Reads of a user go to the primary for this long after they write
+REPLICA_PIN_SECONDS = int(os.environ.get("DB_REPLICA_PIN_SECONDS", 5))
+# A replica that failed is skipped for this long
+REPLICA_RETRY_SECONDS = int(os.environ.get("DB_REPLICA_RETRY_SECONDS", 30))
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# Use a cache shared by all the processes (e.g. file based) when running
+# several workers, the list response cache relies on it for invalidation.
+
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get(
+            "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.environ.get("CACHE_LOCATION", ""),
+    }
+}
+
+# Response cache of the recipe/tag/ingredient list endpoints
+LIST_CACHE_ALIAS = "default"
+LIST_CACHE_TIMEOUT = int(os.environ.get("LIST_CACHE_TIMEOUT", 300))  # seconds
+
+# Per-request SQL query count, DB, serialization and render time, logged by
+# core.middleware.InstrumentationMiddleware (and sent to the staff users in a
+# Server-Timing header)
+INSTRUMENTATION = {
+    "ENABLED": bool(int(os.environ.get("INSTRUMENTATION", 0))),
+    "SERVER_TIMING": bool(int(os.environ.get("INSTRUMENTATION_SERVER_TIMING", 1))),
+}
+
+# cProfile of the requests by core.middleware.ProfilingMiddleware: on demand for
+# the staff users (X-Profile header or ?profile=) and a random sample saved to
+# DIRECTORY, keeping the newest MAX_FILES
+PROFILING = {
+    "ON_DEMAND": bool(int(os.environ.get("PROFILING_ON_DEMAND", 0))),
+    "SAMPLE_RATE": float(os.environ.get("PROFILING_SAMPLE_RATE", 0)),  # e.g., 0.001
+    "DIRECTORY": os.environ.get("PROFILING_DIRECTORY", "/tmp/profiles"),
+    "MAX_FILES": int(os.environ.get("PROFILING_MAX_FILES", 100)),
+}
+
+# Prometheus metrics recorded by core.middleware.MetricsMiddleware and served at
+# /metrics, if prometheus_client is installed. With several worker processes,
+# set PROMETHEUS_MULTIPROC_DIR to a directory shared by them, and run gunicorn
+# with gunicorn.conf.py, whose child_exit hook drops the gauges of the exited
+# workers (see core.metrics.mark_process_dead()).
+METRICS = {
+    "ENABLED": bool(int(os.environ.get("METRICS", 1))),
+    # Optional, accepted by /metrics as Authorization: Bearer <token>, which
+    # otherwise requires a logged in staff user
+    "TOKEN": os.environ.get("METRICS_TOKEN"),
+}
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "handlers": {"console": {"class": "logging.StreamHandler"}},
+    "loggers": {
+        "core.instrumentation": {"handlers": ["console"], "level": "INFO"},
+    },
+}
+
+# gzip/brotli compression of the responses by core.middleware.CompressionMiddleware
+COMPRESSION = {
+    "MIN_SIZE": int(os.environ.get("COMPRESSION_MIN_SIZE", 1024)),  # bytes
+    # Levels of the compressed content types: gzip 1-9, brotli 0-11. The lists
+    # are compressed on most requests, the schema is large but rarely fetched.
+    # Not text/html: the browsable API and admin pages hold CSRF tokens next to
+    # reflected input, which compression exposes to BREACH.
+    "LEVELS": {
+        "application/json": {"gzip": 6, "br": 5},
+        "application/msgpack": {"gzip": 4, "br": 4},
+        "application/vnd.oai.openapi": {"gzip": 9, "br": 9},
+        "application/vnd.oai.openapi+json": {"gzip": 9, "br": 9},
+        "text/css": {"gzip": 9, "br": 9},
+        "text/javascript": {"gzip": 9, "br": 9},
+        "application/javascript": {"gzip": 9, "br": 9},
+        "text/csv": {"gzip": 6, "br": 5},
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -132,6 +251,24 @@ MEDIA_URL = "/static/media/"
 
 STATIC_ROOT = "vol/web/static"
 MEDIA_ROOT = "vol/web/media"
+
+# Applied to the uploaded recipe images before they are stored
+RECIPE_IMAGE_NORMALIZATION = {
+    "ENABLED": True,
+    "MAX_DIMENSION": int(os.environ.get("IMAGE_MAX_DIMENSION", 2048)),  # pixels
+    "MAX_PIXELS": 40_000_000,  # larger uploads are rejected before decoding
+    "FORMAT": os.environ.get("IMAGE_FORMAT", "WEBP"),  # WEBP or JPEG
+    "QUALITY": 80,
+}
+
+# Thumbnail/medium copies of the recipe images, rendered in a process pool
+RECIPE_IMAGE_DERIVATIVES = {
+    "ASYNC": True,
+    "WORKERS": int(os.environ.get("IMAGE_WORKERS", 2)),
+    "SIZES": {"thumbnail": (150, 150), "medium": (600, 600)},  # max width, height
+    "QUALITY": 85,  # JPEG quality
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/3.2/ref/settings/#default-auto-field
 
@@ -140,7 +277,32 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # Add customized User model as the default user model
 AUTH_USER_MODEL = "core.User"
 
-REST_FRAMEWORK = {"DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema"}
+# MessagePack is served to the clients that accept it if msgpack is installed
+MSGPACK_ENABLED = importlib.util.find_spec("msgpack") is not None
+
+REST_FRAMEWORK = {
+    "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
+    # The first renderer is used for Accept: */*
+    "DEFAULT_RENDERER_CLASSES": [
+        "core.renderers.FastJSONRenderer",
+        *(["core.renderers.MessagePackRenderer"] if MSGPACK_ENABLED else []),
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "core.parsers.FastJSONParser",
+        *(["core.parsers.MessagePackParser"] if MSGPACK_ENABLED else []),
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
+}
+
+# Cache of token -> user lookups used by core.authentication.CachedTokenAuthentication
+TOKEN_AUTH_CACHE = {
+    "MAX_SIZE": int(os.environ.get("TOKEN_AUTH_CACHE_SIZE", 10000)),
+    "TTL": int(os.environ.get("TOKEN_AUTH_CACHE_TTL", 60)),  # seconds
+    # Optional alias in CACHES shared between processes
+    "CACHE_ALIAS": os.environ.get("TOKEN_AUTH_CACHE_ALIAS"),
+}
 
 SPECTACULAR_SETTINGS = {
     "COMPONENT_SPLIT_REQUEST": True
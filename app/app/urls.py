@@ -20,6 +20,8 @@ from django.urls import path, include
 from django.conf.urls.static import static
 from django.conf import settings
 
+from core import views as core_views
+
 urlpatterns = [
     path("admin/", admin.site.urls),
     path(
@@ -32,6 +34,7 @@ urlpatterns = [
     ),  # for rendering the schema to a swagger documentation
     path("api/users/", include("user.urls")),  # For working with user endpoints
     path("api/recipe/", include("recipe.urls")),
+    path("metrics", core_views.metrics, name="metrics"),  # for Prometheus
 ]
 
 if settings.DEBUG:
@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        # Register the signal handlers
+        from core import signals  # noqa: F401
+        from core.instrumentation import install_execute_wrapper
+
+        connection_created.connect(install_execute_wrapper)
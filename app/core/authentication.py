@@ -0,0 +1,193 @@
+"""
+Authentication classes for the APIs
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+
+class TokenCache:
+    """Bounded in-process LRU of token key -> entry, e.g., freeze_token(token).
+
+    Entries expire after `ttl` seconds. If `cache_alias` is set, misses of the
+    local LRU are looked up in that Django cache before hitting the database,
+    so several worker processes can share the entries. The deleted keys are
+    then also marked as revoked there, and each hit of the local LRU checks
+    the mark: other processes stop using their copy right away.
+    """
+
+    key_prefix = "auth-token:v3:"  # (stored_at, entry of freeze_token())
+    revoked_prefix = "auth-token:revoked:"  # deleted_at
+
+    def __init__(self, max_size=10000, ttl=60, cache_alias=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.cache_alias = cache_alias
+        self._entries = OrderedDict()  # key -> (expires_at, stored_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def shared_cache(self):
+        """Return the Django cache backing this cache, if any."""
+        return caches[self.cache_alias] if self.cache_alias else None
+
+    def get(self, key):
+        """Return the cached entry for key, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)  # most recently used
+
+        if entry is not None:
+            _, stored_at, value = entry
+            if not self._is_revoked(key, stored_at):
+                with self._lock:
+                    self.hits += 1
+                return value
+            with self._lock:
+                self._entries.pop(key, None)
+
+        shared = None
+        if self.shared_cache is not None:
+            shared = self.shared_cache.get(self.key_prefix + key)
+        if shared is None:
+            with self._lock:
+                self.misses += 1
+            return None
+        stored_at, value = shared
+        self._set_local(key, value, stored_at, count_hit=True)
+        return value
+
+    def set(self, key, value):
+        """Cache the entry for key."""
+        stored_at = time.time()
+        self._set_local(key, value, stored_at)
+        if self.shared_cache is not None:
+            self.shared_cache.set(self.key_prefix + key, (stored_at, value), self.ttl)
+
+    def _set_local(self, key, value, stored_at, count_hit=False):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, stored_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)  # evict least recently used
+            if count_hit:
+                self.hits += 1
+
+    def _is_revoked(self, key, stored_at):
+        """Whether key was deleted (in any process) after its entry was stored."""
+        if self.shared_cache is None:
+            return False
+        revoked_at = self.shared_cache.get(self.revoked_prefix + key)
+        return revoked_at is not None and revoked_at >= stored_at
+
+    def delete(self, key):
+        """Remove key from the cache, and from the caches of the other
+        processes if it is shared."""
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.shared_cache is not None:
+            # The local entries stored before expire within the TTL
+            self.shared_cache.set(self.revoked_prefix + key, time.time(), self.ttl)
+            self.shared_cache.delete(self.key_prefix + key)
+
+    def clear(self):
+        """Remove every local entry."""
+        with self._lock:
+            self._entries.clear()
+
+
+_token_cache = None
+
+
+def get_token_cache():
+    """Return the process wide token cache, configured by TOKEN_AUTH_CACHE."""
+    global _token_cache
+    if _token_cache is None:
+        config = getattr(settings, "TOKEN_AUTH_CACHE", {})
+        _token_cache = TokenCache(
+            max_size=config.get("MAX_SIZE", 10000),
+            ttl=config.get("TTL", 60),
+            cache_alias=config.get("CACHE_ALIAS"),
+        )
+    return _token_cache
+
+
+# The user fields needed by the authentication and the permissions, e.g., not
+# the password hash. The others are loaded from the database if used.
+CACHED_USER_FIELDS = {"email", "is_active", "is_staff", "is_superuser"}
+
+
+def _cached_field_names(model, names=None):
+    """Return the names of the cached concrete fields of model, in their order
+    (as Model.from_db() expects them)."""
+    return [
+        field.attname
+        for field in model._meta.concrete_fields
+        if names is None or field.primary_key or field.attname in names
+    ]
+
+
+def freeze_token(token):
+    """Return the cache entry of a token and its user: their database alias
+    and the values of their cached fields, so that no model instance is shared
+    between requests (e.g., ManageUserView updates request.user in place)."""
+    user = token.user
+    user_names = _cached_field_names(type(user), CACHED_USER_FIELDS)
+    return (
+        token._state.db,
+        tuple(getattr(token, name) for name in _cached_field_names(Token)),
+        tuple(getattr(user, name) for name in user_names),
+    )
+
+
+def thaw_token(entry):
+    """Return new Token and user instances from a freeze_token() entry. The
+    other fields of the user are deferred."""
+    db, token_values, user_values = entry
+    user_model = get_user_model()
+    user = user_model.from_db(
+        db, _cached_field_names(user_model, CACHED_USER_FIELDS), user_values
+    )
+    token = Token.from_db(db, _cached_field_names(Token), token_values)
+    token.user = user
+    return token
+
+
+def get_cached_token(key):
+    """Return a new instance of the token of key if it is cached, or None."""
+    entry = get_token_cache().get(key)
+    return thaw_token(entry) if entry is not None else None
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Drop-in TokenAuthentication that caches token -> user lookups.
+
+    The cache entries are removed when a token is deleted or its user is
+    saved (e.g. deactivated), see core.signals. Other processes drop their
+    local copy on their next hit if the cache is shared (TOKEN_AUTH_CACHE
+    CACHE_ALIAS), else keep it until the TTL expires. The tokens of users
+    changed without signals, e.g., by User.objects.update(is_active=False),
+    are kept until the TTL expires too: clear the caches
+    (get_token_cache().clear() and the shared cache) after such updates.
+    """
+
+    def authenticate_credentials(self, key):
+        token = get_cached_token(key)
+        if token is None:
+            # Unknown keys and inactive users raise AuthenticationFailed
+            user, token = super().authenticate_credentials(key)
+            get_token_cache().set(key, freeze_token(token))
+        return (token.user, token)
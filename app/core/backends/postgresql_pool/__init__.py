@@ -0,0 +1,4 @@
+"""
+PostgreSQL backend keeping the connections in a per-process pool, e.g.,
+DATABASES = {"default": {"ENGINE": "core.backends.postgresql_pool", ...}}
+"""
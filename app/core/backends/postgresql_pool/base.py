@@ -0,0 +1,87 @@
+"""
+PostgreSQL database backend returning the connections to a pool instead of
+closing them
+
+Configured by the POOL entry of the database settings, e.g.,
+"POOL": {"MAX_SIZE": 10, "MAX_AGE": 600, "TIMEOUT": 5, "CHECK_INTERVAL": 30}
+"""
+
+import os
+import threading
+
+from django.db.backends.postgresql import base
+
+from core.backends.postgresql_pool.pool import ConnectionPool
+
+_pools = {}  # (alias, connection parameters) -> pool
+_pools_lock = threading.Lock()
+_pools_pid = os.getpid()
+# Connections inherited from the parent process are never used nor closed,
+# closing them would end the sessions of the parent.
+_inherited_pools = []
+
+
+def get_pool(alias, conn_params, config):
+    """Return the pool of the process for the alias and connection parameters."""
+    global _pools_pid
+    key = (alias, repr(sorted(conn_params.items())))
+    with _pools_lock:
+        if _pools_pid != os.getpid():  # e.g., a forked worker
+            _inherited_pools.extend(_pools.values())
+            _pools.clear()
+            _pools_pid = os.getpid()
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(
+                max_size=config.get("MAX_SIZE", 10),
+                max_age=config.get("MAX_AGE", 600),
+                timeout=config.get("TIMEOUT", 5),
+                check_interval=config.get("CHECK_INTERVAL", 30),
+            )
+        return pool
+
+
+def get_pool_stats():
+    """Return the counters of the pools of the process, summed per alias.
+    e.g., {"default": {"checkouts": 10, "waits": 0, ..., "idle": 2, "in_use": 1}}
+    """
+    stats = {}
+    with _pools_lock:
+        pools = list(_pools.items())
+    for (alias, _), pool in pools:
+        alias_stats = stats.setdefault(alias, {})
+        for name, value in pool.stats().items():
+            alias_stats[name] = alias_stats.get(name, 0) + value
+    return stats
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """PostgreSQL connections checked out of a per-process pool.
+
+    Django closes the connection of a thread at the end of each request
+    (CONN_MAX_AGE = 0), which returns it to the pool, rolled back.
+    """
+
+    _pool = None
+
+    def get_new_connection(self, conn_params):
+        self._pool = get_pool(
+            self.alias, conn_params, self.settings_dict.get("POOL", {})
+        )
+        connection = self._pool.checkout(
+            lambda: super(DatabaseWrapper, self).get_new_connection(conn_params)
+        )
+        self.isolation_level = self.settings_dict["OPTIONS"].get(
+            "isolation_level", connection.isolation_level
+        )
+        return connection
+
+    def _close(self):
+        if self.connection is None:
+            return
+        with self.wrap_database_errors:
+            if self.in_atomic_block:
+                # Django keeps the connection until the block is rolled back
+                self._pool.discard(self.connection)
+            else:
+                self._pool.checkin(self.connection)
@@ -0,0 +1,167 @@
+"""
+Bounded pool of database connections, shared by the threads of a process
+"""
+
+import threading
+import time
+from collections import deque
+
+from psycopg2 import OperationalError
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+
+class PoolTimeout(OperationalError):
+    """No connection was returned to the full pool in time."""
+
+
+class ConnectionPool:
+    """Pool of at most `max_size` psycopg2 connections, opened by the
+    `connect` function given on checkout.
+
+    Idle connections are pinged with `SELECT 1` on checkout if they have not
+    been used for `check_interval` seconds, and closed instead of being reused
+    once they are older than `max_age` seconds. Checkouts of a full pool wait
+    up to `timeout` seconds for a connection to be returned.
+    """
+
+    def __init__(self, max_size=10, max_age=600, timeout=5, check_interval=30):
+        self.max_size = max_size
+        self.max_age = max_age
+        self.timeout = timeout
+        self.check_interval = check_interval
+        self._idle = deque()  # (connection, created_at, returned_at), LIFO
+        self._open = {}  # id(connection) -> created_at, idle or in use
+        self._connecting = 0  # slots reserved for connections being opened
+        self._condition = threading.Condition()
+        self.counters = dict.fromkeys(
+            ["checkouts", "waits", "timeouts", "errors", "created", "recycled"], 0
+        )
+
+    def stats(self):
+        """Return the counters with the number of idle and in use connections."""
+        with self._condition:
+            return {
+                **self.counters,
+                "idle": len(self._idle),
+                "in_use": len(self._open) - len(self._idle),
+            }
+
+    def _is_usable(self, connection, returned_at):
+        """Check a connection, with a round trip only if it was idle for long."""
+        if connection.closed:
+            return False
+        if time.monotonic() - returned_at < self.check_interval:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            return True
+        except Exception:
+            return False
+
+    def _drop(self, connection, counter=None, reopen=False):
+        """Close a connection and free its slot, or keep the slot to reopen it."""
+        with self._condition:
+            if counter:
+                self.counters[counter] += 1
+            del self._open[id(connection)]
+            if reopen:
+                self._connecting += 1
+            else:
+                self._condition.notify()
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def checkout(self, connect):
+        """Return an idle connection, or a new one if the pool isn't full."""
+        deadline = time.monotonic() + self.timeout
+        with self._condition:
+            waited = False
+            while not self._idle and (
+                len(self._open) + self._connecting >= self.max_size
+            ):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.counters["timeouts"] += 1
+                    raise PoolTimeout(
+                        f"No database connection available in {self.timeout}s "
+                        f"(pool of {self.max_size})."
+                    )
+                if not waited:
+                    self.counters["waits"] += 1
+                    waited = True
+                self._condition.wait(remaining)
+            self.counters["checkouts"] += 1
+            if self._idle:
+                connection, created_at, returned_at = self._idle.pop()
+            else:
+                connection = None
+                self._connecting += 1
+
+        if connection is not None:
+            if time.monotonic() - created_at > self.max_age:
+                self._drop(connection, "recycled", reopen=True)
+            elif self._is_usable(connection, returned_at):
+                return connection
+            else:
+                self._drop(connection, "errors", reopen=True)
+        return self._open_connection(connect)
+
+    def _open_connection(self, connect):
+        """Open a new connection in a reserved slot."""
+        try:
+            connection = connect()
+        except Exception:
+            with self._condition:
+                self.counters["errors"] += 1
+                self._connecting -= 1
+                self._condition.notify()
+            raise
+        with self._condition:
+            self.counters["created"] += 1
+            self._connecting -= 1
+            self._open[id(connection)] = time.monotonic()
+        return connection
+
+    def checkin(self, connection):
+        """Return a connection to the pool, rolling back its open transaction.
+        Broken and old connections are closed.
+        """
+        with self._condition:
+            created_at = self._open.get(id(connection))
+        if created_at is None:  # not opened by this pool
+            connection.close()
+            return
+        if connection.closed:
+            self._drop(connection, "errors")
+            return
+        if time.monotonic() - created_at > self.max_age:
+            self._drop(connection, "recycled")
+            return
+        try:
+            if connection.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+                connection.rollback()
+        except Exception:
+            self._drop(connection, "errors")
+            return
+        with self._condition:
+            self._idle.append((connection, created_at, time.monotonic()))
+            self._condition.notify()
+
+    def discard(self, connection):
+        """Close a checked out connection instead of returning it to the pool."""
+        with self._condition:
+            opened = id(connection) in self._open
+        if opened:
+            self._drop(connection)
+        else:
+            connection.close()
+
+    def close(self):
+        """Close the idle connections."""
+        with self._condition:
+            idle, self._idle = list(self._idle), deque()
+        for connection, _, _ in idle:
+            self._drop(connection)
@@ -0,0 +1,119 @@
+"""
+Per-request performance instrumentation: SQL queries, DB, serialization and
+render time (see core.middleware.InstrumentationMiddleware)
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# The stats of the current request, which follow it into the threads of
+# sync_to_async() under ASGI, unlike the (thread-local) DB connections
+_current_stats = ContextVar("request_stats", default=None)
+
+
+def get_config():
+    return getattr(settings, "INSTRUMENTATION", {})
+
+
+class RequestStats:
+    """The costs of a request, e.g., request.stats.queries.
+    Also the execute wrapper of the database connections, see
+    connection.execute_wrapper().
+    """
+
+    def __init__(self):
+        self.view = None  # e.g., "RecipeViewSet.list"
+        self.queries = 0
+        self.db_time = 0.0  # seconds
+        self.serialize_time = 0.0
+        self.render_time = 0.0
+        self.total_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+
+    @contextmanager
+    def measure(self, name):
+        """Add the time spent in the block, e.g., with stats.measure("render")"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            attr = f"{name}_time"
+            setattr(self, attr, getattr(self, attr) + time.perf_counter() - start)
+
+    def timed(self, name, func):
+        """Wrap func so that its time is added, e.g., to serialize_time."""
+
+        def wrapper(*args, **kwargs):
+            with self.measure(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+
+@contextmanager
+def collect_queries(stats):
+    """Count the SQL queries run in the block in stats, in any thread."""
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
+
+
+def execute_wrapper(execute, sql, params, many, context):
+    """The execute wrapper of every database connection (see
+    install_execute_wrapper()), passing the queries of a request to its stats."""
+    stats = _current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats(execute, sql, params, many, context)
+
+
+def install_execute_wrapper(sender, connection, **kwargs):
+    """Add execute_wrapper() to a new database connection, connected to the
+    connection_created signal (see core.apps)."""
+    if execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(execute_wrapper)
+
+
+def get_request_stats(request):
+    """Return the stats of a (Django or DRF) request, or None if the
+    instrumentation is disabled."""
+    return getattr(request, "stats", None)
+
+
+def get_view_name(view_func, method):
+    """Name a view by its DRF view class and action.
+    e.g., RecipeViewSet.list, RecipeViewSet.upload_image, CreateTokenView.post
+    """
+    cls = getattr(view_func, "cls", None)
+    if cls is None:  # e.g., the admin
+        return f"{view_func.__module__}.{view_func.__qualname__}"
+    method = method.lower()
+    action = (getattr(view_func, "actions", None) or {}).get(method, method)
+    return f"{cls.__name__}.{action}"
+
+
+class SerializeTimingMixin:
+    """Add the time spent rendering the serializers of a DRF view (e.g.,
+    serializer.data) to the serialization time of the request."""
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        stats = get_request_stats(self.request)
+        if stats is not None:
+            # Only the outer call, e.g., ListSerializer renders its children
+            serializer.to_representation = stats.timed(
+                "serialize", serializer.to_representation
+            )
+        return serializer
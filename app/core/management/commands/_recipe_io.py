@@ -0,0 +1,67 @@
+"""Shared helpers of the export_recipes and import_recipes commands.
+
+A recipe is exchanged as one record, e.g. in NDJSON:
+{"user": "user@example.com", "title": "Pongal", "description": "",
+ "time_minutes": 60, "price": "4.50", "link": "", "tags": ["Indian"],
+ "ingredients": ["Rice", "Lentils"]}
+In CSV the tags and ingredients columns hold JSON lists.
+"""
+
+import csv
+import json
+from itertools import islice
+
+FIELDS = [
+    "user",
+    "title",
+    "description",
+    "time_minutes",
+    "price",
+    "link",
+    "tags",
+    "ingredients",
+]
+LIST_FIELDS = ["tags", "ingredients"]
+
+
+def batched(iterable, size):
+    """Yield lists of at most size items from iterable."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class RecordWriter:
+    """Write records to a text stream as NDJSON or CSV."""
+
+    def __init__(self, stream, fmt):
+        self.stream = stream
+        self.fmt = fmt
+        if fmt == "csv":
+            self.writer = csv.DictWriter(stream, fieldnames=FIELDS)
+            self.writer.writeheader()
+
+    def write(self, record):
+        if self.fmt == "csv":
+            row = dict(record)
+            for field in LIST_FIELDS:
+                row[field] = json.dumps(row[field])
+            self.writer.writerow(row)
+        else:
+            self.stream.write(json.dumps(record) + "\n")
+
+
+def read_records(stream, fmt):
+    """Yield the records read from a text stream of NDJSON or CSV."""
+    if fmt == "csv":
+        for row in csv.DictReader(stream):
+            for field in LIST_FIELDS:
+                row[field] = json.loads(row[field] or "[]")
+            yield row
+    else:
+        for line in stream:
+            if line.strip():
+                yield json.loads(line)
@@ -0,0 +1,152 @@
+"""Django command to compare the WSGI and ASGI throughput of the read APIs.
+"""
+
+import asyncio
+import io
+import sys
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from urllib.parse import urlsplit
+
+from django.contrib.auth import get_user_model
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from rest_framework.authtoken.models import Token
+
+from core.models import Recipe
+
+
+class Command(BaseCommand):
+    """Django command to benchmark the read APIs with slow clients"""
+
+    help = (
+        "Send the same GET requests through the WSGI handler, served by a pool "
+        "of worker threads, and through the ASGI handler. Each client takes "
+        "--client-delay seconds to send its request and as long to read the "
+        "response, e.g., a mobile network. Set ASYNC_READ_VIEWS=1 for the "
+        "async read views, as when serving app.asgi."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", default="/api/recipe/recipes/")
+        parser.add_argument("--requests", type=int, default=500)
+        parser.add_argument("--clients", type=int, default=100, help="Concurrent")
+        parser.add_argument("--threads", type=int, default=8, help="WSGI workers")
+        parser.add_argument("--client-delay", type=float, default=0.05, help="s")
+        parser.add_argument("--recipes", type=int, default=50)
+        parser.add_argument("--host", default="localhost", help="In ALLOWED_HOSTS")
+
+    def handle(self, *args, **options):
+        # A throwaway user, deleted with its recipes and token afterwards
+        user = get_user_model().objects.create_user(
+            f"benchmark-{uuid.uuid4().hex}@example.com"
+        )
+        try:
+            token = Token.objects.create(user=user)
+            Recipe.objects.bulk_create(
+                Recipe(
+                    user=user,
+                    title=f"Recipe {i}",
+                    time_minutes=10,
+                    price=Decimal("5.00"),
+                )
+                for i in range(options["recipes"])
+            )
+            headers = {"host": options["host"], "authorization": f"Token {token.key}"}
+            for name, run in (("WSGI", self.run_wsgi), ("ASGI", self.run_asgi)):
+                start = time.perf_counter()
+                statuses = run(headers, options)
+                elapsed = time.perf_counter() - start
+                self.stdout.write(
+                    f"{name}: {len(statuses) / elapsed:.1f} requests/s "
+                    f"({len(statuses)} in {elapsed:.2f}s), "
+                    f"statuses {dict(Counter(statuses))}"
+                )
+        finally:
+            user.delete()
+
+    def run_wsgi(self, headers, options):
+        """Send the requests to the WSGI handler from a pool of threads.
+        A worker thread is busy while its client sends and reads slowly.
+        Returns the response statuses.
+        """
+        handler = WSGIHandler()
+        url = urlsplit(options["path"])
+        environ = {
+            "REQUEST_METHOD": "GET",
+            "SCRIPT_NAME": "",
+            "PATH_INFO": url.path,
+            "QUERY_STRING": url.query,
+            "SERVER_NAME": options["host"],
+            "SERVER_PORT": "80",
+            "SERVER_PROTOCOL": "HTTP/1.1",
+            "wsgi.url_scheme": "http",
+            "wsgi.errors": sys.stderr,
+            **{f"HTTP_{key.upper()}": value for key, value in headers.items()},
+        }
+        delay = options["client_delay"]
+
+        def request(_):
+            statuses = []
+            time.sleep(delay)  # the request arrives slowly
+            response = handler(
+                {**environ, "wsgi.input": io.BytesIO()},
+                lambda status, headers: statuses.append(int(status.split()[0])),
+            )
+            try:
+                b"".join(response)
+            finally:
+                response.close()
+            time.sleep(delay)  # the response is read slowly
+            return statuses[0]
+
+        with ThreadPoolExecutor(options["threads"]) as pool:
+            return list(pool.map(request, range(options["requests"])))
+
+    def run_asgi(self, headers, options):
+        """Send the requests to the ASGI handler from concurrent clients.
+        The slow clients only hold a coroutine. Returns the response statuses.
+        """
+        handler = ASGIHandler()
+        url = urlsplit(options["path"])
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": url.path,
+            "raw_path": url.path.encode(),
+            "query_string": url.query.encode(),
+            "root_path": "",
+            "headers": [(key.encode(), val.encode()) for key, val in headers.items()],
+            "client": ("127.0.0.1", 0),
+            "server": (options["host"], 80),
+        }
+        delay = options["client_delay"]
+        remaining = iter(range(options["requests"]))  # shared by the clients
+        statuses = []
+
+        async def receive():
+            await asyncio.sleep(delay)  # the request arrives slowly
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                statuses.append(message["status"])
+            elif not message.get("more_body"):
+                await asyncio.sleep(delay)  # the response is read slowly
+
+        async def client():
+            for _ in remaining:
+                await handler(dict(scope), receive, send)
+
+        async def main():
+            await asyncio.gather(*(client() for _ in range(options["clients"])))
+
+        asyncio.run(main())
+        return statuses
@@ -0,0 +1,72 @@
+"""Django command to compare the encode time and size of the API renderers.
+"""
+
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from core import renderers
+from recipe.serializers import RecipeSerializer
+
+
+class Command(BaseCommand):
+    """Django command to benchmark the renderers on generated recipe lists"""
+
+    help = (
+        "Render generated recipe lists, shaped like the recipe list API, with "
+        "DRF's JSONRenderer, FastJSONRenderer and MessagePackRenderer (if "
+        "msgpack is installed) and compare their encode time and payload size."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000])
+        parser.add_argument("--repeat", type=int, default=5, help="Best of")
+
+    def handle(self, *args, **options):
+        candidates = [
+            ("JSONRenderer", JSONRenderer()),
+            ("FastJSONRenderer", renderers.FastJSONRenderer()),
+        ]
+        if renderers.msgpack is not None:
+            candidates.append(("MessagePackRenderer", renderers.MessagePackRenderer()))
+        if renderers.orjson is None:
+            self.stdout.write("orjson is not installed, FastJSONRenderer uses json.")
+
+        for size in options["sizes"]:
+            data = {"next": None, "previous": None, "results": self.recipes(size)}
+            for name, renderer in candidates:
+                best = None
+                for _ in range(options["repeat"]):
+                    start = time.perf_counter()
+                    content = renderer.render(data)
+                    elapsed = time.perf_counter() - start
+                    best = elapsed if best is None else min(best, elapsed)
+                self.stdout.write(
+                    f"{size} recipes, {name}: {best * 1000:.1f}ms, "
+                    f"{len(content) / 1024:.1f}KiB"
+                )
+
+    def recipes(self, count):
+        """Return the data of count recipes as rendered by RecipeSerializer."""
+        field = RecipeSerializer().fields["price"]
+        return [
+            {
+                "id": i,
+                "title": f"Recipe {i}",
+                "time_minutes": i % 120,
+                "price": field.to_representation(Decimal(i % 10000) / 100),
+                "link": f"https://example.com/recipes/{i}",
+                "tags": [{"id": j, "name": f"Tag {j}"} for j in range(i % 4)],
+                "ingredients": [
+                    {"id": j, "name": f"Ingredient {j}"} for j in range(i % 6)
+                ],
+                "image_thumbnail": (
+                    f"http://localhost/static/media/uploads/recipe/{i}.jpg"
+                    if i % 2
+                    else None
+                ),
+            }
+            for i in range(count)
+        ]
@@ -0,0 +1,117 @@
+"""Django command to compare the recipe list serializer and its values() reader.
+"""
+
+import time
+import uuid
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from core.models import Ingredient, Recipe, Tag
+from recipe.counts import add_recipe_counts, count_links
+from recipe.readers import get_values_reader
+from recipe.serializers import RecipeSerializer
+
+
+class Command(BaseCommand):
+    """Django command to benchmark the rendering of the recipe lists"""
+
+    help = (
+        "Render the newest --sizes recipes of a throwaway user with "
+        "RecipeSerializer (prefetched model instances) and with its values() "
+        "reader, and check that both render the same JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+        parser.add_argument("--repeat", type=int, default=3, help="Best of")
+        parser.add_argument("--tags", type=int, default=3, help="Per recipe")
+        parser.add_argument("--ingredients", type=int, default=5, help="Per recipe")
+
+    def handle(self, *args, **options):
+        # A throwaway user, deleted with its recipes, tags and ingredients afterwards
+        user = get_user_model().objects.create_user(
+            f"benchmark-{uuid.uuid4().hex}@example.com"
+        )
+        try:
+            self.create_recipes(user, max(options["sizes"]), options)
+            request = Request(APIRequestFactory().get("/api/recipe/recipes/"))
+            for size in options["sizes"]:
+                queryset = Recipe.objects.filter(user=user).order_by("-id")[:size]
+                serializer_time, expected = self.best_of(
+                    options["repeat"], self.render_serializer, queryset, request
+                )
+                reader_time, content = self.best_of(
+                    options["repeat"], self.render_reader, queryset, request
+                )
+                if content != expected:
+                    raise CommandError(f"The reader renders {size} recipes differently")
+                self.stdout.write(
+                    f"{size} recipes: serializer {serializer_time * 1000:.1f}ms, "
+                    f"reader {reader_time * 1000:.1f}ms "
+                    f"({serializer_time / reader_time:.1f}x faster)"
+                )
+        finally:
+            user.delete()
+
+    def create_recipes(self, user, count, options):
+        """Create the recipes of the user with their tags and ingredients."""
+        Recipe.objects.bulk_create(
+            Recipe(
+                user=user,
+                title=f"Recipe {i}",
+                description="A description " * 20,
+                time_minutes=i % 120,
+                price=Decimal(i % 10000) / 100,
+                link=f"https://example.com/recipes/{i}",
+            )
+            for i in range(count)
+        )
+        # e.g., SQLite doesn't return the primary keys of bulk inserts
+        ids = list(Recipe.objects.filter(user=user).values_list("id", flat=True))
+        for model, attr in ((Tag, "tag"), (Ingredient, "ingredient")):
+            per_recipe = options[f"{attr}s"]
+            model.objects.bulk_create(
+                model(user=user, name=f"{attr.title()} {i}") for i in range(20)
+            )
+            attr_ids = list(
+                model.objects.filter(user=user).values_list("id", flat=True)
+            )
+            through = getattr(Recipe, f"{attr}s").through
+            through.objects.bulk_create(
+                (
+                    through(
+                        recipe_id=pk,
+                        **{f"{attr}_id": attr_ids[(pk + j) % len(attr_ids)]},
+                    )
+                    for pk in ids
+                    for j in range(per_recipe)
+                ),
+                batch_size=5000,
+            )
+            # The bulk inserts don't send m2m_changed signals
+            add_recipe_counts(model, count_links(through, attr, recipe__user=user))
+
+    def best_of(self, repeat, render, queryset, request):
+        """Return the best time of render and its content."""
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            content = render(queryset, request)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best, content
+
+    def render_serializer(self, queryset, request):
+        recipes = queryset.prefetch_related("tags", "ingredients")
+        serializer = RecipeSerializer(recipes, many=True, context={"request": request})
+        return JSONRenderer().render(serializer.data)
+
+    def render_reader(self, queryset, request):
+        reader = get_values_reader(RecipeSerializer())
+        data = reader.read(queryset.values(*reader.columns), request)
+        return JSONRenderer().render(data)
@@ -0,0 +1,217 @@
+"""Django command to import recipes with their tags and ingredients.
+"""
+
+import csv
+import sys
+import tempfile
+from collections import Counter, defaultdict
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from core.management.commands._recipe_io import batched, read_records
+from core.models import Recipe, Tag, Ingredient
+from recipe.cache import bump_data_version
+from recipe.counts import add_recipe_counts
+from recipe.search import update_search_vectors
+
+ATTRS = (("tag", Tag), ("ingredient", Ingredient))
+RECIPE_COLUMNS = ["title", "description", "time_minutes", "price", "link"]
+
+
+class Command(BaseCommand):
+    """Django command to load recipes exported by export_recipes"""
+
+    help = "Import recipes from NDJSON or CSV, as written by export_recipes."
+
+    def add_arguments(self, parser):
+        parser.add_argument("input", help="File to read, - for stdin")
+        parser.add_argument("--user", help="Only import the recipes of this email")
+        parser.add_argument("--format", choices=["ndjson", "csv"], default="ndjson")
+        parser.add_argument("--chunk-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        if options["input"] == "-":
+            imported, skipped = self.load(sys.stdin, options)
+        else:
+            with open(options["input"], newline="") as stream:
+                imported, skipped = self.load(stream, options)
+        self.stdout.write(
+            self.style.SUCCESS(f"Imported {imported} recipes, skipped {skipped}.")
+        )
+
+    def load(self, stream, options):
+        records = read_records(stream, options["format"])
+        if options["user"]:
+            records = (r for r in records if r["user"] == options["user"])
+        if connection.vendor == "postgresql":
+            return self.load_with_copy(records)
+        return self.load_with_orm(records, options["chunk_size"])
+
+    def load_with_copy(self, records):
+        """COPY the records into staging tables and merge them with set-based
+        INSERT ... SELECT statements. Returns (imported, skipped) counts.
+        """
+        user_table = get_user_model()._meta.db_table
+        recipe_table = Recipe._meta.db_table
+
+        # Staging data is spooled to disk above a few MB, memory stays constant
+        recipes_file = tempfile.SpooledTemporaryFile(max_size=8 * 2 ** 20, mode="w+")
+        attrs_file = tempfile.SpooledTemporaryFile(max_size=8 * 2 ** 20, mode="w+")
+        recipes_csv, attrs_csv = csv.writer(recipes_file), csv.writer(attrs_file)
+        total = 0
+        for line_no, record in enumerate(records):
+            recipes_csv.writerow(
+                [line_no, record["user"]] + [record[c] for c in RECIPE_COLUMNS]
+            )
+            for attr, _ in ATTRS:
+                for name in record[f"{attr}s"]:
+                    attrs_csv.writerow([line_no, attr, name])
+            total += 1
+        recipes_file.seek(0)
+        attrs_file.seek(0)
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                "CREATE TEMP TABLE import_recipe (line_no bigint PRIMARY KEY, "
+                "email text, title text, description text, time_minutes integer, "
+                "price numeric(5, 2), link text, user_id bigint, recipe_id bigint) "
+                "ON COMMIT DROP"
+            )
+            cursor.execute(
+                "CREATE TEMP TABLE import_attr (line_no bigint, kind text, name text) "
+                "ON COMMIT DROP"
+            )
+            # csv.writer writes "" unquoted, which COPY reads as NULL unless
+            # the column is FORCE_NOT_NULL (e.g., the default empty link)
+            cursor.copy_expert(
+                "COPY import_recipe (line_no, email, title, description, "
+                "time_minutes, price, link) FROM STDIN WITH (FORMAT csv, "
+                "FORCE_NOT_NULL (email, title, description, link))",
+                recipes_file,
+            )
+            cursor.copy_expert(
+                "COPY import_attr FROM STDIN WITH (FORMAT csv, FORCE_NOT_NULL (name))",
+                attrs_file,
+            )
+
+            # Resolve the users, the recipes of unknown users are dropped.
+            # The recipe ids are allocated upfront to link the tags/ingredients.
+            cursor.execute(
+                f"UPDATE import_recipe r SET user_id = u.id, "
+                f"recipe_id = nextval(pg_get_serial_sequence('{recipe_table}', 'id')) "
+                f"FROM {user_table} u WHERE u.email = r.email"
+            )
+            cursor.execute("DELETE FROM import_recipe WHERE user_id IS NULL")
+            cursor.execute(
+                f"INSERT INTO {recipe_table} "
+                f"(id, user_id, {', '.join(RECIPE_COLUMNS)}, updated_at) "
+                f"SELECT recipe_id, user_id, {', '.join(RECIPE_COLUMNS)}, now() "
+                f"FROM import_recipe"
+            )
+            imported = cursor.rowcount
+
+            for attr, model in ATTRS:
+                table = model._meta.db_table
+                through_table = getattr(Recipe, f"{attr}s").through._meta.db_table
+                # The unique (user, name) constraint skips the existing names
+                cursor.execute(
+                    f"INSERT INTO {table} (user_id, name) "
+                    f"SELECT DISTINCT r.user_id, a.name FROM import_attr a "
+                    f"JOIN import_recipe r USING (line_no) WHERE a.kind = %s "
+                    f"ON CONFLICT (user_id, name) DO NOTHING",
+                    [attr],
+                )
+                cursor.execute(
+                    f"INSERT INTO {through_table} (recipe_id, {attr}_id) "
+                    f"SELECT DISTINCT r.recipe_id, t.id FROM import_attr a "
+                    f"JOIN import_recipe r USING (line_no) "
+                    f"JOIN {table} t ON t.user_id = r.user_id AND t.name = a.name "
+                    f"WHERE a.kind = %s",
+                    [attr],
+                )
+                cursor.execute(
+                    f"UPDATE {table} t SET recipe_count = t.recipe_count + c.total "
+                    f"FROM (SELECT {attr}_id, count(*) AS total FROM {through_table} "
+                    f"WHERE recipe_id IN (SELECT recipe_id FROM import_recipe) "
+                    f"GROUP BY {attr}_id) c WHERE t.id = c.{attr}_id"
+                )
+
+            update_search_vectors(where="r.id IN (SELECT recipe_id FROM import_recipe)")
+            cursor.execute("SELECT DISTINCT user_id FROM import_recipe")
+            user_ids = [row[0] for row in cursor.fetchall()]
+            # ON COMMIT DROP waits for the outermost transaction, e.g., of a
+            # caller importing several files
+            cursor.execute("DROP TABLE import_recipe, import_attr")
+
+        for user_id in user_ids:
+            bump_data_version(user_id)
+        return imported, total - imported
+
+    def load_with_orm(self, records, chunk_size):
+        """Import the records chunk by chunk with bulk inserts, for the
+        databases without COPY (e.g., SQLite). Returns (imported, skipped).
+        """
+        imported = skipped = 0
+        user_ids = set()
+        for batch in batched(records, chunk_size):
+            with transaction.atomic():
+                users = get_user_model().objects.in_bulk(
+                    {record["user"] for record in batch}, field_name="email"
+                )
+                known = [record for record in batch if record["user"] in users]
+                skipped += len(batch) - len(known)
+
+                recipes = [
+                    Recipe(
+                        user=users[record["user"]],
+                        **{column: record[column] for column in RECIPE_COLUMNS},
+                    )
+                    for record in known
+                ]
+                if connection.features.can_return_rows_from_bulk_insert:
+                    Recipe.objects.bulk_create(recipes)
+                else:
+                    for recipe in recipes:
+                        recipe.save()
+
+                for attr, model in ATTRS:
+                    self.link_attrs(recipes, known, attr, model)
+            imported += len(recipes)
+            user_ids.update(recipe.user_id for recipe in recipes)
+
+        for user_id in user_ids:
+            bump_data_version(user_id)
+        return imported, skipped
+
+    def link_attrs(self, recipes, records, attr, model):
+        """Get or create the tags/ingredients of the recipes and link them."""
+        names = defaultdict(set)  # user_id -> names
+        for recipe, record in zip(recipes, records):
+            names[recipe.user_id].update(record[f"{attr}s"])
+        model.objects.bulk_create(
+            [
+                model(user_id=user_id, name=name)
+                for user_id, user_names in names.items()
+                for name in user_names
+            ],
+            ignore_conflicts=True,
+        )
+        ids = {}  # (user_id, name) -> id
+        for user_id, user_names in names.items():
+            for pk, name in model.objects.filter(
+                user_id=user_id, name__in=user_names
+            ).values_list("id", "name"):
+                ids[(user_id, name)] = pk
+
+        through = getattr(Recipe, f"{attr}s").through
+        links = {
+            (recipe.pk, ids[(recipe.user_id, name)])
+            for recipe, record in zip(recipes, records)
+            for name in record[f"{attr}s"]
+        }
+        through.objects.bulk_create(
+            [through(recipe_id=pk, **{f"{attr}_id": attr_pk}) for pk, attr_pk in links]
+        )
+        add_recipe_counts(model, Counter(attr_pk for _, attr_pk in links))
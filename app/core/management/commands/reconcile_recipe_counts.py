@@ -0,0 +1,33 @@
+"""Django command to fix the recipe counts of tags and ingredients.
+"""
+
+from django.core.management.base import BaseCommand
+
+from core.models import Tag, Ingredient
+from recipe.cache import bump_data_version
+from recipe.counts import reconcile_recipe_counts
+
+
+class Command(BaseCommand):
+    """Django command to recount the recipes of tags and ingredients"""
+
+    help = (
+        "Recount the recipes using each tag/ingredient and fix the stored counts "
+        "that drifted (e.g., after writes bypassing the application)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="Email of the user, all users by default")
+
+    def handle(self, *args, **options):
+        for model, attr in ((Tag, "tag"), (Ingredient, "ingredient")):
+            queryset = model.objects.all()
+            if options["user"]:
+                queryset = queryset.filter(user__email=options["user"])
+            fixed = reconcile_recipe_counts(model, attr, queryset)
+            users = model.objects.filter(pk__in=fixed).values_list("user_id")
+            for user_id in {user_id for user_id, in users}:
+                bump_data_version(user_id)
+            self.stdout.write(
+                self.style.SUCCESS(f"Fixed the recipe count of {len(fixed)} {attr}s.")
+            )
@@ -0,0 +1,128 @@
+"""
+Prometheus metrics of the API (see core.middleware.MetricsMiddleware and the
+/metrics view)
+
+With several worker processes, set the PROMETHEUS_MULTIPROC_DIR environment
+variable to an empty directory shared by the workers: each process writes its
+metrics to memory-mapped files there, which /metrics aggregates. The process
+manager must then call mark_process_dead() when a worker exits, e.g., the
+child_exit hook of gunicorn.conf.py, or the live gauges keep counting it.
+"""
+
+import os
+import threading
+
+from django.conf import settings
+
+try:
+    import prometheus_client
+    from prometheus_client import multiprocess
+except ImportError:  # optional, see METRICS in app.settings
+    prometheus_client = None
+
+UNRESOLVED = "<unresolved>"  # the URL name of the 404s, bounding the labels
+SIZE_BUCKETS = tuple(2**power for power in range(10, 26))  # 1 KiB to 32 MiB
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144)
+
+if prometheus_client is not None:
+    REQUESTS = prometheus_client.Counter(
+        "http_requests_total",
+        "Requests by URL name, method and status code",
+        ["view", "method", "status"],
+    )
+    REQUEST_LATENCY = prometheus_client.Histogram(
+        "http_request_duration_seconds",
+        "Request latency by URL name, method and status code",
+        ["view", "method", "status"],
+    )
+    DB_QUERIES = prometheus_client.Histogram(
+        "http_request_db_queries",
+        "SQL queries per request by URL name",
+        ["view"],
+        buckets=QUERY_BUCKETS,
+    )
+    DB_TIME = prometheus_client.Histogram(
+        "http_request_db_duration_seconds",
+        "Time spent in the database per request by URL name",
+        ["view"],
+    )
+    IMAGE_UPLOAD_SIZE = prometheus_client.Histogram(
+        "recipe_image_upload_bytes",
+        "Size of the uploaded recipe images, before normalization",
+        buckets=SIZE_BUCKETS,
+    )
+    AUTH_CACHE_HITS = prometheus_client.Counter(
+        "auth_token_cache_hits_total", "Tokens found in the token cache"
+    )
+    AUTH_CACHE_MISSES = prometheus_client.Counter(
+        "auth_token_cache_misses_total", "Tokens looked up in the database"
+    )
+    POOL_EVENTS = prometheus_client.Counter(
+        "db_pool_events_total",
+        "Connection pool events, e.g., checkouts, waits and timeouts",
+        ["alias", "event"],
+    )
+    POOL_CONNECTIONS = prometheus_client.Gauge(
+        "db_pool_connections",
+        "Pooled connections by state (idle or in_use)",
+        ["alias", "state"],
+        multiprocess_mode="livesum",
+    )
+
+
+def is_enabled():
+    return prometheus_client is not None and getattr(settings, "METRICS", {}).get(
+        "ENABLED", False
+    )
+
+
+def observe_image_upload(size):
+    """Record the size of an uploaded image, in bytes."""
+    if is_enabled():
+        IMAGE_UPLOAD_SIZE.observe(size)
+
+
+class CounterDeltas:
+    """Add the growth of process counters (e.g., TokenCache.hits) to
+    Prometheus counters, which are the ones aggregated across processes."""
+
+    def __init__(self):
+        self.previous = {}
+        self.lock = threading.Lock()  # the requests of the threads
+
+    def inc(self, counter, key, value):
+        """e.g., deltas.inc(AUTH_CACHE_HITS, "auth_cache_hits", cache.hits)"""
+        with self.lock:
+            previous = self.previous.get(key, 0)
+            if value < previous:  # e.g., the counters were reset
+                previous = 0
+            self.previous[key] = value
+        if value > previous:
+            counter.inc(value - previous)
+
+
+# Process-wide, like the counters it follows, whatever the number of handlers
+counter_deltas = CounterDeltas()
+
+
+def get_registry():
+    """Return the registry of the metrics of all the processes."""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return prometheus_client.REGISTRY
+
+
+def mark_process_dead(pid):
+    """Drop the live gauges (e.g., POOL_CONNECTIONS) of an exited worker process
+    from PROMETHEUS_MULTIPROC_DIR."""
+    if prometheus_client is not None and "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(pid)
+
+
+def render_metrics():
+    """Return the metrics in the Prometheus text format, and its content type."""
+    return prometheus_client.generate_latest(get_registry()), (
+        prometheus_client.CONTENT_TYPE_LATEST
+    )
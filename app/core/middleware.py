@@ -0,0 +1,450 @@
+"""
+Middleware of the project: negotiated gzip/brotli compression of the responses
+and per-request instrumentation
+"""
+
+import asyncio
+import cProfile
+import logging
+import random
+import re
+import time
+import zlib
+from contextlib import contextmanager
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from rest_framework.exceptions import AuthenticationFailed
+
+from core import metrics, profiling
+from core.authentication import CachedTokenAuthentication, get_token_cache
+from core.backends.postgresql_pool.base import get_pool_stats
+from core.instrumentation import (
+    RequestStats,
+    collect_queries,
+    get_config,
+    get_view_name,
+)
+
+try:
+    import brotli
+except ImportError:  # optional, the responses are only gzipped
+    brotli = None
+
+DEFAULT_LEVELS = {"gzip": 6, "br": 5}
+# e.g., "42-1603000000-gzip", see set_content_encoding()
+ETAG_ENCODING_SUFFIX = re.compile(r'-(gzip|br)"')
+HTTP_METHODS = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+
+logger = logging.getLogger("core.instrumentation")
+
+
+def _get_config():
+    return getattr(settings, "COMPRESSION", {})
+
+
+def get_encoding(request):
+    """Return the best content coding accepted by the request, or None.
+    e.g., Accept-Encoding: gzip, deflate, br -> "br" (if brotli is installed)
+    """
+    accepted = {}
+    for item in request.META.get("HTTP_ACCEPT_ENCODING", "").split(","):
+        coding, _, params = item.partition(";")
+        quality = 1.0
+        name, _, value = params.partition("=")
+        if name.strip() == "q":
+            try:
+                quality = float(value)
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+    # brotli compresses better, so it wins ties
+    encodings = ["br", "gzip"] if brotli is not None else ["gzip"]
+    qualities = {
+        encoding: accepted.get(encoding, accepted.get("*", 0.0))
+        for encoding in encodings
+    }
+    encoding = max(encodings, key=qualities.__getitem__)
+    return encoding if qualities[encoding] > 0 else None
+
+
+def get_level(content_type, encoding):
+    """Return the compression level of a content type, or None if it is not
+    compressed (e.g., images).
+    e.g., "application/json; charset=utf-8", "gzip" -> 6
+    """
+    media_type = content_type.split(";")[0].strip().lower()
+    levels = _get_config().get("LEVELS", {}).get(media_type)
+    if levels is None:
+        return None
+    return levels.get(encoding, DEFAULT_LEVELS[encoding])
+
+
+def compress(content, encoding, level):
+    """Compress bytes with gzip or brotli."""
+    if encoding == "br":
+        return brotli.compress(content, quality=level)
+    # wbits=31 writes a gzip header, without a timestamp
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return compressor.compress(content) + compressor.flush()
+
+
+def compress_stream(chunks, encoding, level):
+    """Compress the chunks of a streaming response as they are produced, each
+    chunk is flushed so that the client can read it right away."""
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=level)
+        for chunk in chunks:
+            data = compressor.process(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+def set_content_encoding(response, encoding):
+    """Set the headers of a response whose content is compressed."""
+    response["Content-Encoding"] = encoding
+    patch_vary_headers(response, ["Accept-Encoding"])
+    if not response.streaming:
+        response["Content-Length"] = str(len(response.content))
+    set_etag_encoding(response, encoding)
+
+
+def set_etag_encoding(response, encoding):
+    """Add the encoding to the strong ETag of a response: the compressed bytes
+    differ from the identity ones. Unlike a weak ETag, it still works with
+    If-Match once strip_etag_encodings() removed the encoding.
+    e.g., "42-1603000000" -> "42-1603000000-gzip"
+    """
+    etag = response.get("ETag")
+    if etag and etag.startswith('"'):
+        response["ETag"] = f'{etag[:-1]}-{encoding}"'
+
+
+def strip_etag_encodings(request):
+    """Remove the encoding of the ETags in the If-Match and If-None-Match
+    headers of a request, so that the views compare the ETags of their identity
+    content. Returns the removed encoding, or None.
+    e.g., If-Match: "42-1603000000-gzip" -> "42-1603000000", "gzip"
+    """
+    stripped = None
+    for header in ("HTTP_IF_MATCH", "HTTP_IF_NONE_MATCH"):
+        value = request.META.get(header)
+        match = value and ETAG_ENCODING_SUFFIX.search(value)
+        if match:
+            stripped = match.group(1)
+            request.META[header] = ETAG_ENCODING_SUFFIX.sub('"', value)
+    return stripped
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """Compress the responses larger than COMPRESSION["MIN_SIZE"] with the best
+    encoding accepted by the client (brotli or gzip), at the level of their
+    content type in COMPRESSION["LEVELS"]. Streaming responses are compressed
+    chunk by chunk.
+
+    A response with a save_compressed(encoding, content) callback, e.g., from
+    the list cache, hands its compressed content to it for the next requests.
+
+    The ETags of the compressed responses get the encoding as a suffix, which
+    is removed from the conditional headers of the requests.
+    """
+
+    def process_request(self, request):
+        request.etag_encoding = strip_etag_encodings(request)
+
+    def process_response(self, request, response):
+        etag_encoding = getattr(request, "etag_encoding", None)
+        if response.status_code == 304 and etag_encoding:
+            # The client validated its compressed copy, keep its ETag
+            set_etag_encoding(response, etag_encoding)
+            patch_vary_headers(response, ["Accept-Encoding"])
+            return response
+        if response.has_header("Content-Encoding"):
+            return response  # e.g., precompressed by the list cache
+        if "no-transform" in response.get("Cache-Control", ""):
+            return response
+        if not response.streaming:
+            if len(response.content) < _get_config().get("MIN_SIZE", 1024):
+                return response
+        if get_level(response.get("Content-Type", ""), "gzip") is None:
+            return response
+
+        patch_vary_headers(response, ["Accept-Encoding"])
+        encoding = get_encoding(request)
+        if encoding is None:
+            return response
+        level = get_level(response["Content-Type"], encoding)
+        if response.streaming:
+            response.streaming_content = compress_stream(
+                response.streaming_content, encoding, level
+            )
+            del response["Content-Length"]
+        else:
+            response.content = compress(response.content, encoding, level)
+            save_compressed = getattr(response, "save_compressed", None)
+            if save_compressed is not None:
+                save_compressed(encoding, response.content)
+        set_content_encoding(response, encoding)
+        return response
+
+
+class SyncAndAsyncMiddleware:
+    """Base of the middleware below, which run in the mode of the handler like
+    MiddlewareMixin: under ASGI, __acall__() awaits the next handler without
+    the async_to_sync()/sync_to_async() thread handoffs of a sync middleware.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # Django checks asyncio.iscoroutinefunction(middleware)
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+
+class InstrumentationMiddleware(SyncAndAsyncMiddleware):
+    """Record the SQL query count, DB, serialization and render time of each
+    request in request.stats, and log them tagged with the view, e.g.,
+    view=RecipeViewSet.list method=GET status=200 queries=3 db_ms=1.52 ...
+
+    Staff users also get them in a Server-Timing header if
+    INSTRUMENTATION["SERVER_TIMING"] is set. Unused unless
+    INSTRUMENTATION["ENABLED"] is set, so that it costs nothing.
+    """
+
+    def __init__(self, get_response):
+        if not get_config().get("ENABLED"):
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+        if self.is_async:
+            # Awaited by the handler, instead of run with sync_to_async()
+            self.process_template_response = self.aprocess_template_response
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        with self.instrument(request) as stats:
+            response = self.get_response(request)
+        return self.report(request, response, stats)
+
+    async def __acall__(self, request):
+        with self.instrument(request) as stats:
+            response = await self.get_response(request)
+        return self.report(request, response, stats)
+
+    @contextmanager
+    def instrument(self, request):
+        start = time.perf_counter()
+        stats = request.stats = RequestStats()
+        with collect_queries(stats):
+            yield stats
+        stats.total_time = time.perf_counter() - start
+
+    def report(self, request, response, stats):
+        match = getattr(request, "resolver_match", None)
+        if match is not None:
+            stats.view = get_view_name(match.func, request.method)
+        self.log(request, response, stats)
+        user = getattr(request, "user", None)  # set by DRF on authentication
+        if get_config().get("SERVER_TIMING") and getattr(user, "is_staff", False):
+            response["Server-Timing"] = self.server_timing(stats)
+        return response
+
+    def process_template_response(self, request, response):
+        return self.time_rendering(request, response)
+
+    async def aprocess_template_response(self, request, response):
+        return self.time_rendering(request, response)
+
+    def time_rendering(self, request, response):
+        # Called right before the response (e.g., a DRF Response) is rendered
+        start = time.perf_counter()
+
+        def rendered(response):
+            request.stats.render_time += time.perf_counter() - start
+
+        response.add_post_render_callback(rendered)
+        return response
+
+    def log(self, request, response, stats):
+        record = {
+            "view": stats.view,
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "queries": stats.queries,
+            "db_ms": round(stats.db_time * 1000, 2),
+            "serialize_ms": round(stats.serialize_time * 1000, 2),
+            "render_ms": round(stats.render_time * 1000, 2),
+            "total_ms": round(stats.total_time * 1000, 2),
+        }
+        message = " ".join(f"{key}={value}" for key, value in record.items())
+        logger.info(message, extra={"request_stats": record})
+
+    def server_timing(self, stats):
+        """e.g., db;dur=1.52;desc="3 queries", serialize;dur=0.8, ..."""
+        return ", ".join(
+            [
+                f'db;dur={stats.db_time * 1000:.2f};desc="{stats.queries} queries"',
+                f"serialize;dur={stats.serialize_time * 1000:.2f}",
+                f"render;dur={stats.render_time * 1000:.2f}",
+                f"total;dur={stats.total_time * 1000:.2f}",
+            ]
+        )
+
+
+class ProfilingMiddleware(SyncAndAsyncMiddleware):
+    """Run requests under cProfile.
+
+    On demand (PROFILING["ON_DEMAND"]): a request with an X-Profile header or
+    a ?profile= parameter (e.g., ?profile=tottime) from a staff user gets the
+    text report of its profile instead of its response, whose status is in the
+    X-Profile-Status header. The staff user is authenticated by their token
+    before the request runs, so that others can't make it run under cProfile;
+    they get their response unchanged.
+
+    Sampling (PROFILING["SAMPLE_RATE"]): a random fraction of the requests is
+    profiled and saved to PROFILING["DIRECTORY"], see profiling.save_profile().
+    The other requests only cost a random number.
+    """
+
+    def __init__(self, get_response):
+        config = profiling.get_config()
+        self.on_demand = config.get("ON_DEMAND", False)
+        self.sample_rate = config.get("SAMPLE_RATE", 0)
+        if not self.on_demand and not self.sample_rate:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        sort = self.requested_sort(request)
+        if sort is not None and not self.is_staff(request):
+            sort = None
+        sampled = sort is None and self.is_sampled()
+        if sort is None and not sampled:
+            return self.get_response(request)
+        return self.profile(self.get_response, request, sort, sampled)
+
+    async def __acall__(self, request):
+        sort = self.requested_sort(request)
+        if sort is not None and not await sync_to_async(self.is_staff)(request):
+            sort = None
+        sampled = sort is None and self.is_sampled()
+        if sort is None and not sampled:
+            return await self.get_response(request)
+        # cProfile only follows its thread: run the request in the thread of
+        # the sync code (e.g., the views), where the rest of it comes back to
+        return await sync_to_async(self.profile)(
+            async_to_sync(self.get_response), request, sort, sampled
+        )
+
+    def requested_sort(self, request):
+        """Return the sort key of the requested on demand profile, or None."""
+        if not self.on_demand:
+            return None
+        return request.META.get("HTTP_X_PROFILE") or request.GET.get("profile")
+
+    def is_sampled(self):
+        return random.random() < self.sample_rate
+
+    def is_staff(self, request):
+        """Return whether the token of the request is the one of a staff user
+        (the APIs authenticate with tokens, DRF only does it in the view)."""
+        try:
+            auth = CachedTokenAuthentication().authenticate(request)
+        except AuthenticationFailed:
+            return False
+        return auth is not None and auth[0].is_staff
+
+    def profile(self, get_response, request, sort, sampled):
+        profiler = cProfile.Profile()
+        response = profiler.runcall(get_response, request)
+        if sampled:
+            profiling.save_profile(profiler, request)
+            return response
+        if profiling.get_config().get("DIRECTORY"):
+            profiling.save_profile(profiler, request)
+        report = HttpResponse(
+            profiling.profile_report(profiler, sort), content_type="text/plain"
+        )
+        report["X-Profile-Status"] = response.status_code
+        return report
+
+
+class MetricsMiddleware(SyncAndAsyncMiddleware):
+    """Record the Prometheus metrics of the requests (see core.metrics): their
+    count and latency by URL name (e.g., recipe:recipe-list), method and status
+    code, their SQL queries and DB time, and the token cache and connection
+    pool counters of the process. Unused unless metrics.is_enabled().
+    """
+
+    def __init__(self, get_response):
+        if not metrics.is_enabled():
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        start = time.perf_counter()
+        with self.collect(request) as stats:
+            response = self.get_response(request)
+        return self.record(request, response, stats, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        with self.collect(request) as stats:
+            response = await self.get_response(request)
+        return self.record(request, response, stats, time.perf_counter() - start)
+
+    @contextmanager
+    def collect(self, request):
+        stats = getattr(request, "stats", None)  # by InstrumentationMiddleware
+        if stats is not None:
+            yield stats
+            return
+        stats = request.stats = RequestStats()
+        with collect_queries(stats):
+            yield stats
+
+    def record(self, request, response, stats, elapsed):
+        match = getattr(request, "resolver_match", None)
+        view = match.view_name if match else metrics.UNRESOLVED
+        method = request.method if request.method in HTTP_METHODS else "other"
+        labels = (view, method, str(response.status_code))
+        metrics.REQUESTS.labels(*labels).inc()
+        metrics.REQUEST_LATENCY.labels(*labels).observe(elapsed)
+        metrics.DB_QUERIES.labels(view).observe(stats.queries)
+        metrics.DB_TIME.labels(view).observe(stats.db_time)
+        self.record_process_counters()
+        return response
+
+    def record_process_counters(self):
+        deltas = metrics.counter_deltas
+        token_cache = get_token_cache()
+        deltas.inc(metrics.AUTH_CACHE_HITS, "auth_cache_hits", token_cache.hits)
+        deltas.inc(metrics.AUTH_CACHE_MISSES, "auth_cache_misses", token_cache.misses)
+        for alias, pool_stats in get_pool_stats().items():
+            for name, value in pool_stats.items():
+                if name in ("idle", "in_use"):
+                    metrics.POOL_CONNECTIONS.labels(alias, name).set(value)
+                else:
+                    counter = metrics.POOL_EVENTS.labels(alias, name)
+                    deltas.inc(counter, ("pool", alias, name), value)
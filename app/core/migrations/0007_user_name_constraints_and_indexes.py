@@ -0,0 +1,65 @@
+# Generated by Django 3.2.25 on 2026-10-18 02:26
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def merge_duplicate_names(apps, schema_editor):
+    """Merge tags/ingredients sharing (user, name) before making it unique."""
+    Recipe = apps.get_model('core', 'Recipe')
+    for model_name, attr in (('Tag', 'tag'), ('Ingredient', 'ingredient')):
+        model = apps.get_model('core', model_name)
+        through = getattr(Recipe, f'{attr}s').through
+        duplicates = (
+            model.objects.values('user_id', 'name')
+            .annotate(keep_id=Min('id'), total=Count('id'))
+            .filter(total__gt=1)
+        )
+        for duplicate in duplicates:
+            keep_id = duplicate['keep_id']
+            extra_ids = model.objects.filter(
+                user_id=duplicate['user_id'], name=duplicate['name']
+            ).exclude(id=keep_id).values_list('id', flat=True)
+            for extra_id in list(extra_ids):
+                # Move the links over, unless the recipe already has the kept one
+                linked = through.objects.filter(**{f'{attr}_id': keep_id})
+                through.objects.filter(**{f'{attr}_id': extra_id}).exclude(
+                    recipe_id__in=linked.values('recipe_id')
+                ).update(**{f'{attr}_id': keep_id})
+            # Remaining links of the duplicates are removed by the cascade
+            model.objects.filter(id__in=list(extra_ids)).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_recipe_image'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['user', '-id'], name='recipe_user_id_desc_idx'),
+        ),
+        migrations.RunPython(merge_duplicate_names, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('user', 'name'), name='ingredient_user_name_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='tag',
+            constraint=models.UniqueConstraint(fields=('user', 'name'), name='tag_user_name_uniq'),
+        ),
+        # The auto-created M2M tables are only indexed on (recipe_id, attr_id),
+        # add the reverse direction for the attr -> recipes lookups
+        migrations.RunSQL(
+            'CREATE INDEX core_recipe_tags_tag_recipe_idx '
+            'ON core_recipe_tags (tag_id, recipe_id);',
+            'DROP INDEX core_recipe_tags_tag_recipe_idx;',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX core_recipe_ingredients_ingredient_recipe_idx '
+            'ON core_recipe_ingredients (ingredient_id, recipe_id);',
+            'DROP INDEX core_recipe_ingredients_ingredient_recipe_idx;',
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 3.2.25 on 2026-10-18 02:37
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    """Index and fill the search vectors, they are only used on PostgreSQL."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'CREATE INDEX recipe_search_vector_idx ON core_recipe USING gin (search_vector)'
+    )
+    schema_editor.execute("""
+        UPDATE core_recipe r SET search_vector =
+            setweight(to_tsvector('english', r.title), 'A')
+            || setweight(to_tsvector('english', coalesce((
+                SELECT string_agg(t.name, ' ') FROM core_tag t
+                JOIN core_recipe_tags rt ON rt.tag_id = t.id WHERE rt.recipe_id = r.id
+            ), '')), 'B')
+            || setweight(to_tsvector('english', coalesce((
+                SELECT string_agg(i.name, ' ') FROM core_ingredient i
+                JOIN core_recipe_ingredients ri ON ri.ingredient_id = i.id
+                WHERE ri.recipe_id = r.id
+            ), '')), 'B')
+            || setweight(to_tsvector('english', r.description), 'C')
+    """)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS recipe_search_vector_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_recipe_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 3.2.25 on 2026-10-18 03:12
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_recipes(apps, schema_editor):
+    """Fill the recipe counts of the existing tags/ingredients."""
+    Recipe = apps.get_model('core', 'Recipe')
+    for model_name, attr in (('Tag', 'tag'), ('Ingredient', 'ingredient')):
+        model = apps.get_model('core', model_name)
+        through = getattr(Recipe, f'{attr}s').through
+        total = (
+            through.objects.filter(**{attr: OuterRef('pk')})
+            .order_by()
+            .values(attr)
+            .annotate(total=Count('pk'))
+            .values('total')
+        )
+        model.objects.update(recipe_count=Coalesce(Subquery(total), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_attr_name_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='recipe_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='recipe_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_recipes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(condition=models.Q(('recipe_count__gt', 0)), fields=['user', '-name'], name='ingredient_user_assigned_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(condition=models.Q(('recipe_count__gt', 0)), fields=['user', '-name'], name='tag_user_assigned_idx'),
+        ),
+    ]
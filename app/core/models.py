@@ -5,6 +5,7 @@ Database models
 import uuid
 import os
 from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 from django.contrib.auth.models import (
     AbstractBaseUser,
@@ -85,6 +86,20 @@ class Recipe(models.Model):
     tags = models.ManyToManyField("Tag")
     ingredients = models.ManyToManyField("Ingredient")
     image = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    # Resized copies of the image, generated in the background (recipe.images)
+    image_thumbnail = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    image_medium = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    # Also touched when the tags/ingredients of the recipe change (recipe.signals)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Title, description, tag and ingredient names, kept up to date by
+    # recipe.signals (PostgreSQL only, GIN indexed)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Recipes are always listed per user, newest first
+            models.Index(fields=["user", "-id"], name="recipe_user_id_desc_idx"),
+        ]
 
     def __str__(self):
         return self.title
@@ -95,6 +110,22 @@ class Tag(models.Model):
 
     name = models.CharField(max_length=255)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    # Number of recipes using the tag, kept up to date by recipe.signals
+    recipe_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        constraints = [
+            # Backs the get_or_create lookups and the per-user listing by name
+            models.UniqueConstraint(fields=["user", "name"], name="tag_user_name_uniq"),
+        ]
+        indexes = [
+            # Backs the assigned_only listing
+            models.Index(
+                fields=["user", "-name"],
+                name="tag_user_assigned_idx",
+                condition=models.Q(recipe_count__gt=0),
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -105,6 +136,21 @@ class Ingredient(models.Model):
 
     name = models.CharField(max_length=255)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    recipe_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "name"], name="ingredient_user_name_uniq"
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["user", "-name"],
+                name="ingredient_user_assigned_idx",
+                condition=models.Q(recipe_count__gt=0),
+            ),
+        ]
 
     def __str__(self):
         return self.name
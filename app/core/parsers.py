@@ -0,0 +1,51 @@
+"""
+Parsers of the REST APIs: fast JSON and MessagePack
+"""
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser, JSONParser
+
+from core import renderers
+
+try:
+    import orjson
+except ImportError:  # optional, JSONParser falls back to the json module
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # optional, see REST_FRAMEWORK in app.settings
+    msgpack = None
+
+
+class FastJSONParser(JSONParser):
+    """Parses JSON like JSONParser, with orjson if it is installed."""
+
+    renderer_class = renderers.FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get("encoding", settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower().replace("-", "") != "utf8":
+            return super().parse(stream, media_type, parser_context)
+        try:
+            # Rejects NaN and Infinity like the strict JSONParser
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError(f"JSON parse error - {exc}")
+
+
+class MessagePackParser(BaseParser):
+    """Parses MessagePack, e.g., the recipes written by the mobile clients."""
+
+    media_type = "application/msgpack"
+    renderer_class = renderers.MessagePackRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            # The map keys must be strings, like in JSON (strict_map_key)
+            return msgpack.unpackb(stream.read(), raw=False)
+        # e.g., truncated or trailing data, a reserved byte or a list as map key
+        except (ValueError, TypeError, msgpack.UnpackException) as exc:
+            raise ParseError(f"MessagePack parse error - {exc}")
@@ -0,0 +1,59 @@
+"""
+Profiles of the API requests under cProfile (see
+core.middleware.ProfilingMiddleware)
+"""
+
+import io
+import os
+import pstats
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+
+SORT_KEYS = ("cumulative", "tottime", "calls")
+
+
+def get_config():
+    return getattr(settings, "PROFILING", {})
+
+
+def profile_name(request):
+    """Return the file name of a request profile.
+    e.g., 20261018T031500-3f2a9c1e-recipe-recipe-list.prof
+    """
+    match = getattr(request, "resolver_match", None)
+    view = match.view_name.replace(":", "-") if match else "unresolved"
+    timestamp = time.strftime("%Y%m%dT%H%M%S")
+    return f"{timestamp}-{uuid.uuid4().hex[:8]}-{view}.prof"
+
+
+def rotate_profiles(directory, max_files):
+    """Delete the oldest profiles of the directory beyond max_files."""
+    profiles = sorted(Path(directory).glob("*.prof"), key=os.path.getmtime)
+    for path in profiles[: max(len(profiles) - max_files, 0)]:
+        path.unlink(missing_ok=True)  # e.g., deleted by another worker
+
+
+def save_profile(profiler, request):
+    """Write the profile of a request to PROFILING["DIRECTORY"], keeping the
+    newest PROFILING["MAX_FILES"] profiles. Returns the path of the profile.
+    Read with python -m pstats <path> or, e.g., snakeviz.
+    """
+    config = get_config()
+    directory = Path(config["DIRECTORY"])
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / profile_name(request)
+    profiler.dump_stats(path)
+    rotate_profiles(directory, config.get("MAX_FILES", 100))
+    return path
+
+
+def profile_report(profiler, sort="cumulative", limit=50):
+    """Return the text report of the limit most expensive functions."""
+    if sort not in SORT_KEYS:
+        sort = "cumulative"
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).sort_stats(sort).print_stats(limit)
+    return stream.getvalue()
@@ -0,0 +1,74 @@
+"""
+Renderers of the REST APIs: fast JSON and MessagePack
+"""
+
+from django.db.models.fields.files import FieldFile
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # optional, JSONRenderer falls back to the json module
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # optional, see REST_FRAMEWORK in app.settings
+    msgpack = None
+
+
+class APIJSONEncoder(JSONEncoder):
+    """DRF's encoder, which also renders the files of the models by URL.
+    e.g., Decimal("5.00") -> 5.0, recipe.image -> "/media/uploads/recipe/x.jpg"
+    """
+
+    def default(self, obj):
+        if isinstance(obj, FieldFile):
+            return obj.url if obj else None
+        return super().default(obj)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """Renders the same JSON as JSONRenderer, with orjson if it is installed."""
+
+    encoder_class = APIJSONEncoder
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if orjson is None or indent or self.ensure_ascii or not self.compact:
+            # e.g., the browsable API, orjson only writes compact UTF-8
+            return super().render(data, accepted_media_type, renderer_context)
+
+        ret = orjson.dumps(
+            data,
+            default=self.encoder_class().default,
+            # Dates as rendered by DRF's encoder, e.g., "2021-01-01T00:00:00Z"
+            option=orjson.OPT_NON_STR_KEYS
+            | orjson.OPT_PASSTHROUGH_DATETIME
+            | orjson.OPT_PASSTHROUGH_DATACLASS,
+        )
+        # Escaped by JSONRenderer so that the JSON is a strict JavaScript subset
+        for separator in ("\u2028", "\u2029"):
+            ret = ret.replace(separator.encode(), separator.encode("unicode_escape"))
+        return ret
+
+
+class MessagePackRenderer(BaseRenderer):
+    """Renders MessagePack, a compact binary JSON, for the mobile clients.
+    The values are the same as in JSON, e.g., prices are strings ("5.00").
+    """
+
+    media_type = "application/msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+    encoder_class = APIJSONEncoder
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+        return msgpack.packb(
+            data, default=self.encoder_class().default, use_bin_type=True
+        )
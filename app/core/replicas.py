@@ -0,0 +1,127 @@
+"""
+Routing of the API reads to the read replicas of the database
+"""
+
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections, transaction
+from django.db.utils import OperationalError
+from rest_framework.permissions import SAFE_METHODS
+
+_state = threading.local()  # .alias: replica read by the current request
+_down_until = {}  # alias -> time.monotonic() until the replica is skipped
+
+
+def _pin_key(user_id):
+    return f"primary-pin:{user_id}"
+
+
+def pin_to_primary(user_id):
+    """Read the data of a user from the primary for a while after a write,
+    so that the user reads their own writes despite the replication lag."""
+    seconds = getattr(settings, "REPLICA_PIN_SECONDS", 5)
+    caches["default"].set(_pin_key(user_id), True, seconds)
+
+
+def is_pinned_to_primary(user_id):
+    """Whether the reads of a user must go to the primary."""
+    return bool(caches["default"].get(_pin_key(user_id)))
+
+
+def mark_replica_down(alias):
+    """Skip a replica for REPLICA_RETRY_SECONDS."""
+    seconds = getattr(settings, "REPLICA_RETRY_SECONDS", 30)
+    _down_until[alias] = time.monotonic() + seconds
+
+
+def choose_replica():
+    """Return a connectable replica alias, or None to read from the primary."""
+    now = time.monotonic()
+    aliases = [
+        alias
+        for alias in getattr(settings, "REPLICA_DATABASES", [])
+        if _down_until.get(alias, 0) <= now
+    ]
+    random.shuffle(aliases)  # spread the reads
+    for alias in aliases:
+        try:
+            # Opened for the request anyway, unless it is already open
+            connections[alias].ensure_connection()
+            return alias
+        except Exception:
+            mark_replica_down(alias)
+    return None
+
+
+def get_read_replica():
+    """Return the replica read by the current request, or None."""
+    return getattr(_state, "alias", None)
+
+
+def set_read_replica(alias):
+    """Read the models of the current request from the replica alias (or the
+    primary if None)."""
+    _state.alias = alias
+
+
+class ReplicaRouter:
+    """Send the reads of the requests flagged by ReplicaReadMixin to their
+    replica, everything else to the primary (default)."""
+
+    def db_for_read(self, model, **hints):
+        return get_read_replica()
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # the replicas hold the same data
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in getattr(settings, "REPLICA_DATABASES", [])
+
+
+class ReplicaReadMixin:
+    """Read from a replica during the safe (e.g., GET) requests of a view.
+
+    The users are pinned to the primary during their other requests and for
+    REPLICA_PIN_SECONDS after their writes commit, and a request failing on
+    its replica is retried once on the primary.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        except OperationalError:
+            alias = get_read_replica()
+            if alias is None:
+                raise
+            # e.g., the replica went down during the request
+            mark_replica_down(alias)
+            set_read_replica(None)
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            set_read_replica(None)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        user_id = request.user.pk
+        if request.method not in SAFE_METHODS:
+            if user_id is not None:
+                pin_to_primary(user_id)
+        elif get_read_replica() is None and not is_pinned_to_primary(user_id):
+            set_read_replica(choose_replica())
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        user_id = request.user.pk
+        if request.method not in SAFE_METHODS and user_id is not None:
+            if response.status_code < 400:
+                # Pinned again from the commit, e.g., a long bulk write may have
+                # outlived the pin of initial()
+                transaction.on_commit(lambda: pin_to_primary(user_id))
+        return response
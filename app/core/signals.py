@@ -0,0 +1,25 @@
+"""
+Signal handlers for the core models
+"""
+
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from core.authentication import get_token_cache
+
+
+@receiver(post_delete, sender=Token)
+def evict_deleted_token(sender, instance, **kwargs):
+    """Stop authenticating with a token once it is deleted."""
+    get_token_cache().delete(instance.key)
+
+
+@receiver(post_save, sender=get_user_model())
+def evict_user_tokens(sender, instance, created, **kwargs):
+    """Drop the cached tokens of a user when it changes (e.g. is_active)."""
+    if created:
+        return
+    for key in Token.objects.filter(user=instance).values_list("key", flat=True):
+        get_token_cache().delete(key)
@@ -0,0 +1,150 @@
+"""
+Tests for the cached token authentication.
+"""
+
+import time
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.authentication import (
+    CachedTokenAuthentication,
+    TokenCache,
+    freeze_token,
+    get_token_cache,
+)
+
+ME_URL = reverse("user:me")
+
+
+class TokenCacheTests(TestCase):
+    """Test the token LRU cache."""
+
+    def test_evicts_least_recently_used(self):
+        """Test the cache never grows above its max size."""
+        cache = TokenCache(max_size=2, ttl=60)
+        cache.set("a", "token-a")
+        cache.set("b", "token-b")
+        cache.get("a")
+        cache.set("c", "token-c")
+
+        self.assertEqual(cache.get("a"), "token-a")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), "token-c")
+
+    @patch("core.authentication.time.monotonic")
+    def test_entries_expire(self, patched_monotonic):
+        """Test entries are dropped once the TTL has passed."""
+        patched_monotonic.return_value = 100
+        cache = TokenCache(max_size=10, ttl=60)
+        cache.set("a", "token-a")
+
+        patched_monotonic.return_value = 161
+        self.assertIsNone(cache.get("a"))
+
+    def test_deleted_in_other_process(self):
+        """Test a key deleted by another process sharing the cache is dropped
+        from the local LRU, and can be cached again."""
+        caches["default"].clear()
+        process_a = TokenCache(ttl=60, cache_alias="default")
+        process_b = TokenCache(ttl=60, cache_alias="default")
+        process_a.set("a", "token-a")
+        self.assertEqual(process_b.get("a"), "token-a")
+
+        process_a.delete("a")
+
+        self.assertIsNone(process_b.get("a"))
+        with patch("core.authentication.time.time", return_value=time.time() + 1):
+            process_b.set("a", "token-a2")
+        self.assertEqual(process_b.get("a"), "token-a2")
+        self.assertEqual(process_a.get("a"), "token-a2")
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    """Test authenticating API requests with cached tokens."""
+
+    def setUp(self):
+        get_token_cache().clear()
+        self.user = get_user_model().objects.create_user(
+            email="user@example.com", password="testpass123"
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+
+    def test_token_lookup_cached(self):
+        """Test the token is only looked up in the database once."""
+        self.client.get(ME_URL)
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["email"], self.user.email)
+        self.assertEqual(res.data["name"], self.user.name)  # not cached
+        for query in queries:
+            self.assertNotIn("authtoken_token", query["sql"])
+
+    def test_password_not_cached(self):
+        """Test only the fields needed to authenticate the user are cached."""
+        entry = freeze_token(self.token)
+
+        self.assertNotIn(self.user.password, entry[2])
+        self.assertEqual(len(entry[2]), 5)  # id, email, is_* flags
+
+    def test_deleted_token_rejected(self):
+        """Test a deleted token stops working even when cached."""
+        self.client.get(ME_URL)
+        self.token.delete()
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_rejected(self):
+        """Test the token of a deactivated user stops working."""
+        self.client.get(ME_URL)
+        self.user.is_active = False
+        self.user.save()
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_cached_user_not_shared(self):
+        """Test each request gets its own instances of the cached token."""
+        self.client.get(ME_URL)
+        authentication = CachedTokenAuthentication()
+
+        with self.assertNumQueries(0):
+            user, token = authentication.authenticate_credentials(self.token.key)
+            user.name = "Changed in place"
+            other_user, other_token = authentication.authenticate_credentials(
+                self.token.key
+            )
+
+        self.assertIsNot(other_user, user)
+        self.assertIsNot(other_token, token)
+        self.assertEqual(other_user.name, self.user.name)
+        self.assertEqual(other_user.pk, self.user.pk)
+        self.assertEqual(other_token.key, self.token.key)
+
+    def test_cached_user_saved(self):
+        """Test the user of a cached token saves all its fields."""
+        self.client.get(ME_URL)
+
+        res = self.client.patch(ME_URL, {"name": "New name"})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.name, "New name")
+        self.assertTrue(self.user.check_password("testpass123"))
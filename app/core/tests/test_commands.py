@@ -1,12 +1,22 @@
 """Teste custom Django management commands"""
 
+import json
+import tempfile
+from decimal import Decimal
+from io import StringIO
+from unittest import skipUnless
 from unittest.mock import patch
 
 from psycopg2 import OperationalError as Psycopg2OpError
 
+from django.contrib.auth import get_user_model
 from django.core.management import call_command
+from django.db import connection
 from django.db.utils import OperationalError
-from django.test import SimpleTestCase
+from django.test import SimpleTestCase, TestCase
+
+from core.management.commands.import_recipes import Command
+from core.models import Recipe, Tag, Ingredient
 
 
 @patch("core.management.commands.wait_for_db.Command.check")
@@ -28,3 +38,141 @@ class CommandTests(SimpleTestCase):
         call_command("wait_for_db")
         self.assertEqual(patched_check.call_count, 6)
         patched_check.assert_called_with(databases=["default"])
+
+
+class RecipeExportImportTests(TestCase):
+    """Test the export_recipes and import_recipes commands"""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(
+            email="user@example.com", password="testpass123"
+        )
+        self.recipe = Recipe.objects.create(
+            user=self.user,
+            title="Pongal",
+            time_minutes=60,
+            price=Decimal("4.50"),
+            description="Rice and lentils",
+        )
+        self.recipe.tags.add(Tag.objects.create(user=self.user, name="Indian"))
+        self.recipe.ingredients.add(
+            Ingredient.objects.create(user=self.user, name="Rice"),
+            Ingredient.objects.create(user=self.user, name="Lentils"),
+        )
+
+    def test_export_ndjson(self):
+        """Test exporting recipes as NDJSON."""
+        out = StringIO()
+        call_command(
+            "export_recipes", user="user@example.com", stdout=out, stderr=StringIO()
+        )
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(
+            records,
+            [
+                {
+                    "user": "user@example.com",
+                    "title": "Pongal",
+                    "description": "Rice and lentils",
+                    "time_minutes": 60,
+                    "price": "4.50",
+                    "link": "",
+                    "tags": ["Indian"],
+                    "ingredients": ["Lentils", "Rice"],
+                }
+            ],
+        )
+
+    def test_export_import_round_trip(self):
+        """Test importing exported recipes recreates them with their links."""
+        for fmt in ("ndjson", "csv"):
+            with self.subTest(fmt=fmt), tempfile.NamedTemporaryFile("w+") as dump:
+                call_command(
+                    "export_recipes", format=fmt, output=dump.name, stderr=StringIO()
+                )
+                call_command("import_recipes", dump.name, format=fmt, stdout=StringIO())
+
+        recipes = Recipe.objects.filter(user=self.user, title="Pongal")
+        self.assertEqual(recipes.count(), 4)  # 1 + 1 from NDJSON + 2 from CSV
+        for recipe in recipes:
+            self.assertEqual(recipe.price, Decimal("4.50"))
+            tags = list(recipe.tags.values_list("name", flat=True))
+            self.assertEqual(tags, ["Indian"])
+            self.assertEqual(recipe.ingredients.count(), 2)
+        # Existing tags and ingredients are reused
+        self.assertEqual(Tag.objects.count(), 1)
+        self.assertEqual(Ingredient.objects.count(), 2)
+        self.assertEqual(Tag.objects.get().recipe_count, 4)
+
+    def test_import_empty_fields(self):
+        """Test recipes with an empty description and link are imported."""
+        self.recipe.description = ""
+        self.recipe.save()
+        for fmt in ("ndjson", "csv"):
+            with self.subTest(fmt=fmt), tempfile.NamedTemporaryFile("w+") as dump:
+                call_command(
+                    "export_recipes", format=fmt, output=dump.name, stderr=StringIO()
+                )
+                call_command("import_recipes", dump.name, format=fmt, stdout=StringIO())
+
+        recipes = Recipe.objects.filter(user=self.user, title="Pongal")
+        self.assertEqual(recipes.count(), 4)  # 1 + 1 from NDJSON + 2 from CSV
+        for recipe in recipes:
+            self.assertEqual(recipe.description, "")
+            self.assertEqual(recipe.link, "")
+
+    @skipUnless(connection.vendor == "postgresql", "COPY is specific to PostgreSQL")
+    def test_import_with_copy_empty_fields(self):
+        """Test the COPY import keeps the empty fields as empty strings."""
+        command = Command()
+        record = {
+            "user": self.user.email,
+            "title": "Soup",
+            "description": "",
+            "time_minutes": 5,
+            "price": "1.00",
+            "link": "",
+            "tags": ["Indian"],
+            "ingredients": [],
+        }
+
+        imported, skipped = command.load_with_copy(iter([record]))
+
+        self.assertEqual((imported, skipped), (1, 0))
+        recipe = Recipe.objects.get(title="Soup")
+        self.assertEqual((recipe.description, recipe.link), ("", ""))
+        self.assertEqual(list(recipe.tags.values_list("name", flat=True)), ["Indian"])
+
+    def test_import_skips_unknown_users(self):
+        """Test records of users missing in the database are skipped."""
+        record = {
+            "user": "missing@example.com",
+            "title": "Soup",
+            "description": "",
+            "time_minutes": 5,
+            "price": "1.00",
+            "link": "",
+            "tags": [],
+            "ingredients": [],
+        }
+        with tempfile.NamedTemporaryFile("w+", suffix=".ndjson") as dump:
+            dump.write(json.dumps(record) + "\n")
+            dump.flush()
+            out = StringIO()
+            call_command("import_recipes", dump.name, stdout=out)
+
+        self.assertIn("Imported 0 recipes, skipped 1.", out.getvalue())
+        self.assertFalse(Recipe.objects.filter(title="Soup").exists())
+
+    def test_reconcile_recipe_counts(self):
+        """Test the drifted recipe counts are fixed."""
+        Tag.objects.update(recipe_count=5)
+        Ingredient.objects.filter(name="Rice").update(recipe_count=0)
+
+        out = StringIO()
+        call_command("reconcile_recipe_counts", stdout=out)
+
+        self.assertEqual(Tag.objects.get(name="Indian").recipe_count, 1)
+        self.assertEqual(Ingredient.objects.get(name="Rice").recipe_count, 1)
+        self.assertIn("Fixed the recipe count of 1 tags.", out.getvalue())
+        self.assertIn("Fixed the recipe count of 1 ingredients.", out.getvalue())
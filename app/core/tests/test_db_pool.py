@@ -0,0 +1,125 @@
+"""
+Tests for the pool of database connections
+"""
+
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INTRANS
+
+from core.backends.postgresql_pool.pool import ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+    """Connection with the psycopg2 methods used by the pool."""
+
+    def __init__(self):
+        self.closed = 0
+        self.status = TRANSACTION_STATUS_IDLE
+        self.pings = 0
+
+    def close(self):
+        self.closed = 1
+
+    def get_transaction_status(self):
+        return self.status
+
+    def rollback(self):
+        self.status = TRANSACTION_STATUS_IDLE
+
+    def cursor(self):
+        connection = self
+
+        class Cursor:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *args):
+                pass
+
+            def execute(self, sql):
+                connection.pings += 1
+                if connection.closed:
+                    raise Exception("server closed the connection")
+
+        return Cursor()
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    """Test the connection pool."""
+
+    def test_connections_reused(self):
+        """Test returned connections are checked out again, rolled back."""
+        pool = ConnectionPool(max_size=2)
+        connection = pool.checkout(FakeConnection)
+        connection.status = TRANSACTION_STATUS_INTRANS
+        pool.checkin(connection)
+
+        self.assertIs(pool.checkout(FakeConnection), connection)
+        self.assertEqual(connection.status, TRANSACTION_STATUS_IDLE)
+        self.assertEqual(connection.pings, 0)
+        stats = pool.stats()
+        self.assertEqual(stats["checkouts"], 2)
+        self.assertEqual(stats["created"], 1)
+        self.assertEqual(stats["in_use"], 1)
+
+    def test_full_pool_timeout(self):
+        """Test checking out of a full pool waits, then times out."""
+        pool = ConnectionPool(max_size=1, timeout=0.01)
+        pool.checkout(FakeConnection)
+
+        with self.assertRaises(PoolTimeout):
+            pool.checkout(FakeConnection)
+
+        stats = pool.stats()
+        self.assertEqual(stats["waits"], 1)
+        self.assertEqual(stats["timeouts"], 1)
+
+    def test_broken_connection_replaced(self):
+        """Test an idle connection failing the health check is replaced."""
+        pool = ConnectionPool(max_size=1, check_interval=0)
+        connection = pool.checkout(FakeConnection)
+        pool.checkin(connection)
+        connection.closed = 2  # e.g., the server restarted
+
+        new_connection = pool.checkout(FakeConnection)
+
+        self.assertIsNot(new_connection, connection)
+        self.assertEqual(pool.stats()["errors"], 1)
+        self.assertEqual(pool.stats()["in_use"], 1)
+
+    def test_health_check_of_idle_connection(self):
+        """Test connections idle for check_interval are pinged on checkout."""
+        pool = ConnectionPool(max_size=1, max_age=10 ** 10, check_interval=30)
+        connection = pool.checkout(FakeConnection)
+        pool.checkin(connection)
+
+        with patch("time.monotonic", return_value=10 ** 9):
+            self.assertIs(pool.checkout(FakeConnection), connection)
+
+        self.assertEqual(connection.pings, 1)
+
+    def test_old_connection_recycled(self):
+        """Test connections older than max_age are closed on checkin."""
+        pool = ConnectionPool(max_size=1, max_age=60)
+        connection = pool.checkout(FakeConnection)
+
+        with patch("time.monotonic", return_value=10 ** 9):
+            pool.checkin(connection)
+
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.stats()["recycled"], 1)
+        self.assertIsNot(pool.checkout(FakeConnection), connection)
+
+    def test_failed_connect_frees_slot(self):
+        """Test a connection error doesn't take a slot of the pool."""
+        pool = ConnectionPool(max_size=1, timeout=0)
+
+        def connect():
+            raise OSError("connection refused")
+
+        with self.assertRaises(OSError):
+            pool.checkout(connect)
+
+        self.assertIsNotNone(pool.checkout(FakeConnection))
+        self.assertEqual(pool.stats()["errors"], 1)
@@ -0,0 +1,122 @@
+"""
+Tests for the per-request instrumentation.
+"""
+
+import asyncio
+from decimal import Decimal
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.authentication import get_token_cache
+from core.middleware import InstrumentationMiddleware
+from core.models import Recipe
+
+RECIPES_URL = reverse("recipe:recipe-list")
+
+
+@override_settings(INSTRUMENTATION={"ENABLED": True, "SERVER_TIMING": True})
+class InstrumentationMiddlewareTests(TestCase):
+    """Test the costs of the requests are logged and sent to the staff."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("user@example.com")
+        self.recipe = Recipe.objects.create(
+            user=self.user, title="Curry", time_minutes=30, price=Decimal("7.00")
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get_logged_stats(self, method, url, **kwargs):
+        """Send a request and return its response and logged stats."""
+        with self.assertLogs("core.instrumentation", "INFO") as logs:
+            res = getattr(self.client, method)(url, **kwargs)
+        self.assertEqual(len(logs.records), 1)
+        return res, logs.records[0]
+
+    def test_log_request_stats(self):
+        """Test the stats are logged tagged with the view and action."""
+        res, record = self.get_logged_stats("get", RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        stats = record.request_stats
+        self.assertEqual(stats["view"], "RecipeViewSet.list")
+        self.assertEqual(stats["status"], 200)
+        self.assertGreater(stats["queries"], 0)
+        self.assertGreaterEqual(stats["total_ms"], stats["db_ms"])
+        self.assertIn("view=RecipeViewSet.list method=GET", record.getMessage())
+        self.assertFalse(res.has_header("Server-Timing"))
+
+    def test_log_custom_action(self):
+        """Test the custom actions are named after their method."""
+        url = reverse("recipe:recipe-upload-image", args=[self.recipe.id])
+
+        res, record = self.get_logged_stats("post", url, data={"image": "x"})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(record.request_stats["view"], "RecipeViewSet.upload_image")
+
+    def test_server_timing_for_staff(self):
+        """Test the staff users get the stats in a Server-Timing header."""
+        self.user.is_staff = True
+        self.user.save()
+        url = reverse("recipe:recipe-detail", args=[self.recipe.id])
+
+        res, record = self.get_logged_stats("get", url)
+
+        queries = record.request_stats["queries"]
+        self.assertIn(f'desc="{queries} queries"', res["Server-Timing"])
+        for name in ("db;dur=", "serialize;dur=", "render;dur=", "total;dur="):
+            self.assertIn(name, res["Server-Timing"])
+
+    @override_settings(INSTRUMENTATION={"ENABLED": False})
+    def test_disabled(self):
+        """Test the middleware isn't used when disabled."""
+        with self.assertRaises(MiddlewareNotUsed):
+            InstrumentationMiddleware(lambda request: None)
+
+    def test_queries_counted(self):
+        """Test the execute wrapper counts the queries and their time."""
+        res, _ = self.get_logged_stats("get", RECIPES_URL)
+        stats = res.wsgi_request.stats
+        queries = stats.queries
+
+        with connection.execute_wrapper(stats):
+            Recipe.objects.count()
+
+        self.assertEqual(stats.queries, queries + 1)
+        self.assertGreater(stats.db_time, 0)
+
+    def test_async_middleware(self):
+        """Test the middleware is a coroutine function in an async chain."""
+
+        async def get_response(request):
+            return None
+
+        middleware = InstrumentationMiddleware(get_response)
+
+        self.assertTrue(asyncio.iscoroutinefunction(middleware))
+        self.assertFalse(asyncio.iscoroutinefunction(InstrumentationMiddleware(str)))
+
+    def test_log_async_request_stats(self):
+        """Test the queries are counted under ASGI, where the views run in
+        another thread than the middleware."""
+        get_token_cache().clear()
+        token = Token.objects.create(user=self.user)
+        get = async_to_sync(self.async_client.get)
+
+        with self.assertLogs("core.instrumentation", "INFO") as logs:
+            res = get(RECIPES_URL, authorization=f"Token {token.key}")
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        stats = logs.records[0].request_stats
+        self.assertEqual(stats["view"], "RecipeViewSet.list")
+        self.assertGreater(stats["queries"], 0)
+        self.assertGreater(stats["render_ms"], 0)
@@ -0,0 +1,192 @@
+"""
+Tests for the Prometheus metrics.
+"""
+
+import runpy
+import tempfile
+from decimal import Decimal
+from io import BytesIO
+from pathlib import Path
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core import metrics
+from core.authentication import get_token_cache
+from core.models import Recipe
+
+RECIPES_URL = reverse("recipe:recipe-list")
+METRICS_URL = reverse("metrics")
+
+
+def sample(name, **labels):
+    """Return the current value of a metric sample, 0 if not recorded yet."""
+    registry = metrics.prometheus_client.REGISTRY
+    return registry.get_sample_value(name, labels) or 0
+
+
+@skipUnless(metrics.prometheus_client, "prometheus_client is not installed")
+@override_settings(METRICS={"ENABLED": True})
+class MetricsTests(TestCase):
+    """Test the requests are recorded and exposed at /metrics."""
+
+    def setUp(self):
+        get_token_cache().clear()
+        self.user = get_user_model().objects.create_user("user@example.com")
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+
+    def test_request_metrics(self):
+        """Test the requests are counted and timed by URL name."""
+        labels = {"view": "recipe:recipe-list", "method": "GET", "status": "200"}
+        requests = sample("http_requests_total", **labels)
+        latencies = sample("http_request_duration_seconds_count", **labels)
+        queries = sample("http_request_db_queries_count", view="recipe:recipe-list")
+
+        self.client.get(RECIPES_URL)
+        self.client.get("/unknown/")
+
+        self.assertEqual(sample("http_requests_total", **labels), requests + 1)
+        self.assertEqual(
+            sample("http_request_duration_seconds_count", **labels), latencies + 1
+        )
+        self.assertEqual(
+            sample("http_request_db_queries_count", view="recipe:recipe-list"),
+            queries + 1,
+        )
+        self.assertGreater(
+            sample(
+                "http_requests_total",
+                view=metrics.UNRESOLVED,
+                method="GET",
+                status="404",
+            ),
+            0,
+        )
+
+    def test_auth_cache_metrics(self):
+        """Test the token cache hits and misses are counted."""
+        hits = sample("auth_token_cache_hits_total")
+        misses = sample("auth_token_cache_misses_total")
+
+        self.client.get(RECIPES_URL)
+        self.client.get(RECIPES_URL)
+
+        self.assertEqual(sample("auth_token_cache_misses_total"), misses + 1)
+        self.assertEqual(sample("auth_token_cache_hits_total"), hits + 1)
+
+    def test_image_upload_size(self):
+        """Test the size of the uploaded images is recorded."""
+        recipe = Recipe.objects.create(
+            user=self.user, title="Curry", time_minutes=30, price=Decimal("7.00")
+        )
+        url = reverse("recipe:recipe-upload-image", args=[recipe.id])
+        image_file = BytesIO()
+        Image.new("RGB", (10, 10)).save(image_file, format="JPEG")
+        image_file.name = "image.jpg"
+        size = len(image_file.getvalue())
+        image_file.seek(0)
+        uploads = sample("recipe_image_upload_bytes_count")
+        total = sample("recipe_image_upload_bytes_sum")
+
+        with tempfile.TemporaryDirectory() as media_root:
+            with override_settings(MEDIA_ROOT=media_root):
+                res = self.client.post(url, {"image": image_file}, format="multipart")
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(sample("recipe_image_upload_bytes_count"), uploads + 1)
+        self.assertEqual(sample("recipe_image_upload_bytes_sum"), total + size)
+
+    def test_metrics_view(self):
+        """Test the metrics are served in the Prometheus text format."""
+        self.client.get(RECIPES_URL)
+        staff = get_user_model().objects.create_user(
+            "staff@example.com", is_staff=True
+        )
+        client = APIClient()
+        client.force_login(staff)
+
+        res = client.get(METRICS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res["Content-Type"].startswith("text/plain"))
+        self.assertIn(b'http_requests_total{method="GET"', res.content)
+        self.assertIn(b"http_request_db_duration_seconds_bucket", res.content)
+
+    def test_metrics_view_forbidden(self):
+        """Test the metrics are not served to anonymous and non-staff users."""
+        res = APIClient().get(METRICS_URL)
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+        client = APIClient()
+        client.force_login(self.user)
+        res = client.get(METRICS_URL)
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+    @override_settings(METRICS={"ENABLED": True, "TOKEN": "secret"})
+    def test_metrics_view_token(self):
+        """Test the metrics are served to the holders of the token if one is set."""
+        client = APIClient()
+        res = client.get(METRICS_URL, HTTP_AUTHORIZATION="Bearer wrong")
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+        res = client.get(METRICS_URL, HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_metrics_multiprocess(self):
+        """Test the metrics of the processes are read from the shared directory."""
+        with tempfile.TemporaryDirectory() as directory:
+            with mock.patch.dict("os.environ", {"PROMETHEUS_MULTIPROC_DIR": directory}):
+                registry = metrics.get_registry()
+
+        self.assertIsNot(registry, metrics.prometheus_client.REGISTRY)
+
+    def test_dead_process_gauges_removed(self):
+        """Test the gunicorn child_exit hook drops the live gauges of a worker."""
+        child_exit = runpy.run_path(settings.BASE_DIR / "gunicorn.conf.py")[
+            "child_exit"
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            dead = Path(directory, "gauge_livesum_1234.db")
+            alive = Path(directory, "gauge_livesum_5678.db")
+            dead.touch()
+            alive.touch()
+            with mock.patch.dict("os.environ", {"PROMETHEUS_MULTIPROC_DIR": directory}):
+                child_exit(None, mock.Mock(pid=1234))
+
+            self.assertFalse(dead.exists())
+            self.assertTrue(alive.exists())
+
+    @override_settings(METRICS={"ENABLED": False})
+    def test_metrics_disabled(self):
+        """Test the metrics view is not found when disabled."""
+        res = self.client.get(METRICS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@skipUnless(metrics.prometheus_client, "prometheus_client is not installed")
+class CounterDeltasTests(TestCase):
+    """Test the process counters are added to the Prometheus counters."""
+
+    def test_counter_deltas(self):
+        """Test only the growth of a counter is added, including after a reset."""
+        counter = mock.Mock()
+        deltas = metrics.CounterDeltas()
+
+        deltas.inc(counter, "hits", 3)
+        deltas.inc(counter, "hits", 3)
+        deltas.inc(counter, "hits", 5)
+        deltas.inc(counter, "hits", 1)
+
+        self.assertEqual(
+            counter.inc.call_args_list, [mock.call(3), mock.call(2), mock.call(1)]
+        )
@@ -0,0 +1,136 @@
+"""
+Tests for the compression middleware.
+"""
+
+import gzip
+import json
+import zlib
+from unittest import skipUnless
+
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import SimpleTestCase, override_settings
+from django.test.client import RequestFactory
+
+from core import middleware
+
+COMPRESSION = {
+    "MIN_SIZE": 100,
+    "LEVELS": {"application/json": {"gzip": 9, "br": 4}},
+}
+CONTENT = json.dumps([{"id": i, "title": f"Recipe {i}"} for i in range(100)]).encode()
+
+
+@override_settings(COMPRESSION=COMPRESSION)
+class CompressionMiddlewareTests(SimpleTestCase):
+    """Test the responses are compressed when the client accepts it."""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def process(self, response, accept_encoding="gzip"):
+        """Run a response through the middleware."""
+        request = self.factory.get("/", HTTP_ACCEPT_ENCODING=accept_encoding)
+        return middleware.CompressionMiddleware(lambda request: response)(request)
+
+    def test_get_encoding(self):
+        """Test the accepted encodings are negotiated by quality."""
+        cases = [
+            ("", None),
+            ("gzip, deflate", "gzip"),
+            ("GZIP;q=0.5", "gzip"),
+            ("gzip;q=0", None),
+            ("deflate, *;q=0.1", "br" if middleware.brotli else "gzip"),
+            ("br;q=1, gzip;q=0.8", "br" if middleware.brotli else "gzip"),
+            ("gzip;q=invalid", None),
+        ]
+        for accept_encoding, expected in cases:
+            with self.subTest(accept_encoding=accept_encoding):
+                request = self.factory.get(
+                    "/", HTTP_ACCEPT_ENCODING=accept_encoding
+                )
+                self.assertEqual(middleware.get_encoding(request), expected)
+
+    def test_compress_response(self):
+        """Test large responses are gzipped with an ETag of the encoding."""
+        response = HttpResponse(CONTENT, content_type="application/json")
+        response["ETag"] = '"v1"'
+
+        response = self.process(response)
+
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(response["Vary"], "Accept-Encoding")
+        self.assertEqual(response["ETag"], '"v1-gzip"')
+        self.assertEqual(int(response["Content-Length"]), len(response.content))
+        self.assertLess(len(response.content), len(CONTENT))
+        self.assertEqual(gzip.decompress(response.content), CONTENT)
+
+    def test_strip_etag_encodings(self):
+        """Test the conditional headers are compared with the identity ETags."""
+        request = self.factory.get(
+            "/", HTTP_IF_MATCH='"v1-gzip"', HTTP_IF_NONE_MATCH='"v1-br", "v2"'
+        )
+
+        self.assertEqual(middleware.strip_etag_encodings(request), "br")
+        self.assertEqual(request.META["HTTP_IF_MATCH"], '"v1"')
+        self.assertEqual(request.META["HTTP_IF_NONE_MATCH"], '"v1", "v2"')
+
+    def test_not_modified_keeps_etag_encoding(self):
+        """Test a 304 of a compressed response has the ETag of the client."""
+        request = self.factory.get("/", HTTP_IF_NONE_MATCH='"v1-gzip"')
+
+        def get_response(request):
+            response = HttpResponse(status=304)
+            response["ETag"] = (
+                '"v1"' if request.META["HTTP_IF_NONE_MATCH"] == '"v1"' else '"v2"'
+            )
+            return response
+
+        response = middleware.CompressionMiddleware(get_response)(request)
+
+        self.assertEqual(response["ETag"], '"v1-gzip"')
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+    def test_not_compressed(self):
+        """Test small, already encoded and other content types aren't compressed."""
+        encoded = HttpResponse(CONTENT, content_type="application/json")
+        encoded["Content-Encoding"] = "identity"
+        responses = [
+            HttpResponse(b"{}", content_type="application/json"),
+            HttpResponse(CONTENT, content_type="image/jpeg"),
+            encoded,
+        ]
+        for response in responses:
+            with self.subTest(response=response):
+                response = self.process(response)
+                self.assertNotEqual(response.get("Content-Encoding"), "gzip")
+
+        response = self.process(
+            HttpResponse(CONTENT, content_type="application/json"), "identity"
+        )
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(response["Vary"], "Accept-Encoding")
+
+    def test_compress_streaming_response(self):
+        """Test the chunks of streaming responses are compressed as they come."""
+        chunks = [CONTENT[:1000], CONTENT[1000:]]
+        response = StreamingHttpResponse(iter(chunks), content_type="application/json")
+
+        response = self.process(response)
+
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        compressed = iter(response.streaming_content)
+        first = next(compressed)
+        # The first chunk can be decompressed before the stream ends
+        decompressor = zlib.decompressobj(31)
+        self.assertEqual(decompressor.decompress(first), chunks[0])
+        self.assertEqual(gzip.decompress(first + b"".join(compressed)), CONTENT)
+
+    @skipUnless(middleware.brotli, "brotli is not installed")
+    def test_compress_brotli(self):
+        """Test brotli is preferred when the client accepts it."""
+        response = HttpResponse(CONTENT, content_type="application/json")
+
+        response = self.process(response, "gzip, br")
+
+        self.assertEqual(response["Content-Encoding"], "br")
+        self.assertEqual(middleware.brotli.decompress(response.content), CONTENT)
@@ -0,0 +1,112 @@
+"""
+Tests for the request profiling.
+"""
+
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core.exceptions import MiddlewareNotUsed
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.authentication import get_token_cache
+from core.middleware import ProfilingMiddleware
+
+RECIPES_URL = reverse("recipe:recipe-list")
+
+
+class ProfilingMiddlewareTests(TestCase):
+    """Test the requests are profiled on demand and sampled."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("user@example.com")
+        get_token_cache().clear()
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def profiling(self, **config):
+        """Override the PROFILING setting, saving to the temporary directory."""
+        return override_settings(
+            PROFILING={"DIRECTORY": self.directory.name, "MAX_FILES": 2, **config}
+        )
+
+    def saved_profiles(self):
+        return sorted(Path(self.directory.name).glob("*.prof"))
+
+    def test_profile_on_demand_for_staff(self):
+        """Test staff users get the profile report of their request."""
+        self.user.is_staff = True
+        self.user.save()
+
+        with self.profiling(ON_DEMAND=True):
+            res = self.client.get(RECIPES_URL, HTTP_X_PROFILE="tottime")
+
+        self.assertEqual(res["Content-Type"], "text/plain")
+        self.assertEqual(res["X-Profile-Status"], "200")
+        self.assertIn("function calls", res.content.decode())
+        self.assertIn("Ordered by: internal time", res.content.decode())
+        profiles = self.saved_profiles()
+        self.assertEqual(len(profiles), 1)
+        self.assertIn("recipe-recipe-list", profiles[0].name)
+
+    def test_profile_async_request(self):
+        """Test the views are profiled under ASGI, where they run in another
+        thread than the middleware."""
+        self.user.is_staff = True
+        self.user.save()
+
+        with self.profiling(ON_DEMAND=True):
+            res = async_to_sync(self.async_client.get)(
+                f"{RECIPES_URL}?profile=cumulative",
+                authorization=f"Token {self.token.key}",
+            )
+
+        self.assertEqual(res["X-Profile-Status"], "200")
+        self.assertIn("rest_framework/viewsets.py", res.content.decode())
+
+    def test_profile_on_demand_staff_only(self):
+        """Test other users get their response unchanged, without profiling."""
+        with self.profiling(ON_DEMAND=True):
+            with mock.patch("cProfile.Profile") as profile:
+                res = self.client.get(RECIPES_URL, {"profile": "1"})
+
+        profile.assert_not_called()
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res["Content-Type"], "application/json")
+        self.assertEqual(self.saved_profiles(), [])
+
+    def test_profile_on_demand_invalid_token(self):
+        """Test a request with an invalid token isn't profiled."""
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION="Token invalid")
+
+        with self.profiling(ON_DEMAND=True):
+            with mock.patch("cProfile.Profile") as profile:
+                res = client.get(RECIPES_URL, HTTP_X_PROFILE="tottime")
+
+        profile.assert_not_called()
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_sampled_profiles_rotated(self):
+        """Test sampled requests are saved, keeping the newest profiles."""
+        with self.profiling(SAMPLE_RATE=1):
+            for _ in range(3):
+                res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res["Content-Type"], "application/json")
+        self.assertEqual(len(self.saved_profiles()), 2)
+
+    def test_disabled(self):
+        """Test the middleware isn't used when disabled."""
+        with self.profiling(ON_DEMAND=False, SAMPLE_RATE=0):
+            with self.assertRaises(MiddlewareNotUsed):
+                ProfilingMiddleware(lambda request: None)
@@ -0,0 +1,150 @@
+"""
+Tests for the renderers and parsers of the REST APIs.
+"""
+
+import io
+from collections import OrderedDict
+from datetime import datetime, timezone
+from decimal import Decimal
+from unittest import mock, skipUnless
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from django.utils.translation import gettext_lazy
+from rest_framework import status
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from core import parsers, renderers
+from core.models import Recipe
+
+RECIPES_URL = reverse("recipe:recipe-list")
+
+DATA = OrderedDict(
+    [
+        ("id", 1),
+        ("title", "Curry\u2028\u2029 café"),
+        ("price", "5.00"),
+        ("cost", Decimal("1.10")),
+        ("created", datetime(2021, 1, 1, 12, 30, 15, 123456, tzinfo=timezone.utc)),
+        ("label", gettext_lazy("Recipe")),
+        ("tags", [{"id": 1, "name": "Thai"}]),
+        ("image", None),
+        (1, True),
+    ]
+)
+
+
+class FastJSONTests(TestCase):
+    """Test the fast JSON renderer and parser."""
+
+    def test_render_same_as_json_renderer(self):
+        """Test the rendered JSON is the same as with DRF's renderer."""
+        expected = JSONRenderer().render(DATA)
+
+        self.assertEqual(renderers.FastJSONRenderer().render(DATA), expected)
+        with mock.patch("core.renderers.orjson", None):
+            self.assertEqual(renderers.FastJSONRenderer().render(DATA), expected)
+
+    def test_render_indent(self):
+        """Test the indent of the media type is honored."""
+        media_type = "application/json; indent=2"
+
+        content = renderers.FastJSONRenderer().render(DATA, media_type)
+
+        self.assertEqual(content, JSONRenderer().render(DATA, media_type))
+
+    def test_render_file_url(self):
+        """Test model files are rendered by URL."""
+        recipe = Recipe(image="uploads/recipe/x.jpg")
+
+        content = renderers.FastJSONRenderer().render({"image": recipe.image})
+
+        self.assertEqual(content, b'{"image":"/static/media/uploads/recipe/x.jpg"}')
+
+    def test_parse(self):
+        """Test parsing JSON, with and without orjson."""
+        content = b'{"title": "Caf\xc3\xa9", "price": "5.00", "tags": []}'
+        expected = {"title": "Café", "price": "5.00", "tags": []}
+
+        parser = parsers.FastJSONParser()
+        self.assertEqual(parser.parse(io.BytesIO(content)), expected)
+        with mock.patch("core.parsers.orjson", None):
+            self.assertEqual(parser.parse(io.BytesIO(content)), expected)
+
+    def test_parse_error(self):
+        """Test invalid and non-strict JSON are rejected."""
+        parser = parsers.FastJSONParser()
+
+        for content in (b'{"title": ', b'{"price": NaN}'):
+            with self.subTest(content=content):
+                with self.assertRaises(ParseError):
+                    parser.parse(io.BytesIO(content))
+
+
+@skipUnless(renderers.msgpack, "msgpack is not installed")
+class MessagePackTests(TestCase):
+    """Test the MessagePack renderer and parser."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("user@example.com")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_round_trip(self):
+        """Test the rendered data parses to the JSON values."""
+        # Like in JSON, the parsed map keys must be strings
+        string_keys = OrderedDict((k, v) for k, v in DATA.items() if k != 1)
+        content = renderers.MessagePackRenderer().render(string_keys)
+
+        data = parsers.MessagePackParser().parse(io.BytesIO(content))
+
+        self.assertEqual(data, renderers.msgpack.unpackb(content, raw=False))
+        self.assertEqual(data["price"], "5.00")
+        self.assertEqual(data["cost"], 1.1)
+        self.assertEqual(data["created"], "2021-01-01T12:30:15.123456Z")
+
+    def test_parse_error(self):
+        """Test invalid MessagePack raises a parse error."""
+        packb = renderers.msgpack.packb
+        parser = parsers.MessagePackParser()
+        for content in (
+            packb({"title": "Curry"})[:-2],  # truncated
+            packb({"title": "Curry"}) + b"\x01",  # extra data
+            b"\xc1",  # reserved
+            packb({1: "Curry"}),  # not a string key
+            b"\x81\x91\x01\x02",  # {[1]: 2}, an unhashable key
+        ):
+            with self.subTest(content=content):
+                with self.assertRaises(ParseError):
+                    parser.parse(io.BytesIO(content))
+
+    def test_invalid_payload_bad_request(self):
+        """Test an invalid MessagePack payload returns 400."""
+        res = self.client.post(
+            RECIPES_URL, b"\x81\x91\x01\x02", content_type="application/msgpack"
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_create_and_list_recipes(self):
+        """Test writing and reading recipes in MessagePack."""
+        payload = {"title": "Curry", "time_minutes": 30, "price": "7.50"}
+        res = self.client.post(
+            RECIPES_URL,
+            renderers.MessagePackRenderer().render(payload),
+            content_type="application/msgpack",
+            HTTP_ACCEPT="application/msgpack",
+        )
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+
+        res = self.client.get(RECIPES_URL, HTTP_ACCEPT="application/msgpack")
+
+        self.assertEqual(res["Content-Type"], "application/msgpack")
+        data = renderers.msgpack.unpackb(res.content, raw=False)
+        recipe = data["results"][0]
+        self.assertEqual(recipe["title"], "Curry")
+        self.assertEqual(recipe["price"], "7.50")
+        self.assertIsNone(recipe["image_thumbnail"])
@@ -0,0 +1,175 @@
+"""
+Tests for the routing of the reads to the read replicas
+"""
+
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import connections
+from django.db.utils import OperationalError
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core import replicas
+from core.models import Tag
+from recipe.views import TagViewSet
+
+TAGS_URL = reverse("recipe:tag-list")
+
+
+class ReplicaRouterTests(TestCase):
+    """Test the database router."""
+
+    def setUp(self):
+        replicas._down_until.clear()
+        self.router = replicas.ReplicaRouter()
+
+    def tearDown(self):
+        replicas.set_read_replica(None)
+
+    def test_reads_of_flagged_requests_go_to_replica(self):
+        """Test only the reads go to the replica of the request."""
+        self.assertIsNone(self.router.db_for_read(Tag))
+
+        replicas.set_read_replica("replica_1")
+
+        self.assertEqual(self.router.db_for_read(Tag), "replica_1")
+        self.assertEqual(self.router.db_for_write(Tag), "default")
+
+    @override_settings(REPLICA_DATABASES=["replica_1"])
+    def test_no_migrations_on_replicas(self):
+        """Test the replicas are not migrated, they are replicated."""
+        self.assertTrue(self.router.allow_migrate("default", "core"))
+        self.assertFalse(self.router.allow_migrate("replica_1", "core"))
+
+    @override_settings(REPLICA_DATABASES=["missing"], REPLICA_RETRY_SECONDS=30)
+    def test_unreachable_replica_skipped(self):
+        """Test a replica that can't be connected to is skipped for a while."""
+        self.assertIsNone(replicas.choose_replica())
+
+        self.assertIn("missing", replicas._down_until)
+        with patch.object(connections, "__getitem__") as getitem:
+            self.assertIsNone(replicas.choose_replica())
+        getitem.assert_not_called()
+
+
+class ReplicaReadMixinTests(TestCase):
+    """Test the recipe APIs choose the database per request."""
+
+    def setUp(self):
+        caches["default"].clear()
+        replicas._down_until.clear()
+        self.user = get_user_model().objects.create_user(
+            email="user@example.com", password="testpass123"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    @patch("core.replicas.choose_replica", return_value="default")
+    def test_reads_after_write_pinned_to_primary(self, choose_replica):
+        """Test a user reads from the primary for a while after a write."""
+        res = self.client.get(TAGS_URL)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(choose_replica.call_count, 1)
+        self.assertIsNone(replicas.get_read_replica())  # reset after the request
+
+        tag = Tag.objects.create(user=self.user, name="Vegan")
+        url = reverse("recipe:tag-detail", args=[tag.id])
+        self.client.patch(url, {"name": "Vegetarian"})
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.data[0]["name"], "Vegetarian")
+        self.assertEqual(choose_replica.call_count, 1)
+        self.assertTrue(replicas.is_pinned_to_primary(self.user.id))
+
+    def test_pinned_after_write_committed(self):
+        """Test the pin starts again when the write commits, e.g., after a
+        write that lasted longer than the pin."""
+        tag = Tag.objects.create(user=self.user, name="Vegan")
+        url = reverse("recipe:tag-detail", args=[tag.id])
+        update = TagViewSet.perform_update
+
+        def slow_update(view, serializer):
+            update(view, serializer)
+            caches["default"].clear()  # the pin expired during the write
+
+        with patch.object(TagViewSet, "perform_update", slow_update):
+            with self.captureOnCommitCallbacks(execute=True):
+                res = self.client.patch(url, {"name": "Vegetarian"})
+                self.assertFalse(replicas.is_pinned_to_primary(self.user.id))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(replicas.is_pinned_to_primary(self.user.id))
+
+    def test_failed_write_not_pinned_again(self):
+        """Test an invalid write doesn't pin the user again."""
+        tag = Tag.objects.create(user=self.user, name="Vegan")
+        url = reverse("recipe:tag-detail", args=[tag.id])
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            res = self.client.patch(url, {"name": ""})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(callbacks, [])
+
+    @override_settings(REPLICA_DATABASES=["default"])
+    def test_failed_replica_read_retried_on_primary(self):
+        """Test a request failing on its replica is retried on the primary."""
+        Tag.objects.create(user=self.user, name="Vegan")
+        get_queryset = TagViewSet.get_queryset
+        reads = []
+
+        def failing_get_queryset(view):
+            reads.append(replicas.get_read_replica())
+            if len(reads) == 1:
+                raise OperationalError("replica went away")
+            return get_queryset(view)
+
+        with patch.object(TagViewSet, "get_queryset", failing_get_queryset):
+            res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(reads, ["default", None])
+        self.assertIn("default", replicas._down_until)
+
+    @override_settings(REPLICA_DATABASES=["missing"])
+    def test_failover_to_primary(self):
+        """Test the reads go to the primary when no replica is reachable."""
+        Tag.objects.create(user=self.user, name="Vegan")
+
+        res = self.client.get(TAGS_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data), 1)
+
+
+@skipUnless(settings.REPLICA_DATABASES, "No replica configured (DB_REPLICA_HOST)")
+class ReplicaDatabaseTests(TransactionTestCase):
+    """Test the reads with a replica alias (a test mirror of default)."""
+
+    databases = {"default", *settings.REPLICA_DATABASES}
+
+    def test_list_read_from_replica(self):
+        """Test the tags are listed with the replica connection."""
+        caches["default"].clear()
+        user = get_user_model().objects.create_user(
+            email="user@example.com", password="testpass123"
+        )
+        Tag.objects.create(user=user, name="Vegan")
+        client = APIClient()
+        client.force_authenticate(user)
+        alias = settings.REPLICA_DATABASES[0]
+
+        with patch("core.replicas.choose_replica", return_value=alias):
+            with CaptureQueriesContext(connections[alias]) as queries:
+                res = client.get(TAGS_URL)
+
+        self.assertEqual(res.data[0]["name"], "Vegan")
+        self.assertTrue(queries.captured_queries)
@@ -0,0 +1,26 @@
+"""
+Views of the project outside of the APIs
+"""
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+from core.metrics import is_enabled, render_metrics
+
+
+def metrics(request):
+    """Expose the Prometheus metrics of all the worker processes.
+    Requires a logged in staff user or, for the scrapers, Authorization:
+    Bearer <METRICS["TOKEN"]> if a token is set.
+    """
+    if not is_enabled():
+        raise Http404
+    token = getattr(settings, "METRICS", {}).get("TOKEN")
+    auth = request.META.get("HTTP_AUTHORIZATION", "")
+    if not request.user.is_staff and not (
+        token and constant_time_compare(auth, f"Bearer {token}")
+    ):
+        return HttpResponseForbidden()
+    content, content_type = render_metrics()
+    return HttpResponse(content, content_type=content_type)
@@ -0,0 +1,11 @@
+"""
+gunicorn settings, read from the working directory, e.g.,
+gunicorn app.wsgi or gunicorn -k uvicorn.workers.UvicornWorker app.asgi
+"""
+
+from core import metrics
+
+
+def child_exit(server, worker):
+    """Stop counting the live Prometheus gauges of an exited worker."""
+    metrics.mark_process_dead(worker.pid)
@@ -0,0 +1,64 @@
+"""
+Prefix and typo tolerant autocomplete over tag/ingredient names
+"""
+
+from difflib import SequenceMatcher
+
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+
+AUTOCOMPLETE_LIMIT = 10
+AUTOCOMPLETE_MAX_LIMIT = 50
+# Minimum similarity of a name to the typed text, without pg_trgm
+FALLBACK_THRESHOLD = 0.7
+
+
+def _prefix_first(queryset, text):
+    return queryset.annotate(
+        is_prefix=Case(
+            When(name__istartswith=text, then=Value(1)),
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+    )
+
+
+def autocomplete(queryset, text, limit=AUTOCOMPLETE_LIMIT):
+    """Return the first limit names of queryset starting with or similar to
+    text, prefix matches first.
+    e.g., autocomplete(Tag.objects.filter(user=user), "veg") -> Vegan, Veggie
+    """
+    if connection.vendor == "postgresql":
+        # Both the ILIKE prefix and the % similarity operator use the
+        # gin_trgm_ops indexes on name
+        queryset = (
+            _prefix_first(queryset, text)
+            .filter(Q(name__istartswith=text) | Q(name__trigram_similar=text))
+            .annotate(similarity=TrigramSimilarity("name", text))
+            .order_by("-is_prefix", "-similarity", "name")
+        )
+        return queryset[:limit]
+
+    # Without pg_trgm (e.g., SQLite) the names are ranked in memory
+    text = text.lower()
+    scores = []
+    for pk, name in queryset.values_list("id", "name").order_by():
+        name = name.lower()
+        is_prefix = name.startswith(text)
+        # A typo in the typed text is compared with the start of the name
+        similarity = max(
+            SequenceMatcher(None, text, name).ratio(),
+            SequenceMatcher(None, text, name[: len(text)]).ratio(),
+        )
+        if is_prefix or similarity >= FALLBACK_THRESHOLD:
+            scores.append((not is_prefix, -similarity, name, pk))
+    ids = [pk for *_, pk in sorted(scores)[:limit]]
+    if not ids:
+        return queryset.none()
+    return queryset.filter(pk__in=ids).order_by(
+        Case(
+            *[When(pk=pk, then=Value(pos)) for pos, pk in enumerate(ids)],
+            output_field=IntegerField(),
+        )
+    )
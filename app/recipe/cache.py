@@ -0,0 +1,150 @@
+"""
+Per-user response cache for the recipe list APIs
+"""
+
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from rest_framework.response import Response
+
+from core.middleware import get_encoding, set_content_encoding
+
+
+def _get_cache():
+    """Return the Django cache used for the list responses."""
+    return caches[getattr(settings, "LIST_CACHE_ALIAS", "default")]
+
+
+def _version_key(user_id):
+    return f"recipe-data-version:{user_id}"
+
+
+def get_data_version(user_id):
+    """Return the current version of the recipe data of a user."""
+    cache = _get_cache()
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        # Start from the clock so an evicted version is never reused
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def _bump(user_id):
+    cache = _get_cache()
+    try:
+        cache.incr(_version_key(user_id))
+    except ValueError:  # the version is not in the cache
+        cache.set(_version_key(user_id), time.time_ns(), timeout=None)
+
+
+def bump_data_version(user_id):
+    """Invalidate all the cached list responses of a user.
+    The version is bumped again on commit, so that a response cached by a
+    concurrent request before the transaction was committed is never served.
+    """
+    _bump(user_id)
+    transaction.on_commit(lambda: _bump(user_id))
+
+
+def list_cache_key(request, user_id=None):
+    """Build the cache key for a list request of a user, by default the
+    authenticated one. e.g., user 1, /api/recipe/recipes/?tags=2,1&match=all
+    """
+    if user_id is None:
+        user_id = request.user.pk
+    # Normalize the query params so that the order doesn't matter
+    params = sorted(
+        (key, value) for key, values in request.GET.lists() for value in values
+    )
+    version = get_data_version(user_id)
+    raw = f"{request.get_host()}{request.path}?{params}"
+    digest = hashlib.md5(raw.encode()).hexdigest()
+    return f"recipe-list:{user_id}:{version}:{digest}"
+
+
+def list_etag(key, renderer_format="json"):
+    """Return the ETag of a cached list response rendered in a format.
+    The key changes with the data version, so it is a cheap validator.
+    """
+    return f'"{hashlib.md5(f"{key}:{renderer_format}".encode()).hexdigest()}"'
+
+
+def get_cached_list(key):
+    """Return the cached data of a list response, or None."""
+    return _get_cache().get(key)
+
+
+def _compressed_key(key, renderer_format, encoding):
+    return f"{key}:{renderer_format}:{encoding}"
+
+
+def get_compressed_list_response(request, key, renderer, etag):
+    """Return the cached list response compressed in the best encoding accepted
+    by the request, or None.
+    """
+    encoding = get_encoding(request)
+    if encoding is None:
+        return None
+    content = _get_cache().get(_compressed_key(key, renderer.format, encoding))
+    if content is None:
+        return None
+    content_type = renderer.media_type
+    if renderer.charset:
+        content_type = f"{content_type}; charset={renderer.charset}"
+    response = HttpResponse(content, content_type=content_type)
+    response["ETag"] = etag
+    set_content_encoding(response, encoding)
+    return response
+
+
+def compressed_list_saver(key, renderer_format):
+    """Return the save_compressed callback of CompressionMiddleware for a list
+    response, so that the next requests don't compress it again."""
+
+    def save_compressed(encoding, content):
+        timeout = getattr(settings, "LIST_CACHE_TIMEOUT", 300)
+        key_of_encoding = _compressed_key(key, renderer_format, encoding)
+        _get_cache().set(key_of_encoding, content, timeout)
+
+    return save_compressed
+
+
+class CachedListMixin:
+    """Serve the list action from the cache while the user's data is unchanged.
+
+    Cached entries are keyed by (user, endpoint, query params, data version);
+    the version is bumped by recipe.signals on every write of the user's
+    recipes, tags and ingredients, so stale data is never returned.
+    """
+
+    def list(self, request, *args, **kwargs):
+        key = list_cache_key(request)
+        renderer = request.accepted_renderer
+        etag = list_etag(key, renderer.format)
+        not_modified = get_conditional_response(request._request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+
+        response = get_compressed_list_response(request._request, key, renderer, etag)
+        if response is not None:
+            return response
+
+        data = get_cached_list(key)
+        if data is not None:
+            response = Response(data)
+        else:
+            response = super().list(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            timeout = getattr(settings, "LIST_CACHE_TIMEOUT", 300)
+            _get_cache().set(key, response.data, timeout)
+        response["ETag"] = etag
+        response.save_compressed = compressed_list_saver(key, renderer.format)
+        return response
@@ -0,0 +1,69 @@
+"""
+Conditional requests (ETag / Last-Modified) for the recipe detail API
+"""
+
+from django.db import router, transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+
+def recipe_etag(recipe_id, updated_at):
+    """Return the (strong) ETag of a recipe version."""
+    return f'"{recipe_id}-{int(updated_at.timestamp() * 1_000_000)}"'
+
+
+class ConditionalRecipeMixin:
+    """Answer If-None-Match / If-Modified-Since with 304 and If-Match /
+    If-Unmodified-Since with 412 from the recipe's updated_at, without loading
+    or serializing the recipe.
+    """
+
+    def _check_preconditions(self, request, lock=False):
+        """Return a 304/412 response if a precondition applies, else None.
+        With lock, the recipe row stays locked until the end of the transaction.
+        """
+        pk = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        queryset = self.get_queryset().prefetch_related(None).filter(pk=pk)
+        if lock:
+            queryset = queryset.select_for_update(of=("self",))
+        try:
+            updated_at = queryset.values_list("updated_at", flat=True).first()
+        except (TypeError, ValueError):
+            updated_at = None
+        if updated_at is None:  # let the view return 404
+            return None
+        return get_conditional_response(
+            request._request,
+            etag=recipe_etag(pk, updated_at),
+            last_modified=int(updated_at.timestamp()),
+        )
+
+    def _set_validators(self, response, recipe):
+        response["ETag"] = recipe_etag(recipe.pk, recipe.updated_at)
+        response["Last-Modified"] = http_date(recipe.updated_at.timestamp())
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        response = self._check_preconditions(request)
+        if response is not None:
+            return response
+        instance = self.get_object()
+        serializer = self.get_serializer(instance)
+        return self._set_validators(Response(serializer.data), instance)
+
+    def update(self, request, *args, **kwargs):
+        # e.g., PATCH with If-Match fails with 412 if the recipe was changed.
+        # The row is locked from the check to the write, so that two updates
+        # with the same ETag can't both pass the check.
+        using = router.db_for_write(self.get_queryset().model)
+        with transaction.atomic(using=using):
+            response = self._check_preconditions(request, lock=True)
+            if response is not None:
+                return response
+            response = super().update(request, *args, **kwargs)
+        return self._set_validators(response, self._updated_instance)
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        self._updated_instance = serializer.instance
@@ -0,0 +1,67 @@
+"""
+Number of recipes using each tag/ingredient, stored on the tag/ingredient
+"""
+
+from collections import defaultdict
+
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from core.models import Recipe
+
+
+def add_recipe_counts(model, deltas):
+    """Add to the recipe counts of tags/ingredients, one update per distinct
+    delta. The counts don't go below 0 if they drifted, reconcile_recipe_counts()
+    fixes them.
+    e.g., add_recipe_counts(Tag, {1: 2, 3: -1})
+    """
+    ids_by_delta = defaultdict(list)
+    for pk, delta in deltas.items():
+        if delta:
+            ids_by_delta[delta].append(pk)
+    for delta, ids in ids_by_delta.items():
+        count = F("recipe_count") + delta
+        if delta < 0:
+            count = Greatest(count, 0)
+        model.objects.filter(pk__in=ids).update(recipe_count=count)
+
+
+def count_links(through, attr, **filters):
+    """Count the links of each tag/ingredient in the through table.
+    e.g., count_links(Recipe.tags.through, "tag", recipe_id__in=[1, 2])
+    """
+    links = (
+        through.objects.filter(**filters)
+        .values_list(f"{attr}_id")
+        .annotate(total=Count("pk"))
+        .order_by()
+    )
+    return dict(links)
+
+
+def reconcile_recipe_counts(model, attr, queryset=None):
+    """Recount the recipes of the tags/ingredients whose count drifted.
+    Returns the ids of the fixed tags/ingredients.
+    """
+    through = getattr(Recipe, f"{attr}s").through
+    actual = Coalesce(
+        Subquery(
+            through.objects.filter(**{attr: OuterRef("pk")})
+            .order_by()
+            .values(attr)
+            .annotate(total=Count("pk"))
+            .values("total")
+        ),
+        Value(0),
+    )
+    if queryset is None:
+        queryset = model.objects.all()
+    drifted = list(
+        queryset.annotate(actual=actual)
+        .exclude(recipe_count=F("actual"))
+        .values_list("pk", flat=True)
+    )
+    if drifted:
+        model.objects.filter(pk__in=drifted).update(recipe_count=actual)
+    return drifted
@@ -0,0 +1,228 @@
+"""
+Normalization and derivatives (thumbnail, medium) of the recipe images
+"""
+
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from PIL import Image, ImageOps, features
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIZES = {"thumbnail": (150, 150), "medium": (600, 600)}
+
+
+def _get_config():
+    return getattr(settings, "RECIPE_IMAGE_DERIVATIVES", {})
+
+
+class ImageNormalizationError(ValueError):
+    """The uploaded image can't be normalized."""
+
+
+def normalize_image(upload):
+    """Downscale an uploaded image, apply and strip its metadata and re-encode
+    it as configured by RECIPE_IMAGE_NORMALIZATION.
+    e.g., 4032x3024 JPEG with EXIF -> 2048x1536 WebP without metadata
+    """
+    config = getattr(settings, "RECIPE_IMAGE_NORMALIZATION", {})
+    if not config.get("ENABLED", True):
+        return upload
+
+    upload.seek(0)
+    try:
+        # Only the header is read here, the pixels are decoded on load()
+        image = Image.open(upload)
+    except (OSError, Image.DecompressionBombError) as error:
+        raise ImageNormalizationError("Invalid image file.") from error
+
+    with image:
+        width, height = image.size
+        if width * height > config.get("MAX_PIXELS", 40_000_000):
+            raise ImageNormalizationError("Image has too many pixels.")
+        image = ImageOps.exif_transpose(image)  # apply the EXIF orientation
+        max_dimension = config.get("MAX_DIMENSION", 2048)
+        image.thumbnail((max_dimension, max_dimension))  # keeps the aspect ratio
+
+        image_format = config.get("FORMAT", "WEBP")
+        if image_format == "WEBP" and not features.check("webp"):
+            image_format = "JPEG"
+        if image_format == "JPEG" or image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGB" if image_format == "JPEG" else "RGBA")
+
+        buffer = io.BytesIO()
+        # The metadata (EXIF, ICC, ...) isn't copied unless it is passed to save()
+        image.save(buffer, format=image_format, quality=config.get("QUALITY", 80))
+
+    extension = ".webp" if image_format == "WEBP" else ".jpg"
+    name = os.path.splitext(upload.name)[0] + extension
+    return SimpleUploadedFile(
+        name, buffer.getvalue(), content_type=f"image/{image_format.lower()}"
+    )
+
+
+def render_derivatives(source, sizes, quality=85):
+    """Render a JPEG of each size fitting in (width, height) from an image.
+    e.g., {"thumbnail": (150, 150)} -> {"thumbnail": b"<jpeg bytes>"}
+    Runs in the worker processes, so it must not touch Django.
+    """
+    renditions = {}
+    with Image.open(source) as image:
+        image = image.convert("RGB")
+        for name, size in sizes.items():
+            rendition = image.copy()
+            rendition.thumbnail(size)  # keeps the aspect ratio
+            buffer = io.BytesIO()
+            rendition.save(buffer, format="JPEG", quality=quality, optimize=True)
+            renditions[name] = buffer.getvalue()
+    return renditions
+
+
+def _derivative_name(original_name, size_name):
+    """e.g., uploads/recipe/<uuid>.png -> uploads/recipe/<uuid>_thumbnail.jpg"""
+    base = os.path.splitext(original_name)[0]
+    return f"{base}_{size_name}.jpg"
+
+
+def save_derivatives(recipe_id, user_id, original_name, renditions):
+    """Store the rendered derivatives and attach them to the recipe."""
+    # Imported here to keep this module importable by the worker processes
+    from core.models import Recipe
+    from recipe.cache import bump_data_version
+
+    fields = {
+        f"image_{size_name}": default_storage.save(
+            _derivative_name(original_name, size_name), ContentFile(data)
+        )
+        for size_name, data in renditions.items()
+    }
+    # Only attach them if the image wasn't replaced in the meantime
+    updated = Recipe.objects.filter(pk=recipe_id, image=original_name).update(
+        updated_at=timezone.now(), **fields
+    )
+    if updated:
+        bump_data_version(user_id)
+    else:
+        for name in fields.values():
+            default_storage.delete(name)
+
+
+def derivative_names(recipe):
+    """Return the stored names of the derivatives of a recipe image."""
+    fields = (recipe.image_thumbnail, recipe.image_medium)
+    return [field.name for field in fields if field]
+
+
+def delete_on_commit(names):
+    """Delete stored files once the transaction replacing them commits, e.g.,
+    the derivatives of a replaced image."""
+    if not names:
+        return
+
+    def delete():
+        for name in names:
+            default_storage.delete(name)
+
+    transaction.on_commit(delete)
+
+
+_executor = None
+_saver = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=_get_config().get("WORKERS", 2)
+            )
+        return _executor
+
+
+def _reset_executor(executor):
+    """Drop a broken pool (e.g., a worker was killed), the next call of
+    _get_executor() starts a new one."""
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False)
+
+
+def _get_saver():
+    """Return the threads saving the derivatives, with their own DB connections
+    (not the internal thread of the process pool running the callbacks)."""
+    global _saver
+    with _executor_lock:
+        if _saver is None:
+            _saver = ThreadPoolExecutor(
+                max_workers=_get_config().get("WORKERS", 2),
+                thread_name_prefix="recipe-image-save",
+            )
+        return _saver
+
+
+def _submit(func, *args, **kwargs):
+    """Submit func to the process pool, in a new pool if it is broken.
+    Returns the pool and the future of the call."""
+    executor = _get_executor()
+    try:
+        return executor, executor.submit(func, *args, **kwargs)
+    except BrokenProcessPool:
+        _reset_executor(executor)
+        executor = _get_executor()
+        return executor, executor.submit(func, *args, **kwargs)
+
+
+def schedule_derivatives(recipe):
+    """Generate the derivatives of the recipe image off the request path.
+    With RECIPE_IMAGE_DERIVATIVES["ASYNC"] = False they are generated inline.
+    """
+    config = _get_config()
+    args = (recipe.image.path, config.get("SIZES", DEFAULT_SIZES))
+    kwargs = {"quality": config.get("QUALITY", 85)}
+    recipe_id, user_id, original_name = recipe.pk, recipe.user_id, recipe.image.name
+
+    if not config.get("ASYNC", True):
+        renditions = render_derivatives(*args, **kwargs)
+        save_derivatives(recipe_id, user_id, original_name, renditions)
+        return
+
+    def save(executor, future):
+        try:
+            save_derivatives(recipe_id, user_id, original_name, future.result())
+        except BrokenProcessPool:
+            logger.exception("Generating derivatives of %s failed", original_name)
+            _reset_executor(executor)
+        except Exception:
+            logger.exception("Generating derivatives of %s failed", original_name)
+        finally:
+            connections.close_all()
+
+    def submit():
+        try:
+            executor, future = _submit(render_derivatives, *args, **kwargs)
+        except Exception:
+            # The upload succeeded, only its derivatives are missing
+            logger.exception("Scheduling derivatives of %s failed", original_name)
+            return
+        # The callbacks run in the internal thread of the pool, hand over
+        future.add_done_callback(
+            lambda future: _get_saver().submit(save, executor, future)
+        )
+
+    # Wait for the original to be committed before the workers read it
+    transaction.on_commit(submit)
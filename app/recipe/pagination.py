@@ -0,0 +1,24 @@
+"""
+Pagination classes for the recipe APIs
+"""
+
+from rest_framework.pagination import CursorPagination
+
+
+class RecipeCursorPagination(CursorPagination):
+    """Keyset (cursor) pagination for recipes, newest first.
+
+    Pages are fetched with `WHERE id < <last id>` instead of OFFSET and no
+    COUNT(*) is issued, so every page costs the same as the first one.
+    Clients follow the opaque `next`/`previous` cursor links.
+    """
+
+    page_size = 100
+    page_size_query_param = "page_size"  # e.g., ?page_size=20
+    max_page_size = 1000
+    ordering = "-id"  # must be unique so that the cursor is a plain keyset
+
+    def get_ordering(self, request, queryset, view):
+        """Use the ordering of the view if it has one, e.g., by search rank."""
+        ordering = getattr(view, "cursor_ordering", None)
+        return ordering or super().get_ordering(request, queryset, view)
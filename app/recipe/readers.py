@@ -0,0 +1,194 @@
+"""
+Read-only rendering of the recipe lists from values() rows, without the
+ModelSerializer field machinery
+"""
+
+from rest_framework import serializers
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from core.instrumentation import get_request_stats
+
+_readers = {}  # (serializer class, field names) -> ValuesReader or None
+
+
+def _constant(convert):
+    """Return the converter factory of a converter independent of the request."""
+    return lambda request: convert
+
+
+def _identity_representation(field):
+    """Whether the field renders the database values of its type unchanged."""
+    return type(field).to_representation in (
+        serializers.CharField.to_representation,
+        serializers.IntegerField.to_representation,
+        serializers.BooleanField.to_representation,
+    )
+
+
+def _decimal_converter(field, model_field):
+    """e.g., Decimal("5.00") -> "5.00" for a DecimalField(decimal_places=2)"""
+    coerce_to_string = getattr(
+        field, "coerce_to_string", api_settings.COERCE_DECIMAL_TO_STRING
+    )
+    if (
+        coerce_to_string
+        and not field.localize
+        and field.decimal_places == model_field.decimal_places
+        and field.max_digits == model_field.max_digits
+    ):
+        # The database values are already quantized to the decimal places
+        return lambda value: format(value, "f")
+    return field.to_representation
+
+
+def _file_converter_factory(field, model_field):
+    """Return a factory of the request-bound converter of a file name.
+    e.g., "uploads/recipe/x.jpg" -> "http://testserver/media/uploads/recipe/x.jpg"
+    """
+    use_url = getattr(field, "use_url", api_settings.UPLOADED_FILES_USE_URL)
+    storage = model_field.storage
+
+    def factory(request):
+        if not use_url:
+            return lambda name: name or None
+        if request is None:
+            return lambda name: storage.url(name) if name else None
+        build_uri = request.build_absolute_uri
+        return lambda name: build_uri(storage.url(name)) if name else None
+
+    return factory
+
+
+class ValuesReader:
+    """Render the values() rows of a model like a ModelSerializer, with the
+    converter of each field built once. The nested many=True serializers of
+    M2M fields are read with one query per field, grouped by row.
+    """
+
+    def __init__(self, model, specs, nested):
+        self.model = model
+        # [(name, source, converter factory)], a None converter means unchanged
+        self.specs = specs
+        # {name: (M2M field, ValuesReader)}
+        self.nested = nested
+        self.columns = list(
+            dict.fromkeys(
+                ["id"] + [source for name, source, _ in specs if name not in nested]
+            )
+        )
+
+    def _read_nested(self, name, ids, request):
+        """Return the rendered related objects of each row id for a M2M field.
+        Uses the same query as prefetch_related(), so the order is the same.
+        """
+        m2m_field, reader = self.nested[name]
+        query_name = m2m_field.related_query_name()  # e.g., "recipe"
+        rows = list(
+            reader.model.objects.filter(**{f"{query_name}__in": ids}).values(
+                *reader.columns, query_name
+            )
+        )
+        grouped = {pk: [] for pk in ids}
+        for row, item in zip(rows, reader.read(rows, request)):
+            grouped[row[query_name]].append(item)
+        return grouped
+
+    def read(self, rows, request=None):
+        """Render the rows, e.g., reader.read(Recipe.objects.values(*columns))"""
+        rows = list(rows)
+        ids = [row["id"] for row in rows]
+        converters = []
+        for name, source, factory in self.specs:
+            if name in self.nested:
+                grouped = self._read_nested(name, ids, request)
+                converters.append((name, "id", grouped.__getitem__))
+            else:
+                converters.append((name, source, factory and factory(request)))
+
+        data = []
+        for row in rows:
+            item = {}
+            for name, source, convert in converters:
+                value = row[source]
+                if value is not None and convert is not None:
+                    value = convert(value)
+                item[name] = value
+            data.append(item)
+        return data
+
+
+def _compile(serializer):
+    """Build the ValuesReader of a ModelSerializer, or None if it renders a
+    field that isn't a column or a nested M2M serializer."""
+    if not isinstance(serializer, serializers.ModelSerializer):
+        return None
+    model = serializer.Meta.model
+    columns = {field.name: field for field in model._meta.concrete_fields}
+    m2m_fields = {field.name: field for field in model._meta.many_to_many}
+    specs, nested = [], {}
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if isinstance(field, serializers.ListSerializer):
+            m2m_field = m2m_fields.get(field.source)
+            reader = get_values_reader(field.child)
+            if m2m_field is None or reader is None:
+                return None
+            if reader.model is not m2m_field.related_model:
+                return None
+            specs.append((name, field.source, None))
+            nested[name] = (m2m_field, reader)
+            continue
+        model_field = columns.get(field.source)
+        if model_field is None or model_field.is_relation:
+            return None  # e.g., a method, a dotted source or a foreign key
+        if isinstance(field, serializers.FileField):
+            factory = _file_converter_factory(field, model_field)
+        elif _identity_representation(field):
+            factory = None
+        elif isinstance(field, serializers.DecimalField):
+            factory = _constant(_decimal_converter(field, model_field))
+        else:
+            factory = _constant(field.to_representation)
+        specs.append((name, field.source, factory))
+    return ValuesReader(model, specs, nested)
+
+
+def get_values_reader(serializer):
+    """Return the (cached) ValuesReader rendering the fields of a serializer,
+    or None if it can't be rendered from values() rows.
+    e.g., get_values_reader(RecipeSerializer(fields={"id", "tags"}))
+    """
+    key = (type(serializer), tuple(serializer.fields))
+    if key not in _readers:
+        _readers[key] = _compile(serializer)
+    return _readers[key]
+
+
+class ValuesListMixin:
+    """List the objects from values() rows through the ValuesReader of the
+    list serializer, falling back to the serializer if it has none.
+    """
+
+    def list(self, request, *args, **kwargs):
+        reader = get_values_reader(self.get_serializer())
+        if reader is None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset()).prefetch_related(None)
+        # The pagination cursor reads the ordering columns (e.g., rank) too
+        ordering = [
+            name.lstrip("-")
+            for name in queryset.query.order_by
+            if isinstance(name, str)
+        ]
+        rows = queryset.values(*dict.fromkeys(reader.columns + ordering))
+        read = reader.read
+        stats = get_request_stats(request)
+        if stats is not None:
+            read = stats.timed("serialize", read)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(read(page, request))
+        return Response(read(rows, request))
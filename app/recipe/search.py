@@ -0,0 +1,77 @@
+"""
+Full-text search over the recipes
+"""
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import Exists, F, FloatField, OuterRef, Q
+from django.db.models.functions import Cast
+
+from core.models import Recipe, Tag, Ingredient
+
+SEARCH_CONFIG = "english"
+
+# Title matches rank above tag/ingredient names, which rank above the description
+SEARCH_VECTOR_SQL = """
+UPDATE {recipe} r SET search_vector =
+    setweight(to_tsvector(%(config)s::regconfig, r.title), 'A')
+    || setweight(to_tsvector(%(config)s::regconfig, coalesce((
+        SELECT string_agg(t.name, ' ') FROM {tag} t
+        JOIN {recipe_tags} rt ON rt.tag_id = t.id WHERE rt.recipe_id = r.id
+    ), '')), 'B')
+    || setweight(to_tsvector(%(config)s::regconfig, coalesce((
+        SELECT string_agg(i.name, ' ') FROM {ingredient} i
+        JOIN {recipe_ingredients} ri ON ri.ingredient_id = i.id
+        WHERE ri.recipe_id = r.id
+    ), '')), 'B')
+    || setweight(to_tsvector(%(config)s::regconfig, r.description), 'C')
+WHERE {where}
+"""
+
+
+def update_search_vectors(where="r.id = ANY(%(ids)s)", **params):
+    """Recompute the stored search vector of the matching recipes.
+    e.g., update_search_vectors(ids=[1, 2])
+    Only PostgreSQL stores search vectors, this is a no-op elsewhere.
+    """
+    if connection.vendor != "postgresql":
+        return
+    sql = SEARCH_VECTOR_SQL.format(
+        recipe=Recipe._meta.db_table,
+        tag=Tag._meta.db_table,
+        recipe_tags=Recipe.tags.through._meta.db_table,
+        ingredient=Ingredient._meta.db_table,
+        recipe_ingredients=Recipe.ingredients.through._meta.db_table,
+        where=where,
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, {"config": SEARCH_CONFIG, **params})
+
+
+def search_recipes(queryset, terms):
+    """Filter recipes matching the search terms.
+    Returns the queryset and whether it is annotated with a "rank".
+    """
+    if connection.vendor == "postgresql":
+        # e.g., "thai curry -beef" (web search syntax)
+        query = SearchQuery(terms, config=SEARCH_CONFIG, search_type="websearch")
+        # ts_rank() returns a real, which doesn't compare equal to its Python
+        # value in the pagination cursor (rank < %s), a double precision does
+        queryset = queryset.filter(search_vector=query).annotate(
+            rank=Cast(SearchRank(F("search_vector"), query), FloatField())
+        )
+        return queryset, True
+
+    # Without full-text search (e.g., SQLite) every word must appear somewhere
+    for word in terms.split():
+        tags = Tag.objects.filter(recipe=OuterRef("pk"), name__icontains=word)
+        ingredients = Ingredient.objects.filter(
+            recipe=OuterRef("pk"), name__icontains=word
+        )
+        queryset = queryset.filter(
+            Q(title__icontains=word)
+            | Q(description__icontains=word)
+            | Q(Exists(tags))
+            | Q(Exists(ingredients))
+        )
+    return queryset, False
@@ -1,8 +1,16 @@
 """Serializers for recipe APIs"""
 
+from django.db import connection, transaction
+from django.db.models import prefetch_related_objects
+from django.utils import timezone
 from rest_framework import serializers
 
+from core.metrics import observe_image_upload
 from core.models import Recipe, Tag, Ingredient
+from recipe.cache import bump_data_version
+from recipe.counts import add_recipe_counts, count_links
+from recipe.images import ImageNormalizationError, normalize_image
+from recipe.search import update_search_vectors
 
 
 class IngredientSerializer(serializers.ModelSerializer):
@@ -23,7 +31,131 @@ class TagSerializer(serializers.ModelSerializer):
         read_only_fields = ["id"]
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class IngredientDetailSerializer(IngredientSerializer):
+    """Serializer for the ingredient views, with the number of recipes using it"""
+
+    class Meta(IngredientSerializer.Meta):
+        fields = IngredientSerializer.Meta.fields + ["recipe_count"]
+        read_only_fields = IngredientSerializer.Meta.read_only_fields + [
+            "recipe_count"
+        ]
+
+
+class TagDetailSerializer(TagSerializer):
+    """Serializer for the tag views, with the number of recipes using it"""
+
+    class Meta(TagSerializer.Meta):
+        fields = TagSerializer.Meta.fields + ["recipe_count"]
+        read_only_fields = TagSerializer.Meta.read_only_fields + ["recipe_count"]
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    """Serializer for writing many recipes at once (RecipeSerializer(many=True))."""
+
+    def validate_items(self, data):
+        """Validate each item on its own.
+        Returns the validated data (None if invalid) and the errors of each item.
+        """
+        validated, errors = [], []
+        for item in data:
+            try:
+                validated.append(self.child.run_validation(item))
+                errors.append({})
+            except serializers.ValidationError as exc:
+                validated.append(None)
+                errors.append(exc.detail)
+        return validated, errors
+
+    def _write_attrs(self, recipes, items_per_recipe, model, attr, deltas=None):
+        """Link tags/ingredients to the recipes with a single insert, and count
+        the new links on top of deltas (e.g., the removed links).
+        e.g., attr = "tag", items_per_recipe = [[{"name": "Vegan"}], ...]
+        """
+        all_items = [item for items in items_per_recipe for item in items]
+        # Get or create the attributes of the whole batch in one pass
+        objs = self.child._get_or_create_attrs(model, all_items)
+        objs = {obj.name: obj for obj in objs}
+        through = getattr(Recipe, f"{attr}s").through
+        links = {
+            (recipe.pk, objs[item["name"]].pk)
+            for recipe, items in zip(recipes, items_per_recipe)
+            for item in items
+        }
+        through.objects.bulk_create(
+            [through(recipe_id=pk, **{f"{attr}_id": attr_pk}) for pk, attr_pk in links]
+        )
+        # The bulk inserts don't send m2m_changed signals
+        deltas = deltas or {}
+        for _, attr_pk in links:
+            deltas[attr_pk] = deltas.get(attr_pk, 0) + 1
+        add_recipe_counts(model, deltas)
+
+    @transaction.atomic
+    def bulk_create(self, validated_data, user):
+        """Create the recipes with their tags and ingredients in bulk."""
+        tags = [data.pop("tags", []) for data in validated_data]
+        ingredients = [data.pop("ingredients", []) for data in validated_data]
+        recipes = [Recipe(user=user, **data) for data in validated_data]
+        if connection.features.can_return_rows_from_bulk_insert:
+            Recipe.objects.bulk_create(recipes)
+        else:
+            # e.g., SQLite doesn't return the new primary keys
+            for recipe in recipes:
+                recipe.save()
+
+        self._write_attrs(recipes, tags, Tag, "tag")
+        self._write_attrs(recipes, ingredients, Ingredient, "ingredient")
+        # The bulk writes don't send signals
+        update_search_vectors(ids=[recipe.pk for recipe in recipes])
+        bump_data_version(user.pk)
+        prefetch_related_objects(recipes, "tags", "ingredients")
+        return recipes
+
+    @transaction.atomic
+    def bulk_update(self, instances, validated_data, user):
+        """Partially update the recipes with their tags and ingredients in bulk."""
+        now = timezone.now()
+        fields = {"updated_at"}
+        for model, attr in ((Tag, "tag"), (Ingredient, "ingredient")):
+            # Only replace the tags/ingredients of the recipes that were given some
+            changed, items_per_recipe = [], []
+            for instance, data in zip(instances, validated_data):
+                if f"{attr}s" in data:
+                    changed.append(instance)
+                    items_per_recipe.append(data.pop(f"{attr}s"))
+            if changed:
+                through = getattr(Recipe, f"{attr}s").through
+                removed = count_links(through, attr, recipe__in=changed)
+                through.objects.filter(recipe__in=changed).delete()
+                deltas = {pk: -total for pk, total in removed.items()}
+                self._write_attrs(changed, items_per_recipe, model, attr, deltas)
+
+        for instance, data in zip(instances, validated_data):
+            for field, value in data.items():
+                setattr(instance, field, value)
+            instance.updated_at = now
+            fields.update(data)
+
+        Recipe.objects.bulk_update(instances, fields)
+        update_search_vectors(ids=[instance.pk for instance in instances])
+        bump_data_version(user.pk)
+        prefetch_related_objects(instances, "tags", "ingredients")
+        return instances
+
+
+class SparseFieldsMixin:
+    """Only render the fields given by the fields/omit arguments.
+    e.g., RecipeSerializer(recipes, many=True, fields={"id", "title"})
+    """
+
+    def __init__(self, *args, fields=None, omit=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        for name in list(self.fields):
+            if (fields is not None and name not in fields) or name in (omit or ()):
+                self.fields.pop(name)
+
+
+class RecipeSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Serializer for recipes."""
 
     # Tags will be a list of tag objects, thus many=True
@@ -33,29 +165,57 @@ class RecipeSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Recipe
-        fields = ["id", "title", "time_minutes", "price", "link", "tags", "ingredients"]
-        read_only_fields = ["id"]
+        fields = [
+            "id",
+            "title",
+            "time_minutes",
+            "price",
+            "link",
+            "tags",
+            "ingredients",
+            "image_thumbnail",
+        ]
+        read_only_fields = ["id", "image_thumbnail"]
+        list_serializer_class = RecipeListSerializer  # used for bulk writes
 
-    def _get_or_create_tags(self, tags, recipe):
-        """Handle getting or creating tags as needed."""
+    def _get_or_create_attrs(self, model, items):
+        """Get or create recipe attributes (tags/ingredients) in one batch.
+        Returns the model objects for all the given names.
+        """
         # Get the authenticated user.
         # This is the way to get the authenticated user in the serializer
         auth_user = self.context["request"].user
-        for tag in tags:
-            # get_or_create is a helper method of the model manager
-            # The tag here only has name, no user, that's why we need user=auth_user
-            tag_obj, created = Tag.objects.get_or_create(user=auth_user, **tag)
-            recipe.tags.add(tag_obj)
+        names = list(dict.fromkeys(item["name"] for item in items))  # keep order
+        if not names:
+            return []
+
+        # Look up all the existing names with a single query
+        queryset = model.objects.filter(user=auth_user, name__in=names)
+        existing = {obj.name: obj for obj in queryset}
+        missing = [
+            model(user=auth_user, name=name) for name in names if name not in existing
+        ]
+        if missing:
+            # Insert all the missing objects with a single query. Names created
+            # meanwhile by a concurrent request are skipped by the unique
+            # (user, name) constraint, so re-read them all afterwards.
+            model.objects.bulk_create(missing, ignore_conflicts=True)
+            existing = {obj.name: obj for obj in queryset.all()}
+
+        return [existing[name] for name in names]
+
+    def _get_or_create_tags(self, tags, recipe):
+        """Handle getting or creating tags as needed."""
+        tag_objs = self._get_or_create_attrs(Tag, tags)
+        # add() with several objects writes all the M2M rows in one insert
+        recipe.tags.add(*tag_objs)
 
     def _get_or_create_ingredients(self, ingredients, recipe):
         """Handle getting or creating ingredients as needed"""
-        auth_user = self.context["request"].user
-        for ingredient in ingredients:
-            ingredient_obj, created = Ingredient.objects.get_or_create(
-                user=auth_user, **ingredient
-            )
-            recipe.ingredients.add(ingredient_obj)
+        ingredient_objs = self._get_or_create_attrs(Ingredient, ingredients)
+        recipe.ingredients.add(*ingredient_objs)
 
+    @transaction.atomic
     def create(self, validated_data):
         """Create a new recipe"""
         # Get tags from the validated data and remove it from the validated data
@@ -68,19 +228,18 @@ class RecipeSerializer(serializers.ModelSerializer):
 
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         """Update recipe, the instance is the existing instance to be updated"""
         # pop the tags and ingredients from the validated data
         tags = validated_data.pop("tags", None)
         ingredients = validated_data.pop("ingredients", None)
         if tags is not None:
-            # Remove all tags from the recipe
-            instance.tags.clear()
-            self._get_or_create_tags(tags, instance)
+            # Replace the tags of the recipe, set() only writes the differences
+            instance.tags.set(self._get_or_create_attrs(Tag, tags))
 
         if ingredients is not None:
-            instance.ingredients.clear()
-            self._get_or_create_ingredients(ingredients, instance)
+            instance.ingredients.set(self._get_or_create_attrs(Ingredient, ingredients))
 
         for attr, value in validated_data.items():
             setattr(instance, attr, value)
@@ -93,7 +252,8 @@ class RecipeDetailSerializer(RecipeSerializer):
     """Serializer for recipe detail view"""
 
     class Meta(RecipeSerializer.Meta):
-        fields = RecipeSerializer.Meta.fields + ["description", "image"]
+        fields = RecipeSerializer.Meta.fields + ["description", "image", "image_medium"]
+        read_only_fields = RecipeSerializer.Meta.read_only_fields + ["image_medium"]
 
 
 class RecipeImageSerializer(serializers.ModelSerializer):
@@ -101,6 +261,15 @@ class RecipeImageSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Recipe
-        fields = ["id", "image"]
-        read_only_fields = ["id"]
+        # The derivatives are null until they have been generated
+        fields = ["id", "image", "image_thumbnail", "image_medium"]
+        read_only_fields = ["id", "image_thumbnail", "image_medium"]
         extra_kwargs = {"image": {"required": True}}
+
+    def validate_image(self, value):
+        """Downscale and re-encode the image before it is stored."""
+        observe_image_upload(value.size)
+        try:
+            return normalize_image(value)
+        except ImageNormalizationError as error:
+            raise serializers.ValidationError(str(error))
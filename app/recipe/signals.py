@@ -0,0 +1,157 @@
+"""
+Signal handlers keeping the recipe list cache, validators, search vectors and
+recipe counts up to date
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from core.models import Recipe, Tag, Ingredient
+from recipe.cache import bump_data_version
+from recipe.counts import add_recipe_counts
+from recipe.search import update_search_vectors
+
+# Set while the caller updates the counts and the cache of deleted recipes in
+# bulk, see batched_recipe_deletes()
+_batched_deletes = ContextVar("batched_recipe_deletes", default=False)
+
+
+@contextmanager
+def batched_recipe_deletes():
+    """Skip the recipe count and cache work of the recipes deleted in the
+    block, which the caller does once for all of them (e.g., the bulk delete).
+    The delete signals are still sent to the other receivers."""
+    token = _batched_deletes.set(True)
+    try:
+        yield
+    finally:
+        _batched_deletes.reset(token)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_on_write(sender, instance, **kwargs):
+    """Bump the data version of the owner of a recipe, tag or ingredient."""
+    if sender is Recipe and _batched_deletes.get():
+        return
+    bump_data_version(instance.user_id)
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_search_vector(sender, instance, **kwargs):
+    """Index the title and description of a saved recipe for search."""
+    update_search_vectors(ids=[instance.pk])
+
+
+def _touch_recipes(recipe_ids, now=None):
+    """Mark the recipes as updated and re-index them for search."""
+    if not recipe_ids:
+        return
+    Recipe.objects.filter(pk__in=recipe_ids).update(updated_at=now or timezone.now())
+    update_search_vectors(ids=recipe_ids)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def invalidate_on_m2m_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """Bump the data version and touch the recipes when tags/ingredients are
+    (un)assigned."""
+    if action == "pre_clear" and reverse:
+        # instance is the tag/ingredient, its recipes are unknown after clear
+        instance._cleared_recipe_ids = list(
+            instance.recipe_set.values_list("id", flat=True)
+        )
+        return
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+
+    now = timezone.now()
+    if not reverse:
+        # instance is the recipe
+        instance.updated_at = now
+        recipe_ids = [instance.pk]
+    elif action == "post_clear":
+        recipe_ids = instance.__dict__.pop("_cleared_recipe_ids", [])
+    else:
+        recipe_ids = list(pk_set)
+    _touch_recipes(recipe_ids, now)
+    bump_data_version(instance.user_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def count_recipes_on_m2m_change(
+    sender, instance, action, reverse, model, pk_set, **kwargs
+):
+    """Keep the recipe counts of the (un)assigned tags/ingredients.
+    The pre_ actions run in the same transaction as the change and still see
+    the links being removed.
+    """
+    if not reverse:
+        # instance is the recipe, model is Tag/Ingredient
+        if action == "post_add":
+            add_recipe_counts(model, dict.fromkeys(pk_set, 1))
+        elif action in ("pre_remove", "pre_clear"):
+            linked = model.objects.filter(recipe=instance)
+            if action == "pre_remove":
+                linked = linked.filter(pk__in=pk_set)
+            # A drifted count stays at 0, see reconcile_recipe_counts()
+            linked.update(recipe_count=Greatest(F("recipe_count") - 1, 0))
+        return
+
+    # instance is the tag/ingredient, model is Recipe
+    if action == "post_add":
+        delta = len(pk_set)
+    elif action == "pre_remove":
+        delta = -instance.recipe_set.filter(pk__in=pk_set).count()
+    elif action == "pre_clear":
+        delta = -instance.recipe_set.count()
+    else:
+        return
+    add_recipe_counts(type(instance), {instance.pk: delta})
+
+
+@receiver(pre_delete, sender=Recipe)
+def uncount_deleted_recipe(sender, instance, **kwargs):
+    """Decrement the recipe counts of the tags/ingredients of a deleted recipe,
+    its links are deleted without m2m_changed signals."""
+    if _batched_deletes.get():
+        return
+    for model in (Tag, Ingredient):
+        model.objects.filter(recipe=instance).update(
+            recipe_count=Greatest(F("recipe_count") - 1, 0)
+        )
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def touch_recipes_of_renamed_attr(sender, instance, created, **kwargs):
+    """Touch the recipes showing a tag/ingredient that is renamed."""
+    if not created:
+        _touch_recipes(list(instance.recipe_set.values_list("id", flat=True)))
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def remember_recipes_of_deleted_attr(sender, instance, **kwargs):
+    """Keep the recipes of a tag/ingredient, its links are deleted with it."""
+    instance._deleted_recipe_ids = list(
+        instance.recipe_set.values_list("id", flat=True)
+    )
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def touch_recipes_of_deleted_attr(sender, instance, **kwargs):
+    """Touch the recipes that were showing a deleted tag/ingredient."""
+    _touch_recipes(instance.__dict__.pop("_deleted_recipe_ids", []))
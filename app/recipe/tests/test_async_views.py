@@ -0,0 +1,137 @@
+"""
+Tests for the async read views served under ASGI
+"""
+
+import asyncio
+import gzip
+from decimal import Decimal
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import include, path, resolve, reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from app import urls as app_urls
+from core.authentication import get_token_cache
+from core.models import Recipe, Tag
+from recipe.async_views import async_read_urls
+from recipe.urls import router
+
+# The URLconf of ASYNC_READ_VIEWS
+urlpatterns = [
+    path("api/recipe/", include((async_read_urls(router.urls), "recipe"))),
+    *(url for url in app_urls.urlpatterns if str(url.pattern) != "api/recipe/"),
+]
+
+RECIPES_URL = reverse("recipe:recipe-list")
+TAGS_URL = reverse("recipe:tag-list")
+
+
+def detail_url(recipe_id):
+    """Create and return a recipe detail URL."""
+    return reverse("recipe:recipe-detail", args=[recipe_id])
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncReadViewTests(TestCase):
+    """Test the recipe APIs through the async read views."""
+
+    def setUp(self):
+        get_token_cache().clear()
+        self.user = get_user_model().objects.create_user(
+            email="user@example.com", password="testpass123"
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.auth = {"authorization": f"Token {self.token.key}"}
+        self.recipe = Recipe.objects.create(
+            user=self.user, title="Curry", time_minutes=30, price=Decimal("7.00")
+        )
+        self.recipe.tags.add(Tag.objects.create(user=self.user, name="Thai"))
+
+    def get(self, url, **headers):
+        """Send a GET request through the async test client.
+        The extra arguments of the async client are the request headers.
+        """
+        return self.send("get", url, **{**self.auth, **headers})
+
+    def send(self, method, url, *args, **kwargs):
+        """Send a request through the async test client and its middleware."""
+        return async_to_sync(getattr(self.async_client, method))(url, *args, **kwargs)
+
+    def test_async_views(self):
+        """Test the GET routes are async views, the others sync views."""
+        for url in (RECIPES_URL, TAGS_URL, detail_url(self.recipe.id)):
+            self.assertTrue(asyncio.iscoroutinefunction(resolve(url).func))
+        self.assertFalse(asyncio.iscoroutinefunction(resolve("/api/users/me/").func))
+
+    def test_same_as_sync_view(self):
+        """Test the async views return the same data as the sync views."""
+        sync_client = APIClient()
+        sync_client.force_authenticate(self.user)
+
+        for url in (RECIPES_URL, TAGS_URL, detail_url(self.recipe.id)):
+            with self.subTest(url=url):
+                res = self.get(url)
+                self.assertEqual(res.status_code, status.HTTP_200_OK)
+                with override_settings(ROOT_URLCONF="app.urls"):
+                    expected = sync_client.get(url)
+                self.assertEqual(res.json(), expected.json())
+
+    def test_cached_list_served_without_queries(self):
+        """Test a cached list of a cached token doesn't query the database."""
+        first = self.get(RECIPES_URL)
+
+        with self.assertNumQueries(0):
+            res = self.get(RECIPES_URL)
+            not_modified = self.get(RECIPES_URL, **{"if-none-match": first["ETag"]})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.content, first.content)
+        self.assertEqual(res["ETag"], first["ETag"])
+        self.assertEqual(res["Allow"], first["Allow"])
+        self.assertIn("Accept", res["Vary"])
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    @override_settings(COMPRESSION={"MIN_SIZE": 0, "LEVELS": {"application/json": {}}})
+    def test_cached_list_compressed(self):
+        """Test the cached list goes through the middleware, e.g., compressed."""
+        first = self.get(RECIPES_URL, **{"accept-encoding": "gzip"})
+
+        with self.assertNumQueries(0):
+            res = self.get(RECIPES_URL, **{"accept-encoding": "gzip"})
+
+        self.assertEqual(res["Content-Encoding"], "gzip")
+        self.assertEqual(res["ETag"], first["ETag"])
+        self.assertEqual(gzip.decompress(res.content), gzip.decompress(first.content))
+
+    def test_browsable_api_from_sync_view(self):
+        """Test the other renderers than the default one are left to the sync
+        view."""
+        self.get(RECIPES_URL)
+
+        res = self.get(RECIPES_URL, accept="text/html")
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(res["Content-Type"].startswith("text/html"))
+
+    def test_write_through_sync_views(self):
+        """Test the writes still go to the sync views."""
+        payload = {"title": "Soup", "time_minutes": 5, "price": "2.00"}
+        res = self.send(
+            "post", RECIPES_URL, payload, content_type="application/json", **self.auth
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        res = self.get(RECIPES_URL)
+        titles = [recipe["title"] for recipe in res.json()["results"]]
+        self.assertEqual(titles, ["Soup", "Curry"])
+
+    def test_auth_required(self):
+        """Test unknown tokens are rejected."""
+        res = self.get(RECIPES_URL, authorization="Token unknown")
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
@@ -0,0 +1,206 @@
+"""
+Tests for the bulk recipe APIs
+"""
+
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.db.models.signals import post_delete
+from django.test import TestCase, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag, Ingredient
+
+BULK_URL = reverse("recipe:recipe-bulk")
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe."""
+    defaults = {"title": "Sample recipe", "time_minutes": 10, "price": Decimal("5.25")}
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+def recipe_payload(i, **params):
+    """Return the payload of a sample recipe."""
+    payload = {
+        "title": f"Recipe {i}",
+        "time_minutes": 10,
+        "price": "4.50",
+        "tags": [{"name": "Dinner"}, {"name": f"Tag {i}"}],
+        "ingredients": [{"name": "Salt"}],
+    }
+    payload.update(params)
+    return payload
+
+
+class BulkRecipeApiTests(TestCase):
+    """Test the bulk create/update/delete endpoint."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email="user@example.com", password="testpass123"
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_bulk_create(self):
+        """Test creating recipes with their tags and ingredients in bulk."""
+        Tag.objects.create(user=self.user, name="Dinner")
+        payload = [recipe_payload(i) for i in range(3)]
+
+        res = self.client.post(BULK_URL, payload, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(res.data["errors"], [{}, {}, {}])
+        recipes = Recipe.objects.filter(user=self.user)
+        self.assertEqual(recipes.count(), 3)
+        self.assertEqual(Tag.objects.filter(user=self.user).count(), 4)
+        self.assertEqual(Ingredient.objects.filter(user=self.user).count(), 1)
+        for recipe in recipes:
+            self.assertEqual(
+                sorted(recipe.tags.values_list("name", flat=True)),
+                sorted(["Dinner", recipe.title.replace("Recipe", "Tag")]),
+            )
+        self.assertEqual(
+            [r["title"] for r in res.data["results"]],
+            ["Recipe 0", "Recipe 1", "Recipe 2"],
+        )
+
+    def test_bulk_create_reports_invalid_items(self):
+        """Test invalid items are reported and the others are created."""
+        payload = [recipe_payload(0), recipe_payload(1, price="invalid")]
+
+        res = self.client.post(BULK_URL, payload, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertIsNone(res.data["results"][1])
+        self.assertIn("price", res.data["errors"][1])
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 1)
+
+    def test_bulk_create_atomic(self):
+        """Test nothing is created in atomic mode if an item is invalid."""
+        payload = [recipe_payload(0), recipe_payload(1, price="invalid")]
+
+        res = self.client.post(f"{BULK_URL}?atomic=1", payload, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Recipe.objects.filter(user=self.user).exists())
+
+    @skipUnlessDBFeature("can_return_rows_from_bulk_insert")
+    def test_bulk_create_query_count_independent_of_size(self):
+        """Test the number of queries doesn't grow with the batch size."""
+
+        def post_recipes(count):
+            payload = [recipe_payload(f"{count}-{i}") for i in range(count)]
+            with CaptureQueriesContext(connection) as ctx:
+                self.client.post(BULK_URL, payload, format="json")
+            return len(ctx.captured_queries)
+
+        self.assertEqual(post_recipes(2), post_recipes(20))
+
+    def test_bulk_partial_update(self):
+        """Test updating several recipes in bulk."""
+        r1 = create_recipe(user=self.user, title="Old 1")
+        r2 = create_recipe(user=self.user, title="Old 2")
+        r2.tags.add(Tag.objects.create(user=self.user, name="Lunch"))
+        other = create_recipe(
+            user=get_user_model().objects.create_user(email="other@example.com"),
+        )
+        payload = [
+            {"id": r1.id, "title": "New 1"},
+            {"id": r2.id, "tags": [{"name": "Dinner"}]},
+            {"id": other.id, "title": "Hacked"},
+        ]
+
+        res = self.client.patch(BULK_URL, payload, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["errors"][2], {"id": ["Not found."]})
+        r1.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(r1.title, "New 1")
+        self.assertEqual(other.title, "Sample recipe")
+        self.assertEqual(list(r2.tags.values_list("name", flat=True)), ["Dinner"])
+        self.assertEqual(res.data["results"][1]["tags"][0]["name"], "Dinner")
+
+    def test_bulk_delete(self):
+        """Test deleting several recipes of the user by id."""
+        r1 = create_recipe(user=self.user)
+        r2 = create_recipe(user=self.user)
+        r3 = create_recipe(user=self.user)
+
+        res = self.client.delete(BULK_URL, {"ids": [r1.id, r2.id, 0]}, format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data, {"deleted": [r1.id, r2.id], "missing": [0]})
+        self.assertEqual(list(Recipe.objects.all()), [r3])
+
+    def test_bulk_delete_updates_counts_in_batch(self):
+        """Test the recipe counts are kept in a constant number of queries."""
+        tag = Tag.objects.create(user=self.user, name="Dinner")
+        ingredient = Ingredient.objects.create(user=self.user, name="Salt")
+        recipes = [create_recipe(user=self.user) for _ in range(5)]
+        for recipe in recipes:
+            recipe.tags.add(tag)
+            recipe.ingredients.add(ingredient)
+
+        with CaptureQueriesContext(connection) as two:
+            self.client.delete(
+                BULK_URL, {"ids": [r.id for r in recipes[:2]]}, format="json"
+            )
+        with CaptureQueriesContext(connection) as three:
+            self.client.delete(
+                BULK_URL, {"ids": [r.id for r in recipes[2:]]}, format="json"
+            )
+
+        self.assertEqual(len(two), len(three))
+        tag.refresh_from_db()
+        ingredient.refresh_from_db()
+        self.assertEqual(tag.recipe_count, 0)
+        self.assertEqual(ingredient.recipe_count, 0)
+        self.assertFalse(Recipe.objects.exists())
+        self.assertFalse(Recipe.tags.through.objects.exists())
+
+    def test_bulk_delete_sends_signals(self):
+        """Test the recipes are deleted with their delete signals, and the
+        list cache of the user is invalidated."""
+        recipes = [create_recipe(user=self.user) for _ in range(2)]
+        etag = self.client.get(reverse("recipe:recipe-list"))["ETag"]
+        deleted = []
+
+        def receiver(sender, instance, **kwargs):
+            deleted.append(instance.pk)
+
+        post_delete.connect(receiver, sender=Recipe)
+        self.addCleanup(post_delete.disconnect, receiver, sender=Recipe)
+        self.client.delete(BULK_URL, {"ids": [r.id for r in recipes]}, format="json")
+
+        self.assertEqual(sorted(deleted), sorted(r.id for r in recipes))
+        res = self.client.get(reverse("recipe:recipe-list"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data["results"], [])
+
+    def test_bulk_delete_atomic(self):
+        """Test nothing is deleted with ?atomic=true if an id is missing."""
+        recipe = create_recipe(user=self.user)
+
+        res = self.client.delete(
+            f"{BULK_URL}?atomic=true", {"ids": [recipe.id, 0]}, format="json"
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(res.data, {"missing": [0]})
+        self.assertTrue(Recipe.objects.filter(id=recipe.id).exists())
+
+    def test_bulk_atomic_invalid(self):
+        """Test an invalid ?atomic= value returns an error."""
+        res = self.client.post(f"{BULK_URL}?atomic=maybe", [], format="json")
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("atomic", res.data)
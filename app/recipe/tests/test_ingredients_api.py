@@ -9,7 +9,7 @@ from rest_framework import status
 from rest_framework.test import APIClient
 from core.models import Ingredient, Recipe
 
-from recipe.serializers import IngredientSerializer
+from recipe.serializers import IngredientDetailSerializer
 
 INGREDIENTS_URL = reverse("recipe:ingredient-list")
 
@@ -52,7 +52,7 @@ class PrivateIngredientsApiTests(TestCase):
         res = self.client.get(INGREDIENTS_URL)
 
         ingredients = Ingredient.objects.all().order_by("-name")
-        serializer = IngredientSerializer(ingredients, many=True)
+        serializer = IngredientDetailSerializer(ingredients, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(res.data, serializer.data)  # type: ignore
 
@@ -95,9 +95,10 @@ class PrivateIngredientsApiTests(TestCase):
             title="Apple crumble", time_minutes=5, price=Decimal(10.00), user=self.user
         )
         recipe.ingredients.add(in1)
+        in1.refresh_from_db()  # reload the recipe count
         res = self.client.get(INGREDIENTS_URL, {"assigned_only": 1})
-        s1 = IngredientSerializer(in1)
-        s2 = IngredientSerializer(in2)
+        s1 = IngredientDetailSerializer(in1)
+        s2 = IngredientDetailSerializer(in2)
         self.assertIn(s1.data, res.data)
         self.assertNotIn(s2.data, res.data)
 
@@ -114,7 +115,19 @@ class PrivateIngredientsApiTests(TestCase):
         recipe1.ingredients.add(ing)
         recipe2.ingredients.add(ing)
 
+        ing.refresh_from_db()  # reload the recipe count
         res = self.client.get(INGREDIENTS_URL, {"assigned_only": 1})
-        s1 = IngredientSerializer(ing)
+        s1 = IngredientDetailSerializer(ing)
         self.assertIn(s1.data, res.data)
         self.assertEqual(len(res.data), 1)
+
+    def test_autocomplete_ingredients(self):
+        """Test q returns the ingredients starting with or similar to it."""
+        Ingredient.objects.create(user=self.user, name="Tomato")
+        Ingredient.objects.create(user=self.user, name="Tofu")
+        Ingredient.objects.create(user=self.user, name="Salt")
+
+        res = self.client.get(INGREDIENTS_URL, {"q": "tomatto"})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([i["name"] for i in res.data], ["Tomato"])
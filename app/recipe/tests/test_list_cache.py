@@ -0,0 +1,132 @@
+"""
+Tests for the list response cache
+"""
+
+import gzip
+import json
+import tempfile
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag
+
+RECIPES_URL = reverse("recipe:recipe-list")
+TAGS_URL = reverse("recipe:tag-list")
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe."""
+    defaults = {"title": "Sample recipe", "time_minutes": 10, "price": Decimal("5.25")}
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class ListCacheTests(TestCase):
+    """Test list responses are cached per user and data version."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email="user@example.com", password="testpass123"
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_repeated_list_served_from_cache(self):
+        """Test listing twice only queries the database once."""
+        create_recipe(user=self.user)
+        res1 = self.client.get(RECIPES_URL, {"page_size": 10})
+
+        with self.assertNumQueries(0):
+            res2 = self.client.get(RECIPES_URL, {"page_size": 10})
+
+        self.assertEqual(res2.status_code, status.HTTP_200_OK)
+        self.assertEqual(res1.data, res2.data)
+
+    def test_write_invalidates_cache(self):
+        """Test creating and assigning tags is visible right away."""
+        recipe = create_recipe(user=self.user)
+        self.client.get(TAGS_URL)
+        self.client.get(RECIPES_URL)
+
+        tag = Tag.objects.create(user=self.user, name="Vegan")
+        recipe.tags.add(tag)
+
+        res = self.client.get(TAGS_URL)
+        self.assertEqual([t["name"] for t in res.data], ["Vegan"])
+        res = self.client.get(RECIPES_URL)
+        self.assertEqual(res.data["results"][0]["tags"][0]["name"], "Vegan")
+
+    def test_cache_per_user(self):
+        """Test cached responses are not shared between users."""
+        other_user = get_user_model().objects.create_user(
+            email="other@example.com", password="testpass123"
+        )
+        create_recipe(user=other_user)
+        self.client.get(RECIPES_URL)
+
+        client = APIClient()
+        client.force_authenticate(other_user)
+        res = client.get(RECIPES_URL)
+
+        self.assertEqual(len(res.data["results"]), 1)
+
+    def test_file_based_cache(self):
+        """Test the cache works with the file based backend."""
+        with tempfile.TemporaryDirectory() as cache_dir:
+            caches = {
+                "default": {
+                    "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                    "LOCATION": cache_dir,
+                }
+            }
+            with override_settings(CACHES=caches):
+                create_recipe(user=self.user)
+                self.client.get(RECIPES_URL)
+                with self.assertNumQueries(0):
+                    self.client.get(RECIPES_URL)
+                create_recipe(user=self.user, title="Another recipe")
+                res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(len(res.data["results"]), 2)
+
+    @override_settings(COMPRESSION={"MIN_SIZE": 0, "LEVELS": {"application/json": {}}})
+    def test_compressed_list_served_from_cache(self):
+        """Test a cached list isn't compressed again."""
+        create_recipe(user=self.user)
+        res1 = self.client.get(RECIPES_URL, HTTP_ACCEPT_ENCODING="gzip")
+
+        with mock.patch("core.middleware.compress") as compress:
+            res2 = self.client.get(RECIPES_URL, HTTP_ACCEPT_ENCODING="gzip")
+
+        compress.assert_not_called()
+        self.assertEqual(res2["Content-Encoding"], "gzip")
+        self.assertEqual(res2["Content-Type"], "application/json")
+        self.assertEqual(res2["ETag"], res1["ETag"])
+        self.assertIn("Accept-Encoding", res2["Vary"])
+        self.assertEqual(res2.content, res1.content)
+        content = json.loads(gzip.decompress(res2.content))
+        self.assertEqual(content["results"][0]["title"], "Sample recipe")
+
+        # Not for the clients that don't accept gzip
+        res3 = self.client.get(RECIPES_URL)
+        self.assertFalse(res3.has_header("Content-Encoding"))
+        self.assertEqual(res3.json(), content)
+
+    def test_cached_list_in_accepted_format(self):
+        """Test a cached list is rendered in the media type of each request."""
+        create_recipe(user=self.user)
+        json_res = self.client.get(RECIPES_URL)
+
+        res = self.client.get(RECIPES_URL, HTTP_ACCEPT="application/xml")
+        self.assertEqual(res.status_code, status.HTTP_406_NOT_ACCEPTABLE)
+
+        res = self.client.get(RECIPES_URL, HTTP_ACCEPT="application/json; indent=4")
+        self.assertEqual(res.json(), json_res.json())
+        self.assertIn(b"\n    ", res.content)
@@ -0,0 +1,94 @@
+"""
+Tests for rendering the recipe lists from values() rows.
+"""
+
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from core.models import Recipe, Tag, Ingredient
+from recipe.readers import get_values_reader
+from recipe.serializers import RecipeSerializer, TagSerializer
+
+RECIPES_URL = reverse("recipe:recipe-list")
+
+
+class ValuesReaderTests(TestCase):
+    """Test the ValuesReader renders like the serializers."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("user@example.com")
+        self.request = Request(APIRequestFactory().get("/"))
+        vegan = Tag.objects.create(user=self.user, name="Vegan")
+        quick = Tag.objects.create(user=self.user, name="Quick")
+        tofu = Ingredient.objects.create(user=self.user, name="Tofu")
+        for i, price in enumerate(["5.00", "12.5", "0.99"]):
+            recipe = Recipe.objects.create(
+                user=self.user,
+                title=f"Recipe {i}",
+                time_minutes=i,
+                price=Decimal(price),
+                link="" if i else "https://example.com",
+                image_thumbnail="" if i else "uploads/recipe/thumbnail.jpg",
+            )
+            recipe.tags.add(*[vegan, quick][:i])
+            recipe.ingredients.add(tofu)
+
+    def assert_renders_like_serializer(self, **kwargs):
+        """Assert the reader output renders to the same bytes as RecipeSerializer."""
+        queryset = Recipe.objects.order_by("-id")
+        expected = RecipeSerializer(
+            queryset.prefetch_related("tags", "ingredients"),
+            many=True,
+            context={"request": self.request},
+            **kwargs,
+        ).data
+        reader = get_values_reader(RecipeSerializer(**kwargs))
+        data = reader.read(queryset.values(*reader.columns), self.request)
+
+        renderer = JSONRenderer()
+        self.assertEqual(renderer.render(data), renderer.render(expected))
+
+    def test_read_recipes(self):
+        """Test reading recipes with prices, images, tags and ingredients."""
+        self.assert_renders_like_serializer()
+
+    def test_read_sparse_fields(self):
+        """Test reading the fields of a pruned serializer."""
+        self.assert_renders_like_serializer(fields={"title", "tags"})
+
+    def test_unsupported_serializer(self):
+        """Test serializers with non-column fields have no reader."""
+
+        class TitleSerializer(TagSerializer):
+            title = serializers.SerializerMethodField()
+
+            class Meta(TagSerializer.Meta):
+                fields = ["id", "title"]
+
+            def get_title(self, tag):
+                return tag.name.title()
+
+        self.assertIsNone(get_values_reader(TitleSerializer()))
+
+    def test_list_recipes_api(self):
+        """Test the recipe list is rendered from values() rows."""
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        with self.assertNumQueries(3):
+            res = client.get(RECIPES_URL)
+
+        recipes = Recipe.objects.order_by("-id")
+        expected = RecipeSerializer(
+            recipes, many=True, context={"request": res.wsgi_request}
+        ).data
+        self.assertEqual(
+            JSONRenderer().render(res.data["results"]), JSONRenderer().render(expected)
+        )
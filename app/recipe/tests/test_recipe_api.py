@@ -2,14 +2,23 @@
 Tests for recipe APIs
 """
 
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from decimal import Decimal
+from unittest import mock
 import tempfile
+import threading
+import time
 import os
+from unittest import skipUnless
 
 from PIL import Image
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from rest_framework import status
@@ -17,6 +26,8 @@ from rest_framework.test import APIClient
 
 from core.models import Recipe, Tag, Ingredient
 
+from recipe import images
+from recipe.conditional import ConditionalRecipeMixin
 from recipe.serializers import RecipeSerializer, RecipeDetailSerializer
 
 RECIPES_URL = reverse("recipe:recipe-list")
@@ -85,7 +96,7 @@ class PrivateRecipeAPITests(TestCase):
         )  # Serializer should handler a collection of objects instead of a single object
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data["results"], serializer.data)
 
     def test_recipe_list_limited_to_user(self):
         """Test list of recipes is limited to authenticated user."""
@@ -97,7 +108,7 @@ class PrivateRecipeAPITests(TestCase):
         recipes = Recipe.objects.filter(user=self.user)
         serializer = RecipeSerializer(recipes, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data["results"], serializer.data)
 
     def test_get_recipe_detail(self):
         """Test get recipe detail"""
@@ -107,6 +118,77 @@ class PrivateRecipeAPITests(TestCase):
         serializer = RecipeDetailSerializer(recipe)
         self.assertEqual(res.data, serializer.data)
 
+    def test_get_recipe_detail_not_modified(self):
+        """Test a matching If-None-Match returns 304 until the recipe changes"""
+        recipe = create_recipe(user=self.user)
+        url = detail_url(recipe.id)
+        etag = self.client.get(url)["ETag"]
+
+        with self.assertNumQueries(1):
+            res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        recipe.tags.add(Tag.objects.create(user=self.user, name="Vegan"))
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(res["ETag"], etag)
+
+    def test_update_with_stale_if_match_fails(self):
+        """Test a conditional update of a changed recipe is rejected"""
+        recipe = create_recipe(user=self.user)
+        url = detail_url(recipe.id)
+        etag = self.client.get(url)["ETag"]
+
+        res = self.client.patch(url, {"title": "First"}, HTTP_IF_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        res = self.client.patch(url, {"title": "Second"}, HTTP_IF_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_412_PRECONDITION_FAILED)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, "First")
+
+    @override_settings(COMPRESSION={"MIN_SIZE": 0, "LEVELS": {"application/json": {}}})
+    def test_conditional_requests_of_compressed_response(self):
+        """Test the ETag of a gzipped recipe works with If-Match and
+        If-None-Match"""
+        recipe = create_recipe(user=self.user)
+        url = detail_url(recipe.id)
+        res = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(res["Content-Encoding"], "gzip")
+        etag = res["ETag"]
+        self.assertFalse(etag.startswith("W/"))
+
+        res = self.client.get(url, HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        res = self.client.patch(url, {"title": "First"}, HTTP_IF_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        res = self.client.patch(url, {"title": "Second"}, HTTP_IF_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_412_PRECONDITION_FAILED)
+
+    def test_browsable_api_not_compressed(self):
+        """Test the HTML pages, which hold a CSRF token, aren't compressed"""
+        create_recipe(user=self.user)
+
+        res = self.client.get(
+            RECIPES_URL, HTTP_ACCEPT="text/html", HTTP_ACCEPT_ENCODING="gzip"
+        )
+
+        self.assertTrue(res["Content-Type"].startswith("text/html"))
+        self.assertGreater(len(res.content), settings.COMPRESSION["MIN_SIZE"])
+        self.assertFalse(res.has_header("Content-Encoding"))
+
+    def test_list_not_modified(self):
+        """Test the recipe list returns 304 while the user's data is unchanged"""
+        create_recipe(user=self.user)
+        etag = self.client.get(RECIPES_URL)["ETag"]
+
+        res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        create_recipe(user=self.user)
+        res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
     def test_create_recipe(self):
         """Test creating a recipe"""
         payload = {
@@ -357,6 +439,30 @@ class PrivateRecipeAPITests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(recipe.ingredients.count(), 0)
 
+    def test_create_recipe_query_count_independent_of_attrs(self):
+        """Test creating a recipe resolves tags and ingredients in batches."""
+        Tag.objects.create(user=self.user, name="Existing tag")
+
+        def post_recipe(count):
+            payload = {
+                "title": f"Recipe with {count} attributes",
+                "time_minutes": 10,
+                "price": Decimal("1.50"),
+                "tags": [{"name": "Existing tag"}]
+                + [{"name": f"Tag {count}-{i}"} for i in range(count)],
+                "ingredients": [{"name": f"Ing {count}-{i}"} for i in range(count)],
+            }
+            with CaptureQueriesContext(connection) as ctx:
+                res = self.client.post(RECIPES_URL, payload, format="json")
+            self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(post_recipe(2), post_recipe(30))
+        recipe = Recipe.objects.get(title="Recipe with 30 attributes")
+        self.assertEqual(recipe.tags.count(), 31)
+        self.assertEqual(recipe.ingredients.count(), 30)
+        self.assertEqual(Tag.objects.filter(name="Existing tag").count(), 1)
+
     def test_filter_by_tags(self):
         """Test filtering recipes by tags."""
         r1 = create_recipe(user=self.user, title="Thai Vegetable Curry")
@@ -374,9 +480,9 @@ class PrivateRecipeAPITests(TestCase):
         s2 = RecipeSerializer(r2)
         s3 = RecipeSerializer(r3)
 
-        self.assertIn(s1.data, res.data)
-        self.assertIn(s2.data, res.data)
-        self.assertNotIn(s3.data, res.data)
+        self.assertIn(s1.data, res.data["results"])
+        self.assertIn(s2.data, res.data["results"])
+        self.assertNotIn(s3.data, res.data["results"])
 
     def test_filter_by_ingredients(self):
         """Test filtering recipes by ingredients."""
@@ -394,9 +500,220 @@ class PrivateRecipeAPITests(TestCase):
         s1 = RecipeSerializer(r1)
         s2 = RecipeSerializer(r2)
         s3 = RecipeSerializer(r3)
-        self.assertIn(s1.data, res.data)  # type: ignore
-        self.assertIn(s2.data, res.data)  # type: ignore
-        self.assertNotIn(s3.data, res.data)  # type: ignore
+        self.assertIn(s1.data, res.data["results"])  # type: ignore
+        self.assertIn(s2.data, res.data["results"])  # type: ignore
+        self.assertNotIn(s3.data, res.data["results"])  # type: ignore
+
+    def test_filter_by_tags_unique(self):
+        """Test a recipe matching several tags is returned once."""
+        recipe = create_recipe(user=self.user)
+        tag1 = Tag.objects.create(user=self.user, name="Vegan")
+        tag2 = Tag.objects.create(user=self.user, name="Vegetarian")
+        recipe.tags.add(tag1, tag2)
+
+        params = {"tags": f"{tag1.id},{tag2.id}"}
+        res = self.client.get(RECIPES_URL, params)
+
+        self.assertEqual(len(res.data["results"]), 1)
+
+    def test_filter_match_all(self):
+        """Test match=all only returns recipes having all requested items."""
+        tag1 = Tag.objects.create(user=self.user, name="Vegan")
+        tag2 = Tag.objects.create(user=self.user, name="Quick")
+        ingredient = Ingredient.objects.create(user=self.user, name="Tofu")
+        r1 = create_recipe(user=self.user, title="Tofu stir fry")
+        r1.tags.add(tag1, tag2)
+        r1.ingredients.add(ingredient)
+        r2 = create_recipe(user=self.user, title="Tofu stew")
+        r2.tags.add(tag1)
+        r2.ingredients.add(ingredient)
+
+        params = {
+            "tags": f"{tag1.id},{tag2.id}",
+            "ingredients": f"{ingredient.id}",
+            "match": "all",
+        }
+        res = self.client.get(RECIPES_URL, params)
+
+        self.assertEqual([r["id"] for r in res.data["results"]], [r1.id])
+
+    def test_search_recipes(self):
+        """Test searching recipes by title, description and tag names."""
+        r1 = create_recipe(user=self.user, title="Thai green curry")
+        r2 = create_recipe(user=self.user, title="Pad thai", description="Noodles")
+        r2.tags.add(Tag.objects.create(user=self.user, name="Curry night"))
+        create_recipe(user=self.user, title="Fish and chips")
+        create_recipe(user=create_user(email="other@example.com"), title="Curry")
+
+        res = self.client.get(RECIPES_URL, {"search": "curry"})
+        self.assertEqual({r["id"] for r in res.data["results"]}, {r1.id, r2.id})
+
+        res = self.client.get(RECIPES_URL, {"search": "thai noodles"})
+        self.assertEqual([r["id"] for r in res.data["results"]], [r2.id])
+
+    def test_search_recipes_paginated_with_tied_ranks(self):
+        """Test paging through search results with equal ranks returns each
+        recipe once."""
+        recipes = [create_recipe(user=self.user, title="Curry") for _ in range(3)]
+        recipes += [
+            create_recipe(user=self.user, title="Curry", description="Curry")
+            for _ in range(3)
+        ]
+
+        ids = []
+        res = self.client.get(RECIPES_URL, {"search": "curry", "page_size": 2})
+        while True:
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            ids += [r["id"] for r in res.data["results"]]
+            if not res.data["next"]:
+                break
+            res = self.client.get(res.data["next"])
+
+        self.assertEqual(sorted(ids), sorted(recipe.id for recipe in recipes))
+
+    def test_list_query_count_independent_of_size(self):
+        """Test listing recipes does not issue queries per recipe."""
+        tag = Tag.objects.create(user=self.user, name="Vegan")
+        ingredient = Ingredient.objects.create(user=self.user, name="Tofu")
+        for i in range(5):
+            recipe = create_recipe(user=self.user, title=f"Recipe {i}")
+            recipe.tags.add(tag)
+            recipe.ingredients.add(ingredient)
+
+        # One query for recipes, one for tags and one for ingredients
+        with self.assertNumQueries(3):
+            res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data["results"]), 5)
+        self.assertEqual(
+            res.data["results"][0]["tags"], [{"id": tag.id, "name": "Vegan"}]
+        )
+
+    def test_list_paginated_by_cursor(self):
+        """Test recipes are paginated with an opaque next cursor."""
+        recipes = [create_recipe(user=self.user, title=f"R{i}") for i in range(5)]
+
+        res = self.client.get(RECIPES_URL, {"page_size": 2})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotIn("count", res.data)
+        ids = [r["id"] for r in res.data["results"]]
+        while res.data["next"]:
+            res = self.client.get(res.data["next"])
+            ids += [r["id"] for r in res.data["results"]]
+
+        self.assertEqual(ids, sorted((r.id for r in recipes), reverse=True))
+
+    def test_list_sparse_fields(self):
+        """Test ?fields= only loads and returns the given fields."""
+        recipe = create_recipe(user=self.user, description="A long description")
+        recipe.tags.add(Tag.objects.create(user=self.user, name="Vegan"))
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(RECIPES_URL, {"fields": "id,title"})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            res.data["results"], [{"id": recipe.id, "title": recipe.title}]
+        )
+        # A single query on the recipe table, without the other columns
+        self.assertEqual(len(queries), 1)
+        sql = queries[0]["sql"]
+        self.assertNotIn("description", sql)
+        self.assertNotIn("price", sql)
+        self.assertNotIn("core_tag", sql)
+
+    def test_list_does_not_load_description(self):
+        """Test listing recipes does not load the unrendered description."""
+        create_recipe(user=self.user)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(RECIPES_URL)
+
+        self.assertNotIn("description", queries[0]["sql"])
+
+    def test_retrieve_omit_fields(self):
+        """Test ?omit= drops the given fields of the recipe detail."""
+        recipe = create_recipe(user=self.user)
+        recipe.tags.add(Tag.objects.create(user=self.user, name="Vegan"))
+
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(
+                detail_url(recipe.id), {"omit": "description,tags,ingredients"}
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        expected = RecipeDetailSerializer(recipe).data
+        for name in ("description", "tags", "ingredients"):
+            expected.pop(name)
+        self.assertEqual(res.data, expected)
+        self.assertIn("ETag", res)
+        self.assertFalse(any("core_tag" in query["sql"] for query in queries))
+
+    def test_sparse_fields_unknown_field_error(self):
+        """Test ?fields= with an unknown field returns an error."""
+        res = self.client.get(RECIPES_URL, {"fields": "id,user"})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("fields", res.data)
+
+
+@skipUnless(connection.vendor == "postgresql", "SQLite has no row locks")
+class ConcurrentUpdateTests(TransactionTestCase):
+    """Test conditional updates sent by concurrent clients"""
+
+    def setUp(self):
+        self.user = create_user(email="user@example.com", password="testpass123")
+        self.recipe = create_recipe(user=self.user)
+        self.url = detail_url(self.recipe.id)
+
+    def patch(self, title, etag):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        return client.patch(self.url, {"title": title}, HTTP_IF_MATCH=etag)
+
+    def test_concurrent_updates_with_same_etag(self):
+        """Test only one of two updates with the same If-Match is applied when
+        the second one is checked while the first one is being written"""
+        client = APIClient()
+        client.force_authenticate(self.user)
+        etag = client.get(self.url)["ETag"]
+        first_checked = threading.Event()
+        second_sent = threading.Event()
+        check = ConditionalRecipeMixin._check_preconditions
+
+        def check_preconditions(view, request, **kwargs):
+            response = check(view, request, **kwargs)
+            if threading.current_thread().name == "first":
+                first_checked.set()
+                second_sent.wait(5)
+                time.sleep(0.2)  # the second update reaches its check
+            return response
+
+        responses = {}
+
+        def first():
+            try:
+                responses["first"] = self.patch("First", etag)
+            finally:
+                connection.close()  # of this thread
+
+        with mock.patch.object(
+            ConditionalRecipeMixin, "_check_preconditions", check_preconditions
+        ):
+            thread = threading.Thread(target=first, name="first")
+            thread.start()
+            self.assertTrue(first_checked.wait(5))
+            second_sent.set()
+            responses["second"] = self.patch("Second", etag)
+            thread.join()
+
+        self.assertEqual(responses["first"].status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            responses["second"].status_code, status.HTTP_412_PRECONDITION_FAILED
+        )
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.title, "First")
 
 
 class ImageUploadTests(TestCase):
@@ -410,7 +727,10 @@ class ImageUploadTests(TestCase):
 
     def tearDown(self) -> None:
         """Cleanup after tests"""
+        self.recipe.refresh_from_db()
         self.recipe.image.delete()
+        self.recipe.image_thumbnail.delete()
+        self.recipe.image_medium.delete()
 
     def test_upload_image(self):
         """Test uplaoding an image to a recipe."""
@@ -428,6 +748,137 @@ class ImageUploadTests(TestCase):
         self.assertIn("image", res.data)
         self.assertTrue(os.path.exists(self.recipe.image.path))
 
+    def test_upload_image_schedules_derivatives(self):
+        """Test the upload returns before the derivatives are generated."""
+        url = image_upload_url(self.recipe.id)
+        with tempfile.NamedTemporaryFile(suffix=".jpg") as image_file:
+            Image.new("RGB", (10, 10)).save(image_file, format="JPEG")
+            image_file.seek(0)
+            with self.captureOnCommitCallbacks() as callbacks:
+                res = self.client.post(url, {"image": image_file}, format="multipart")
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIsNone(res.data["image_thumbnail"])
+        self.assertTrue(callbacks)
+
+    def upload_with_derivatives(self):
+        """Upload an image, run the commit callbacks and return the response
+        and the thread and renditions of the save of its derivatives."""
+        saved = threading.Event()
+        calls = []
+
+        def save_derivatives(recipe_id, user_id, original_name, renditions):
+            calls.append((threading.current_thread().name, renditions))
+            saved.set()
+
+        url = image_upload_url(self.recipe.id)
+        with tempfile.NamedTemporaryFile(suffix=".png") as image_file:
+            Image.new("RGB", (200, 100)).save(image_file, format="PNG")
+            image_file.seek(0)
+            with mock.patch.object(images, "save_derivatives", save_derivatives):
+                with self.captureOnCommitCallbacks(execute=True):
+                    res = self.client.post(
+                        url, {"image": image_file}, format="multipart"
+                    )
+                self.assertTrue(saved.wait(timeout=30))
+        return res, calls[0]
+
+    @override_settings(RECIPE_IMAGE_DERIVATIVES={"SIZES": {"thumbnail": (50, 50)}})
+    def test_upload_image_derivatives_in_process_pool(self):
+        """Test the derivatives are rendered by the process pool and saved in
+        a worker thread."""
+        res, (thread_name, renditions) = self.upload_with_derivatives()
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertTrue(thread_name.startswith("recipe-image-save"))
+        self.assertEqual(list(renditions), ["thumbnail"])
+
+    @override_settings(RECIPE_IMAGE_DERIVATIVES={"SIZES": {"thumbnail": (50, 50)}})
+    def test_upload_image_broken_process_pool(self):
+        """Test a new process pool replaces a broken one."""
+        broken = ProcessPoolExecutor(max_workers=1)
+        with self.assertRaises(BrokenProcessPool):
+            broken.submit(os._exit, 1).result()  # kill the worker
+
+        with mock.patch.object(images, "_executor", broken):
+            res, (_, renditions) = self.upload_with_derivatives()
+            self.assertIsNot(images._executor, broken)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(renditions), ["thumbnail"])
+
+    @override_settings(
+        RECIPE_IMAGE_DERIVATIVES={"ASYNC": False, "SIZES": {"thumbnail": (50, 50)}}
+    )
+    def test_upload_image_generates_derivatives(self):
+        """Test resized copies of the uploaded image are stored."""
+        url = image_upload_url(self.recipe.id)
+        with tempfile.NamedTemporaryFile(suffix=".png") as image_file:
+            Image.new("RGB", (200, 100)).save(image_file, format="PNG")
+            image_file.seek(0)
+            self.client.post(url, {"image": image_file}, format="multipart")
+
+        self.recipe.refresh_from_db()
+        self.assertTrue(self.recipe.image_thumbnail.name.endswith("_thumbnail.jpg"))
+        with Image.open(self.recipe.image_thumbnail.path) as thumbnail:
+            self.assertEqual(thumbnail.size, (50, 25))
+        res = self.client.get(detail_url(self.recipe.id))
+        self.assertIn(self.recipe.image_thumbnail.url, res.data["image_thumbnail"])
+
+    @override_settings(
+        RECIPE_IMAGE_DERIVATIVES={"ASYNC": False, "SIZES": {"thumbnail": (50, 50)}}
+    )
+    def test_upload_image_deletes_previous_derivatives(self):
+        """Test the derivatives of a replaced image are deleted on commit."""
+        url = image_upload_url(self.recipe.id)
+        previous = []
+        for _ in range(2):
+            with tempfile.NamedTemporaryFile(suffix=".png") as image_file:
+                Image.new("RGB", (200, 100)).save(image_file, format="PNG")
+                image_file.seek(0)
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.client.post(url, {"image": image_file}, format="multipart")
+            self.recipe.refresh_from_db()
+            previous.append(self.recipe.image_thumbnail.path)
+
+        self.assertNotEqual(previous[0], previous[1])
+        self.assertFalse(os.path.exists(previous[0]))
+        self.assertTrue(os.path.exists(previous[1]))
+
+    @override_settings(
+        RECIPE_IMAGE_NORMALIZATION={"MAX_DIMENSION": 100, "FORMAT": "JPEG"}
+    )
+    def test_upload_image_normalized(self):
+        """Test uploaded images are downscaled, rotated and stripped of EXIF."""
+        url = image_upload_url(self.recipe.id)
+        exif = Image.Exif()
+        exif[0x0112] = 6  # orientation: rotated 90 degrees
+        with tempfile.NamedTemporaryFile(suffix=".png") as image_file:
+            Image.new("RGB", (400, 200)).save(image_file, format="PNG", exif=exif)
+            image_file.seek(0)
+            res = self.client.post(url, {"image": image_file}, format="multipart")
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.recipe.refresh_from_db()
+        self.assertTrue(self.recipe.image.name.endswith(".jpg"))
+        with Image.open(self.recipe.image.path) as image:
+            self.assertEqual(image.format, "JPEG")
+            self.assertEqual(image.size, (50, 100))
+            self.assertEqual(len(image.getexif()), 0)
+
+    @override_settings(RECIPE_IMAGE_NORMALIZATION={"MAX_PIXELS": 100})
+    def test_upload_image_too_many_pixels(self):
+        """Test images above the pixel limit are rejected."""
+        url = image_upload_url(self.recipe.id)
+        with tempfile.NamedTemporaryFile(suffix=".jpg") as image_file:
+            Image.new("RGB", (20, 20)).save(image_file, format="JPEG")
+            image_file.seek(0)
+            res = self.client.post(url, {"image": image_file}, format="multipart")
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.recipe.refresh_from_db()
+        self.assertFalse(self.recipe.image)
+
     def test_upload_image_bad_request(self):
         """Test uploading invalid image"""
         url = image_upload_url(self.recipe.id)
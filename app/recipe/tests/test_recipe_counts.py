@@ -0,0 +1,137 @@
+"""
+Tests for the recipe counts of tags and ingredients
+"""
+
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag, Ingredient
+
+RECIPES_URL = reverse("recipe:recipe-list")
+BULK_URL = reverse("recipe:recipe-bulk")
+
+
+def create_recipe(user, **params):
+    """Create and return a sample recipe."""
+    defaults = {"title": "Sample recipe", "time_minutes": 10, "price": Decimal("5.25")}
+    defaults.update(params)
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class RecipeCountTests(TestCase):
+    """Test the recipe counts follow the (un)assigned tags/ingredients."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            email="user@example.com", password="testpass123"
+        )
+        self.client.force_authenticate(self.user)
+
+    def assertCounts(self, model, expected):
+        """Assert the recipe counts of the user's tags/ingredients by name."""
+        counts = dict(
+            model.objects.filter(user=self.user).values_list("name", "recipe_count")
+        )
+        self.assertEqual(counts, expected)
+
+    def test_add_remove_clear(self):
+        """Test the counts follow add, remove and clear on both sides."""
+        vegan = Tag.objects.create(user=self.user, name="Vegan")
+        quick = Tag.objects.create(user=self.user, name="Quick")
+        recipe1 = create_recipe(self.user)
+        recipe2 = create_recipe(self.user)
+
+        recipe1.tags.add(vegan, quick)
+        recipe1.tags.add(vegan)  # already linked
+        vegan.recipe_set.add(recipe2)
+        self.assertCounts(Tag, {"Vegan": 2, "Quick": 1})
+
+        recipe2.tags.remove(quick)  # not linked
+        recipe1.tags.remove(quick)
+        self.assertCounts(Tag, {"Vegan": 2, "Quick": 0})
+
+        vegan.recipe_set.remove(recipe1)
+        self.assertCounts(Tag, {"Vegan": 1, "Quick": 0})
+
+        recipe1.tags.add(vegan, quick)
+        recipe1.tags.clear()
+        self.assertCounts(Tag, {"Vegan": 1, "Quick": 0})
+
+        vegan.recipe_set.clear()
+        self.assertCounts(Tag, {"Vegan": 0, "Quick": 0})
+
+    def test_drifted_counts_not_negative(self):
+        """Test removing links of counts that drifted to 0 keeps them at 0."""
+        vegan = Tag.objects.create(user=self.user, name="Vegan")
+        quick = Tag.objects.create(user=self.user, name="Quick")
+        recipe1 = create_recipe(self.user)
+        recipe2 = create_recipe(self.user)
+        recipe3 = create_recipe(self.user)
+        for recipe in (recipe1, recipe2, recipe3):
+            recipe.tags.add(vegan, quick)
+        Tag.objects.update(recipe_count=0)  # drifted, e.g., by a raw update
+
+        recipe1.tags.remove(vegan)
+        recipe1.tags.clear()
+        quick.recipe_set.remove(recipe2)
+        recipe3.delete()
+
+        self.assertCounts(Tag, {"Vegan": 0, "Quick": 0})
+
+    def test_delete_recipe(self):
+        """Test deleting a recipe decrements the counts of its attributes."""
+        salt = Ingredient.objects.create(user=self.user, name="Salt")
+        recipe1 = create_recipe(self.user)
+        recipe2 = create_recipe(self.user)
+        recipe1.ingredients.add(salt)
+        recipe2.ingredients.add(salt)
+
+        recipe1.delete()
+
+        self.assertCounts(Ingredient, {"Salt": 1})
+
+    def test_create_update_recipe(self):
+        """Test the counts through the recipe create/update API."""
+        payload = {
+            "title": "Curry",
+            "time_minutes": 30,
+            "price": "7.00",
+            "tags": [{"name": "Thai"}, {"name": "Dinner"}],
+        }
+        res = self.client.post(RECIPES_URL, payload, format="json")
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertCounts(Tag, {"Thai": 1, "Dinner": 1})
+
+        url = reverse("recipe:recipe-detail", args=[res.data["id"]])
+        payload = {"tags": [{"name": "Dinner"}, {"name": "Spicy"}]}
+        self.client.patch(url, payload, format="json")
+        self.assertCounts(Tag, {"Thai": 0, "Dinner": 1, "Spicy": 1})
+
+    def test_bulk_create_update(self):
+        """Test the counts through the bulk API."""
+        payload = [
+            {
+                "title": f"Recipe {i}",
+                "time_minutes": 10,
+                "price": "4.50",
+                "tags": [{"name": "Dinner"}],
+            }
+            for i in range(3)
+        ]
+        self.client.post(BULK_URL, payload, format="json")
+        self.assertCounts(Tag, {"Dinner": 3})
+
+        ids = Recipe.objects.filter(user=self.user).values_list("id", flat=True)
+        payload = [{"id": pk, "tags": [{"name": "Lunch"}]} for pk in ids[:2]]
+        self.client.patch(BULK_URL, payload, format="json")
+        self.assertCounts(Tag, {"Dinner": 1, "Lunch": 2})
+
+        self.client.delete(BULK_URL, {"ids": list(ids)}, format="json")
+        self.assertCounts(Tag, {"Dinner": 0, "Lunch": 0})
@@ -11,7 +11,7 @@ from rest_framework import status
 from rest_framework.test import APIClient
 from core.models import Tag, Recipe
 
-from recipe.serializers import TagSerializer
+from recipe.serializers import TagDetailSerializer
 
 TAGS_URL = reverse("recipe:tag-list")
 
@@ -54,7 +54,7 @@ class PrivatetagsApiTests(TestCase):
         res = self.client.get(TAGS_URL)
 
         tags = Tag.objects.all().order_by("-name")
-        serializer = TagSerializer(tags, many=True)
+        serializer = TagDetailSerializer(tags, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertEqual(res.data, serializer.data)
 
@@ -79,6 +79,16 @@ class PrivatetagsApiTests(TestCase):
         tag.refresh_from_db()
         self.assertEqual(tag.name, payload["name"])
 
+    def test_update_tag_duplicate_name_error(self):
+        """Test renaming a tag to an existing name gives an error"""
+        Tag.objects.create(user=self.user, name="Lunch")
+        tag = Tag.objects.create(user=self.user, name="Dinner")
+        url = detail_url(tag.id)
+        res = self.client.patch(url, {"name": "Lunch"})
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        tag.refresh_from_db()
+        self.assertEqual(tag.name, "Dinner")
+
     def test_delete_tag(self):
         """Test deleting a tag"""
         tag = Tag.objects.create(user=self.user, name="Breakfast")
@@ -100,15 +110,16 @@ class PrivatetagsApiTests(TestCase):
         )
         recipe.tags.add(tag1)
 
+        tag1.refresh_from_db()  # reload the recipe count
         res = self.client.get(TAGS_URL, {"assigned_only": 1})
 
-        serializer1 = TagSerializer(tag1)
-        serializer2 = TagSerializer(tag2)
+        serializer1 = TagDetailSerializer(tag1)
+        serializer2 = TagDetailSerializer(tag2)
         self.assertIn(serializer1.data, res.data)
         self.assertNotIn(serializer2.data, res.data)
 
-        s1 = TagSerializer(tag1)
-        s2 = TagSerializer(tag2)
+        s1 = TagDetailSerializer(tag1)
+        s2 = TagDetailSerializer(tag2)
         self.assertIn(s1.data, res.data)
         self.assertNotIn(s2.data, res.data)
 
@@ -124,7 +135,49 @@ class PrivatetagsApiTests(TestCase):
         )
         recipe1.tags.add(tag)
         recipe2.tags.add(tag)
-        s1 = TagSerializer(tag)
+        s1 = TagDetailSerializer(tag)
+        tag.refresh_from_db()  # reload the recipe count
         res = self.client.get(TAGS_URL, {"assigned_only": 1})
         self.assertIn(s1.data, res.data)
         self.assertEqual(len(res.data), 1)
+
+    def test_autocomplete_tags(self):
+        """Test q returns the tags starting with it first, then similar ones."""
+        Tag.objects.create(user=self.user, name="Vegetarian")
+        Tag.objects.create(user=self.user, name="Vegan")
+        Tag.objects.create(user=self.user, name="Dessert")
+        Tag.objects.create(user=create_user("other@example.com"), name="Vegan")
+
+        res = self.client.get(TAGS_URL, {"q": "veg"})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([t["name"] for t in res.data], ["Vegan", "Vegetarian"])
+
+    def test_autocomplete_tags_typo(self):
+        """Test q matches the tags despite a typo."""
+        Tag.objects.create(user=self.user, name="Breakfast")
+        Tag.objects.create(user=self.user, name="Dinner")
+
+        res = self.client.get(TAGS_URL, {"q": "brekfast"})
+
+        self.assertEqual([t["name"] for t in res.data], ["Breakfast"])
+
+    def test_autocomplete_tags_limit(self):
+        """Test the number of autocomplete results is limited."""
+        Tag.objects.bulk_create(
+            [Tag(user=self.user, name=f"Tag {i:02}") for i in range(30)]
+        )
+
+        res = self.client.get(TAGS_URL, {"q": "tag"})
+        self.assertEqual(len(res.data), 10)
+        self.assertEqual(res.data[0]["name"], "Tag 00")
+
+        res = self.client.get(TAGS_URL, {"q": "tag", "limit": 3})
+        self.assertEqual(len(res.data), 3)
+
+    def test_autocomplete_tags_invalid_limit(self):
+        """Test a limit that is not an integer returns an error."""
+        res = self.client.get(TAGS_URL, {"q": "tag", "limit": "abc"})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("limit", res.data)
@@ -2,10 +2,12 @@
 URL mappings for the redcipe app.
 """
 
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
 from recipe import views
+from recipe.async_views import async_read_urls
 
 
 router = DefaultRouter()
@@ -17,4 +19,7 @@ router.register("ingredients", views.IngredientViewSet)
 app_name = "recipe"  # used for reverse urls
 
 # include(router.urls) automatcially generates urls from the router
-urlpatterns = [path("", include(router.urls))]
+urls = router.urls
+if getattr(settings, "ASYNC_READ_VIEWS", False):
+    urls = async_read_urls(urls)  # served by app.asgi
+urlpatterns = [path("", include(urls))]
@@ -8,14 +8,47 @@ from drf_spectacular.utils import (
     OpenApiParameter,
     OpenApiTypes,
 )
+from django.db import IntegrityError, router, transaction
+from django.db.models import Count, Exists, OuterRef, Prefetch
 from rest_framework import viewsets, mixins, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.serializers import ListSerializer
 
+from core.authentication import CachedTokenAuthentication
+from core.instrumentation import SerializeTimingMixin
+from core.replicas import ReplicaReadMixin
 from core.models import Recipe, Tag, Ingredient
 from recipe import serializers
+from recipe.autocomplete import AUTOCOMPLETE_LIMIT, AUTOCOMPLETE_MAX_LIMIT, autocomplete
+from recipe.cache import CachedListMixin, bump_data_version
+from recipe.conditional import ConditionalRecipeMixin
+from recipe.counts import add_recipe_counts, count_links
+from recipe.images import delete_on_commit, derivative_names, schedule_derivatives
+from recipe.search import search_recipes
+from recipe.signals import batched_recipe_deletes
+from recipe.pagination import RecipeCursorPagination
+from recipe.readers import ValuesListMixin
+
+BOOLEAN_PARAMS = {
+    **dict.fromkeys(("1", "true", "yes"), True),
+    **dict.fromkeys(("0", "false", "no"), False),
+}
+
+SPARSE_FIELDS_PARAMETERS = [
+    OpenApiParameter(
+        "fields",
+        OpenApiTypes.STR,
+        description="Comma separated list of the fields to return, e.g., id,title",
+    ),
+    OpenApiParameter(
+        "omit",
+        OpenApiTypes.STR,
+        description="Comma separated list of the fields not to return",
+    ),
+]
 
 
 @extend_schema_view(
@@ -31,20 +64,43 @@ from recipe import serializers
                 OpenApiTypes.STR,
                 description="Comma separated list of IDs to filter",
             ),
+            OpenApiParameter(
+                "search",
+                OpenApiTypes.STR,
+                description="Search the title, description, tags and ingredients",
+            ),
+            OpenApiParameter(
+                "match",
+                OpenApiTypes.STR,
+                enum=["any", "all"],
+                description="Match recipes with any (default) or all of the IDs",
+            ),
+            *SPARSE_FIELDS_PARAMETERS,
         ]
-    )
+    ),
+    retrieve=extend_schema(parameters=SPARSE_FIELDS_PARAMETERS),
 )  # extend the autogenerated schema
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(
+    ReplicaReadMixin,
+    CachedListMixin,
+    ValuesListMixin,
+    ConditionalRecipeMixin,
+    SerializeTimingMixin,
+    viewsets.ModelViewSet,
+):
     # ModelViewSet is specifically for Django models
     """View for manage recipe APIs (generates multiple endpoints)"""
     serializer_class = serializers.RecipeDetailSerializer
-    queryset = (
-        Recipe.objects.all()
+    queryset = Recipe.objects.defer(
+        "search_vector"
     )  # The objects that are available for this viewset, here we get all recipes in the DB
 
     # Handling the authentication stuff
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
+    # The list endpoint is returned page by page, see ?cursor= and ?page_size=
+    pagination_class = RecipeCursorPagination
+    bulk_max_items = 1000  # per bulk request
 
     def _params_to_ints(self, qs):
         """Convert a list of strings to integers.
@@ -52,28 +108,116 @@ class RecipeViewSet(viewsets.ModelViewSet):
         """
         return [int(str_id) for str_id in qs.split(",")]
 
+    def _filter_by_attrs(self, queryset, attr, ids, match_all):
+        """Filter recipes by the IDs of a related attribute (tag/ingredient).
+        Uses a semi-join on the M2M table so the recipes are never duplicated.
+        """
+        through = getattr(Recipe, f"{attr}s").through  # e.g., recipe_tags table
+        links = through.objects.filter(**{f"{attr}_id__in": ids})
+        if match_all:
+            # recipe_id IN (SELECT recipe_id ... GROUP BY recipe_id HAVING COUNT = n)
+            matching = (
+                links.values("recipe_id")
+                .annotate(matched=Count("pk"))
+                .filter(matched=len(set(ids)))
+                .values("recipe_id")
+            )
+            return queryset.filter(pk__in=matching)
+        # WHERE EXISTS (SELECT 1 ... WHERE recipe_id = recipe.id AND tag_id IN ...)
+        return queryset.filter(Exists(links.filter(recipe_id=OuterRef("pk"))))
+
+    def _get_sparse_fields(self):
+        """Return the ?fields= and ?omit= of the read actions as serializer
+        arguments.
+        e.g., ?fields=id,title -> {"fields": {"id", "title"}}
+        """
+        if self.action not in ("list", "retrieve"):
+            return {}
+        sparse_fields = {}
+        for param in ("fields", "omit"):
+            value = self.request.query_params.get(param)  # type: ignore
+            if value is not None:
+                sparse_fields[param] = {
+                    name.strip() for name in value.split(",") if name.strip()
+                }
+        if sparse_fields:
+            known = self.get_serializer_class()().fields
+            for param, names in sparse_fields.items():
+                unknown = ", ".join(sorted(names.difference(known)))
+                if unknown:
+                    raise ValidationError({param: [f"Unknown fields: {unknown}."]})
+        return sparse_fields
+
+    def get_serializer(self, *args, **kwargs):
+        """Return the serializer, pruned to the requested fields."""
+        kwargs.update(self._get_sparse_fields())
+        return super().get_serializer(*args, **kwargs)
+
+    def _get_columns(self, serializer):
+        """Return the recipe columns rendered by the serializer.
+        e.g., ?fields=id,title -> ["id", "title"]
+        """
+        columns = {"id"}
+        if self.action == "retrieve":
+            columns.add("updated_at")  # for the ETag/Last-Modified validators
+        for field in serializer.fields.values():
+            if not isinstance(field, ListSerializer):
+                columns.add(field.source)
+        return sorted(columns)
+
+    def _get_prefetches(self, serializer):
+        """Build prefetches for the nested fields of the serializer in use.
+        e.g., tags = TagSerializer(many=True) -> Prefetch("tags", Tag(id, name))
+        """
+        prefetches = []
+        for field in serializer.fields.values():
+            # Nested serializers with many=True are wrapped in a ListSerializer
+            if not isinstance(field, ListSerializer):
+                continue
+            child_meta = field.child.Meta
+            # Only load the columns the nested serializer renders
+            queryset = child_meta.model.objects.only(*child_meta.fields)
+            prefetches.append(Prefetch(field.source, queryset=queryset))
+        return prefetches
+
     def get_queryset(self):
         """Retrieve recipes for authenticated user"""
         # Get query parameters for tags and ingredients
         # They are string of comma-separated integers
         tags = self.request.query_params.get("tags")  # type: ignore
         ingredients = self.request.query_params.get("ingredients")  # type: ignore
+        # match=all only returns recipes that have every requested tag/ingredient
+        match_all = self.request.query_params.get("match") == "all"  # type: ignore
         queryset = self.queryset
         if tags:
             tag_ids = self._params_to_ints(tags)
-            queryset = queryset.filter(tags__id__in=tag_ids)
+            queryset = self._filter_by_attrs(queryset, "tag", tag_ids, match_all)
 
         if ingredients:
             ingredient_ids = self._params_to_ints(ingredients)
-            queryset = queryset.filter(ingredients__id__in=ingredient_ids)
+            queryset = self._filter_by_attrs(
+                queryset, "ingredient", ingredient_ids, match_all
+            )
+
+        queryset = queryset.filter(user=self.request.user).order_by("-id")
+        search = self.request.query_params.get("search")  # type: ignore
+        if search:
+            queryset, ranked = search_recipes(queryset, search)
+            if ranked:
+                # Best matches first, the pagination cursor follows the rank
+                self.cursor_ordering = ("-rank", "-id")
+                queryset = queryset.order_by(*self.cursor_ordering)
 
-        return (
-            queryset.filter(user=self.request.user).order_by("-id").distinct()
-        )  # get unique items
+        serializer = self.get_serializer()
+        if self.action in ("list", "retrieve"):
+            # Only load the columns that are rendered, e.g., not the description
+            queryset = queryset.only(*self._get_columns(serializer))
+        # tags and ingredients are loaded in one query each, not once per recipe
+        return queryset.prefetch_related(*self._get_prefetches(serializer))
 
     def get_serializer_class(self):
         """Return the serializer class for request."""
-        if self.action == "list":
+        if self.action in ("list", "bulk"):
             return serializers.RecipeSerializer
         elif self.action == "upload_image":  # custom action
             return serializers.RecipeImageSerializer
@@ -83,13 +227,115 @@ class RecipeViewSet(viewsets.ModelViewSet):
         """Create a new recipe"""
         serializer.save(user=self.request.user)
 
+    def _get_atomic(self):
+        """Return the ?atomic= flag of the bulk writes, e.g., ?atomic=true"""
+        value = self.request.query_params.get("atomic", "0").lower()
+        if value not in BOOLEAN_PARAMS:
+            raise ValidationError(
+                {"atomic": ["Expected 1, true, yes, 0, false or no."]}
+            )
+        return BOOLEAN_PARAMS[value]
+
+    def _bulk_response(self, recipes, errors, success_status):
+        """Return the written recipes and the errors, aligned with the payload."""
+        written = iter(self.get_serializer(recipes, many=True).data)
+        results = [None if error else next(written) for error in errors]
+        return Response(
+            {"results": results, "errors": errors}, status=success_status
+        )
+
+    @action(methods=["POST", "PATCH", "DELETE"], detail=False, url_path="bulk")
+    def bulk(self, request):
+        """Create (POST), partially update (PATCH) or delete (DELETE) recipes
+        in bulk. Invalid items are reported in "errors" and the other items are
+        written, unless ?atomic=1 is given.
+        """
+        atomic = self._get_atomic()
+        if request.method == "DELETE":
+            return self._bulk_delete(request, atomic)
+
+        items = request.data
+        if not isinstance(items, list) or len(items) > self.bulk_max_items:
+            return Response(
+                {"detail": f"Expected a list of at most {self.bulk_max_items} items."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        if request.method == "PATCH":
+            # e.g., [{"id": 1, "title": "New title"}, {"id": 2, "tags": []}]
+            ids = [item.get("id") if isinstance(item, dict) else None for item in items]
+            instances = self.get_queryset().prefetch_related(None).in_bulk(
+                [pk for pk in ids if isinstance(pk, int)]
+            )
+            serializer = self.get_serializer(data=items, many=True, partial=True)
+        else:
+            serializer = self.get_serializer(data=items, many=True)
+        validated, errors = serializer.validate_items(items)
+        if request.method == "PATCH":
+            for index, pk in enumerate(ids):
+                if not errors[index] and pk not in instances:
+                    validated[index] = None
+                    errors[index] = {"id": ["Not found."]}
+
+        if atomic and any(errors):
+            return Response({"errors": errors}, status=status.HTTP_400_BAD_REQUEST)
+        valid = [data for data in validated if data is not None]
+
+        if request.method == "PATCH":
+            recipes = serializer.bulk_update(
+                [instances[pk] for pk, data in zip(ids, validated) if data is not None],
+                valid,
+                request.user,
+            )
+            return self._bulk_response(recipes, errors, status.HTTP_200_OK)
+
+        recipes = serializer.bulk_create(valid, request.user)
+        return self._bulk_response(recipes, errors, status.HTTP_201_CREATED)
+
+    def _bulk_delete(self, request, atomic):
+        """Delete the recipes with the given ids, e.g., {"ids": [1, 2]}"""
+        ids = request.data.get("ids") if isinstance(request.data, dict) else None
+        if not isinstance(ids, list) or not all(isinstance(pk, int) for pk in ids):
+            return Response(
+                {"ids": ["Expected a list of recipe ids."]},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        using = router.db_for_write(Recipe)
+        with transaction.atomic(using=using):
+            # Locked, so that the recipes counted below are the deleted ones
+            queryset = (
+                self.get_queryset()
+                .prefetch_related(None)
+                .filter(id__in=ids)
+                .select_for_update(of=("self",))
+            )
+            found = set(queryset.values_list("id", flat=True))
+            missing = [pk for pk in ids if pk not in found]
+            if atomic and missing:
+                return Response({"missing": missing}, status=status.HTTP_404_NOT_FOUND)
+
+            for model, attr in ((Tag, "tag"), (Ingredient, "ingredient")):
+                through = getattr(Recipe, f"{attr}s").through
+                removed = count_links(through, attr, recipe__in=found)
+                add_recipe_counts(model, {pk: -total for pk, total in removed.items()})
+            # The count and cache work of the delete signals is batched here
+            with batched_recipe_deletes():
+                Recipe.objects.filter(pk__in=found).delete()
+            bump_data_version(request.user.pk)
+        return Response({"deleted": sorted(found), "missing": missing})
+
     @action(methods=["POST"], detail=True, url_path="upload-image")
     def upload_image(self, request, pk=None):
         """Upload an image to a recipe"""
         recipe = self.get_object()
         serializer = self.get_serializer(recipe, data=request.data)
         if serializer.is_valid():
-            serializer.save()
+            # The derivatives of the previous image are replaced in the background
+            previous = derivative_names(recipe)
+            recipe = serializer.save(image_thumbnail=None, image_medium=None)
+            delete_on_commit(previous)
+            schedule_derivatives(recipe)
             return Response(serializer.data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -102,11 +348,25 @@ class RecipeViewSet(viewsets.ModelViewSet):
                 OpenApiTypes.INT,
                 enum=[0, 1],  # only allows 0 and 1
                 description="Filter by items assigned to recipes",
-            )
+            ),
+            OpenApiParameter(
+                "q",
+                OpenApiTypes.STR,
+                description="Autocomplete: names starting with or similar to q",
+            ),
+            OpenApiParameter(
+                "limit",
+                OpenApiTypes.INT,
+                description=f"Maximum number of autocomplete results "
+                f"(default {AUTOCOMPLETE_LIMIT}, max {AUTOCOMPLETE_MAX_LIMIT})",
+            ),
         ]
     )
 )  # extend the autogenerated schema
 class BaseRecipeAttrViewSet(
+    ReplicaReadMixin,
+    CachedListMixin,
+    SerializeTimingMixin,
     mixins.DestroyModelMixin,
     mixins.UpdateModelMixin,
     mixins.ListModelMixin,
@@ -116,7 +376,7 @@ class BaseRecipeAttrViewSet(
 
     # Here we don't need ModelViewSet because it is not necessary. We only need the listing
     # functinality, using ModelViewSet is an overkill.
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
     # ListModelMixin provides the list method
     # GenericViewSet provides the basic viewset functionality
@@ -130,20 +390,38 @@ class BaseRecipeAttrViewSet(
         assigned_only = bool(int(self.request.query_params.get("assigned_only", 0)))  # type: ignore
         queryset = self.queryset
         if assigned_only:
-            queryset = queryset.filter(recipe__isnull=False)  # type: ignore
+            # Uses the partial index on the denormalized recipe counts, no join
+            queryset = queryset.filter(recipe_count__gt=0)  # type: ignore
+
+        queryset = queryset.filter(user=self.request.user).order_by("-name")  # type: ignore
+        text = self.request.query_params.get("q", "").strip()  # type: ignore
+        if self.action == "list" and text:
+            limit = self.request.query_params.get("limit", AUTOCOMPLETE_LIMIT)  # type: ignore
+            try:
+                limit = max(1, min(int(limit), AUTOCOMPLETE_MAX_LIMIT))
+            except ValueError:
+                raise ValidationError({"limit": ["A valid integer is required."]})
+            queryset = autocomplete(queryset, text, limit)
+        return queryset
 
-        return queryset.filter(user=self.request.user).order_by("-name").distinct()  # type: ignore
+    def perform_update(self, serializer):
+        """Update the object, names must stay unique per user."""
+        try:
+            with transaction.atomic():
+                serializer.save()
+        except IntegrityError:
+            raise ValidationError({"name": ["This name already exists."]})
 
 
 class TagViewSet(BaseRecipeAttrViewSet):
     """Manage tags in the database"""
 
-    serializer_class = serializers.TagSerializer
+    serializer_class = serializers.TagDetailSerializer
     queryset = Tag.objects.all()
 
 
 class IngredientViewSet(BaseRecipeAttrViewSet):
     """Manage ingredients in the database"""
 
-    serializer_class = serializers.IngredientSerializer
+    serializer_class = serializers.IngredientDetailSerializer
     queryset = Ingredient.objects.all()
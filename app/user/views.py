@@ -2,14 +2,16 @@
 Views for the user api
 """
 
-from rest_framework import generics, authentication, permissions
+from rest_framework import generics, permissions
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.settings import api_settings
 
+from core.authentication import CachedTokenAuthentication
+from core.instrumentation import SerializeTimingMixin
 from user.serializers import UserSerializer, AuthTokenSerializer
 
 
-class CreateUserView(generics.CreateAPIView):
+class CreateUserView(SerializeTimingMixin, generics.CreateAPIView):
     """Create a new user in the system."""
 
     serializer_class = UserSerializer
@@ -24,13 +26,13 @@ class CreateTokenView(ObtainAuthToken):
     )  # Make the browsable api more readable
 
 
-class ManageUserView(generics.RetrieveUpdateAPIView):
+class ManageUserView(SerializeTimingMixin, generics.RetrieveUpdateAPIView):
     """Manage the authenticated user"""
 
     serializer_class = UserSerializer
 
     # Defines the authentication method (Token)
-    authentication_classes = [authentication.TokenAuthentication]
+    authentication_classes = [CachedTokenAuthentication]
 
     # The user must be authenticated
     permission_classes = [permissions.IsAuthenticated]